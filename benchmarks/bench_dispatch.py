@@ -0,0 +1,144 @@
+"""
+Compares dispatching a hardcoded chat command through the command registry against
+the sorted method lists and inspect.signature calls the bot used to dispatch with.
+
+python benchmarks/bench_dispatch.py
+"""
+from inspect import getsourcefile
+import inspect
+import os
+import sys
+import timeit
+
+current_path = os.path.abspath(getsourcefile(lambda: 0))
+current_dir = os.path.dirname(current_path)
+root_dir = os.path.join(current_dir, os.pardir)
+sys.path.append(root_dir)
+
+import config
+import src.plugins as plugins
+import src.utils as utils
+from src.bot import Bot
+from src.command_registry import CommandRegistry, DynamicCommandCache
+from src.message import Message
+from src.twitch_service import MessageTypes, TwitchService
+
+
+class BenchMixin:
+    """
+    Commands that do nothing, so only the dispatching gets measured.
+    """
+    def bench_uptime(self, message):
+        pass
+
+    def bench_guess(self, message, db_session):
+        pass
+
+    @utils.mod_only
+    def bench_reset(self, db_session):
+        pass
+
+
+class NullSession(object):
+    def __init__(self):
+        self.info = {}
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+MESSAGES = [
+    Message(message_type=MessageTypes.PUBLIC, user='1', display_name='Viewer', content='!bench_uptime', is_mod=False),
+    Message(message_type=MessageTypes.PUBLIC, user='2', display_name='Viewer', content='!bench_guess 42', is_mod=False),
+    Message(message_type=MessageTypes.PUBLIC, user='3', display_name='Mod', content='!bench_reset', is_mod=True),
+]
+
+
+def build_bot():
+    """
+    A bot with every default plugin and BenchMixin, without starting any threads or databases.
+    """
+    mixin_classes = tuple(plugins.load_plugin(name) for name in config.plugins) + (BenchMixin,)
+    bench_bot_class = type('Bot', (Bot,) + mixin_classes,
+                           {'plugins': tuple(config.plugins) + ('bench',), 'mixin_classes': mixin_classes})
+    bot = bench_bot_class.__new__(bench_bot_class)
+    bot.service = TwitchService
+    bot.Session = NullSession
+    bot.command_registry = CommandRegistry(bot)
+    bot.dynamic_commands = DynamicCommandCache()
+    bot.sorted_methods = legacy_sort_methods(bot)
+    return bot
+
+
+# The old way, kept here so there's something to measure against.
+def legacy_sort_methods(bot):
+    methods_dict = {'for_mods': [], 'for_all': [], 'private_message_allowed': [], 'public_message_disallowed': []}
+    for method in [item for item in bot.__dir__() if item[0] != '_' and callable(getattr(bot, item))]:
+        if hasattr(getattr(bot, method), '_mod_only'):
+            methods_dict['for_mods'].append(method)
+        else:
+            methods_dict['for_all'].append(method)
+        if hasattr(getattr(bot, method), '_private_message_allowed'):
+            methods_dict['private_message_allowed'].append(method)
+        if hasattr(getattr(bot, method), '_public_message_disallowed'):
+            methods_dict['public_message_disallowed'].append(method)
+    for method_list in methods_dict.values():
+        method_list.sort(key=lambda item: item.lower())
+    return methods_dict
+
+
+def legacy_dispatch(bot, message):
+    first_word = bot.service.get_message_content(message).split(' ')[0]
+    command = first_word[1:].lower()
+    if command not in bot.sorted_methods['for_all'] and command not in bot.sorted_methods['for_mods']:
+        return False
+    user_is_mod = bot.service.get_mod_status(message)
+    if not (command in bot.sorted_methods['for_all'] or (command in bot.sorted_methods['for_mods'] and user_is_mod)):
+        return False
+    if not user_is_mod:
+        if bot.service.get_message_type(message) == 'PUBLIC':
+            if command in bot.sorted_methods['public_message_disallowed']:
+                return False
+        elif command not in bot.sorted_methods['private_message_allowed']:
+            return False
+    kwargs = {}
+    if 'message' in inspect.signature(getattr(bot, command)).parameters:
+        kwargs['message'] = message
+    if 'db_session' in inspect.signature(getattr(bot, command)).parameters:
+        kwargs['db_session'] = bot.Session()
+    getattr(bot, command)(**kwargs)
+    if 'db_session' in kwargs:
+        kwargs['db_session'].commit()
+        kwargs['db_session'].close()
+    return True
+
+
+def registry_dispatch(bot, message):
+    command = bot._get_command(message)
+    user = bot.service.get_message_display_name(message)
+    user_is_mod = bot.service.get_mod_status(message)
+    if bot._has_permission(user, user_is_mod, command) and bot._is_valid_message_type(command, message):
+        bot._run_command(command, message)
+        return True
+    return False
+
+
+def main(number=20000):
+    bot = build_bot()
+    print(f'{len(bot.command_registry)} commands in the registry, '
+          f'{len(bot.sorted_methods["for_all"]) + len(bot.sorted_methods["for_mods"])} in the old method lists')
+    for message in MESSAGES:
+        if legacy_dispatch(bot, message) != registry_dispatch(bot, message):
+            print(f'Results differ for {message.content}')
+
+    for name, func in [('sorted method lists', legacy_dispatch), ('command registry', registry_dispatch)]:
+        seconds = min(timeit.repeat(lambda: [func(bot, message) for message in MESSAGES], number=number, repeat=3))
+        per_message = seconds / (number * len(MESSAGES)) * 1e6
+        print(f'{name}: {per_message:.2f} us per command')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+Compares the single pass IRC line parser against the substring scanning helpers
+TwitchService used to pull fields out of a PRIVMSG line.
+
+python benchmarks/bench_irc_parsing.py
+"""
+from inspect import getsourcefile
+import os
+import sys
+import timeit
+
+current_path = os.path.abspath(getsourcefile(lambda: 0))
+current_dir = os.path.dirname(current_path)
+root_dir = os.path.join(current_dir, os.pardir)
+sys.path.append(root_dir)
+
+from src.irc import parse_line
+
+CHANNEL = 'somestreamer'
+LINES = [
+    '@badges=subscriber/12,premium/1;color=#FF69B4;display-name=SomeViewer;emotes=;id=b34ccfc7-4977-403a-8a94-33c6bac34fb8;'
+    'mod=0;room-id=1337;subscriber=1;tmi-sent-ts=1507246572675;turbo=0;user-id=1337;user-type= '
+    ':someviewer!someviewer@someviewer.tmi.twitch.tv PRIVMSG #somestreamer :!guess 42',
+    '@badges=moderator/1;color=;display-name=;emotes=;id=c34ccfc7;mod=1;room-id=1337;subscriber=0;'
+    'tmi-sent-ts=1507246572675;turbo=0;user-id=4242;user-type=mod '
+    ':modperson!modperson@modperson.tmi.twitch.tv PRIVMSG #somestreamer :!winner',
+    '@badges=;color=;display-name=Chatter;emotes=;id=d34ccfc7;mod=0;room-id=1337;subscriber=0;'
+    'tmi-sent-ts=1507246572675;turbo=0;user-id=99;user-type= '
+    ':chatter!chatter@chatter.tmi.twitch.tv PRIVMSG #somestreamer :this is a long chat message that goes on for a while user-type=mod',
+]
+
+
+# The helpers as they were, kept here so there's something to measure against.
+def legacy_get_username_from_line(line):
+    exclam_index = None
+    at_index = None
+    for i, char in enumerate(line):
+        if char == '!':
+            exclam_index = i
+        if char == '@' and exclam_index is not None:
+            at_index = i
+            break
+    return line[exclam_index+1:at_index]
+
+
+def legacy_get_data_from_line(line, data_type):
+    if data_type in line:
+        _, *rest_of_line = line.split("{}=".format(data_type), 1)
+        for i, char in enumerate(rest_of_line[0]):
+            if char in [':', ';']:
+                return rest_of_line[0][:i].strip()
+
+
+def legacy_get_display_name_from_line(line):
+    display_name = legacy_get_data_from_line(line, 'display-name')
+    if display_name not in [None, '']:
+        return display_name
+    else:
+        username = legacy_get_username_from_line(line)
+        return f'{username[0].upper()}{username[1:]}'
+
+
+def legacy_fields(line):
+    user = legacy_get_data_from_line(line, 'user-id')
+    display_name = legacy_get_display_name_from_line(line)
+    content = line.split(f'#{CHANNEL} :')[1]
+    is_mod = ('user-type=mod' in line) or (legacy_get_display_name_from_line(line).lower() == CHANNEL)
+    return user, display_name, content, is_mod
+
+
+def parsed_fields(line):
+    parsed_line = parse_line(line)
+    user = parsed_line.get_tag('user-id')
+    display_name = parsed_line.get_tag('display-name')
+    if not display_name:
+        username = parsed_line.nick
+        display_name = f'{username[0].upper()}{username[1:]}'
+    content = parsed_line.trailing
+    is_mod = (parsed_line.get_tag('user-type') == 'mod') or (display_name.lower() == CHANNEL)
+    return user, display_name, content, is_mod
+
+
+def main(number=20000):
+    for line in LINES:
+        legacy, parsed = legacy_fields(line), parsed_fields(line)
+        if legacy != parsed:
+            print(f'Results differ:\n  legacy: {legacy}\n  parsed: {parsed}')
+
+    for name, func in [('legacy helpers', legacy_fields), ('single pass parser', parsed_fields)]:
+        seconds = min(timeit.repeat(lambda: [func(line) for line in LINES], number=number, repeat=3))
+        per_line = seconds / (number * len(LINES)) * 1e6
+        print(f'{name}: {per_line:.2f} us per line')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Measures how long it takes to import the bot, the way a fresh process does, and which
+modules that time goes on, using python's -X importtime report.
+Also checks the slow optional libraries (google, reddit, keyboard) aren't imported until they're used.
+
+python benchmarks/bench_startup.py
+python benchmarks/bench_startup.py src.runner 20
+"""
+from inspect import getsourcefile
+import os
+import statistics
+import subprocess
+import sys
+
+current_path = os.path.abspath(getsourcefile(lambda: 0))
+current_dir = os.path.dirname(current_path)
+root_dir = os.path.abspath(os.path.join(current_dir, os.pardir))
+
+# Only needed once the bot gets round to using them
+LAZY_MODULES = ['gspread', 'praw', 'apiclient', 'googleapiclient', 'oauth2client', 'httplib2', 'pyshorteners', 'pynput']
+
+CHECK_LAZY_MODULES = f'import sys; print("lazy:" + ",".join(name for name in {LAZY_MODULES!r} if name in sys.modules))'
+
+
+def import_times(module):
+    """
+    Imports module in a new process and returns {module: (depth, cumulative microseconds)}
+    for everything it imported, along with the lazy modules that got imported anyway.
+    Depth is how deeply nested the import was, the modules module imports itself are one deeper than it.
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}; {CHECK_LAZY_MODULES}'],
+                            cwd=root_dir, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            universal_newlines=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        times[name.strip()] = (depth, int(cumulative_us))
+    eagerly_imported = [name for name in result.stdout.strip().splitlines()[-1][len('lazy:'):].split(',') if name]
+    return times, eagerly_imported
+
+
+def main(module='src.bot', runs=10, top=15):
+    totals = []
+    for _ in range(runs):
+        times, eagerly_imported = import_times(module)
+        totals.append(times[module][1])
+
+    print(f'import {module}: median {statistics.median(totals) / 1000:.1f} ms, '
+          f'best {min(totals) / 1000:.1f} ms over {runs} runs')
+    print(f'What {module} imports that took longest in the last run, including everything those import:')
+    module_depth = times[module][0]
+    direct_imports = {name: cumulative for name, (depth, cumulative) in times.items() if depth == module_depth + 1}
+    for name, cumulative in sorted(direct_imports.items(), key=lambda item: item[1], reverse=True)[:top]:
+        print(f'  {cumulative / 1000:8.1f} ms  {name}')
+    if eagerly_imported:
+        print(f'Imported before they were needed: {", ".join(eagerly_imported)}')
+    else:
+        print('None of the optional libraries were imported')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) if arg.isdigit() else arg for arg in sys.argv[1:]])
@@ -10,6 +10,13 @@ data_dir = os.path.join(current_dir, 'DataAndLogs')
 
 service = Service.TWITCH  # Pick an available option from the Service enum.
 service_name = service.name
+use_asyncio = False  # Run the chat connection on an asyncio event loop instead of a blocking socket.
+irc_host = 'irc.chat.twitch.tv'  # Point these at tests/integration_tests/mock_twitch_server.py for load testing.
+irc_port = 6667
+# What to do with a message twitch would drop for repeating one sent in the last 30 seconds.
+# 'vary' adds an invisible character so it goes through, 'drop' skips it and 'delay' sends it once it's allowed.
+duplicate_policy = 'vary'
+duplicate_window = 30
 
 bot_info = {
     'pw': '',  # Oauth token from twitch - get it here: https://twitchapps.com/tmi/
@@ -18,6 +25,23 @@ bot_info = {
     'twitch_api_client_id': ''  # Twitch client id - get it here: https://www.twitch.tv/settings/connections
 }
 
+# Any other channels to serve from the same connection. Each one gets its own bot and database.
+extra_channels = []
+
+# Which plugins from src/plugins.py every channel gets. Plugins no channel uses are never imported.
+plugins = ['auto_quotes', 'chatter_select', 'commands', 'death_guessing', 'following',
+           'keyboard_listener', 'quotes', 'shout_out', 'uptime']
+# Channels that want something different, e.g. {'somechannel': ['quotes', 'commands']}
+channel_plugins = {}
+worker_count = 2  # How many processes supervisor.py spreads the channels across.
+
+# Background jobs like spreadsheet updates run on this many threads per channel.
+# A job asked for again within command_debounce seconds waits until they stop, then runs once more.
+command_workers = 4
+command_debounce = 2.0
+
+capture_path = r""  # If set, every line received from twitch is appended to this file so replay.py can replay it.
+
 death_file_path = r""  # The file path for the .txt that stores the current amount of deaths in death_guessing.
 total_death_file_path = r""  # The file path for the .txt that stores the total amount of deaths in death_guessing.
 
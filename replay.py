@@ -0,0 +1,51 @@
+"""
+Replays a capture file written by TwitchService (see capture_path in config.py)
+through real bots with a fake connection, then reports how well they kept up.
+
+python replay.py DataAndLogs/capture.txt
+python replay.py DataAndLogs/capture.txt --speed 10
+"""
+import argparse
+import os
+
+import config
+import src.plugins as plugins
+from src.bot import bot_class
+from src.loggers import event_logger, error_logger
+from src.replay import OfflineCredentials, OfflineSheetsClient, OfflineShortener, RecordingService, replay, format_report
+
+
+bot_info = config.bot_info
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replay captured twitch traffic through the bot.')
+    parser.add_argument('capture_path')
+    parser.add_argument('--speed', type=float, default=None,
+                        help='1 for the original timing, 10 for ten times faster. Leave it out to go as fast as possible.')
+    args = parser.parse_args()
+
+    # Replays get their own databases so they never touch the real ones
+    replay_data_dir = os.path.join(config.data_dir, 'replay')
+    if not os.path.exists(replay_data_dir):
+        os.makedirs(replay_data_dir)
+
+    service = RecordingService(user=bot_info['user'],
+                               channel=bot_info['channel'],
+                               error_logger=error_logger,
+                               event_logger=event_logger,
+                               extra_channels=config.extra_channels)
+    # The bots never go near google or bitly, a replay mustn't push its own database over the real spreadsheets
+    bots = {}
+    for channel in [bot_info['channel']] + config.extra_channels:
+        channel_bot_class = bot_class(plugins.enabled_plugins(channel, config.plugins, config.channel_plugins))
+        bots[channel.lower()] = channel_bot_class(bot_info=dict(bot_info, channel=channel),
+                                                  service=service.get_channel(channel),
+                                                  bitly_access_token='',
+                                                  current_dir=config.current_dir,
+                                                  data_dir=replay_data_dir,
+                                                  credentials=OfflineCredentials(),
+                                                  sheets_client=OfflineSheetsClient(),
+                                                  shortener=OfflineShortener(),
+                                                  sheets_enabled=False)
+
+    print(format_report(replay(args.capture_path, service, bots, speed=args.speed)))
@@ -0,0 +1,217 @@
+import asyncio
+import concurrent.futures
+import time
+
+from src.irc import LineFramer, parse_line
+from src.twitch_service import TwitchService
+
+
+class AsyncTwitchService(TwitchService):
+    """
+    A TwitchService that drives its connection from an asyncio event loop
+    instead of a blocking socket.
+
+    One task reads from the connection and one task writes to it, so neither has to poll.
+    Anything that wants to send, including the bot's queue threads, drops the line into
+    an asyncio queue and the writer sends it as soon as it arrives.
+    Chat lines are turned into messages and handled in an executor, so the reader never waits on them.
+    Bot commands can block on the database or on google, and turning a whisper into a message
+    asks twitch for the list of mods. Each channel has its own single worker, so one channel's
+    commands run in the order they came in without holding up any other channel's.
+    """
+    def __init__(self, pw, user, channel, twitch_api_client_id, error_logger, event_logger, extra_channels=(),
+                 handle_whispers=True, capture_path=None, host='irc.chat.twitch.tv', port=6667,
+                 handshake_timeout=10, backoff=None, duplicate_filter=None, rate_limit_share=1):
+        self.loop = asyncio.new_event_loop()
+        self.reader = None
+        self.writer = None
+        self.outbound_queue = None
+        self._unsent_lines = None
+        # channel -> the single worker that runs its commands, whispers go to the first channel's
+        self.command_executors = {}
+        TwitchService.__init__(self, pw=pw,
+                               user=user,
+                               channel=channel,
+                               twitch_api_client_id=twitch_api_client_id,
+                               error_logger=error_logger,
+                               event_logger=event_logger,
+                               extra_channels=extra_channels,
+                               handle_whispers=handle_whispers,
+                               capture_path=capture_path,
+                               host=host,
+                               port=port,
+                               handshake_timeout=handshake_timeout,
+                               backoff=backoff,
+                               duplicate_filter=duplicate_filter,
+                               rate_limit_share=rate_limit_share)
+
+    def send_public_message(self, message_content, channel=None):
+        """
+        Queues a message for the twitch public chat.
+        Safe to call from any thread. Waits until the message can be sent without breaking twitch's rate limits.
+        """
+        channel = channel or self.channel
+        message_content = self._filter_duplicate(message_content, channel)
+        if message_content is None:
+            return
+        self.rate_limiter.acquire_chat(channel)
+        print('{} PUBLIC {}: {}'.format(
+            time.strftime('%Y-%m-%d %H:%M:%S'),
+            self.display_user,
+            message_content))
+        self._queue_line(f'PRIVMSG #{channel} :{message_content}\r\n')
+
+    def send_private_message(self, recipient, whisper_content, channel=None):
+        """
+        Queues a whisper with the specified content to the specified user.
+        Safe to call from any thread. Waits until the whisper can be sent without breaking twitch's rate limits.
+        """
+        channel = channel or self.channel
+        self.rate_limiter.acquire_whisper()
+        print('{} PRIVATE {} to {}: {}'.format(
+            time.strftime('%Y-%m-%d %H:%M:%S'),
+            self.display_user,
+            recipient,
+            whisper_content))
+        self._queue_line(f'PRIVMSG #{channel} :/w {recipient} {whisper_content}\r\n')
+
+    def _queue_line(self, line):
+        """
+        Hands a line to the writer task.
+        While the connection is down this waits for it to come back, so the sending thread pauses
+        instead of piling up lines that would all go out at once afterwards.
+        """
+        self.connected.wait()
+        self.loop.call_soon_threadsafe(self.outbound_queue.put_nowait, line.encode('utf-8'))
+
+    def _send_pong(self):
+        """
+        Runs on the event loop, so the PONG can skip the queue and go straight into the stream's buffer.
+        """
+        self.writer.write('PONG :tmi.twitch.tv\r\n'.encode('utf-8'))
+        self.event_logger.info('sent: PONG')
+
+    def _start_writer(self):
+        # The writer is a task on the event loop, started by run
+        pass
+
+    def _connect(self):
+        """
+        Connects before the loop starts running, so the bot can be built right after the service
+        the same way it is with the blocking service.
+        """
+        self.loop.run_until_complete(self._async_connect())
+
+    async def _async_connect(self):
+        """
+        Keeps trying to connect and join every channel until it works,
+        waiting a little longer (with jitter) after each failed attempt.
+        Lines queued in the meantime stay in the outbound queue until the writer is back.
+        """
+        while True:
+            try:
+                await asyncio.wait_for(self._async_join_room(), self.handshake_timeout)
+            except (OSError, asyncio.TimeoutError) as e:
+                if self.writer is not None:
+                    self.writer.close()
+                delay = self.backoff.next_delay()
+                print(f'{str(e) or "Timed out"}: Connecting failed, retrying in {delay:.1f}s.')
+                self.error_logger.warning(f'{str(e) or "Timed out"}: Connecting failed, retrying in {delay:.1f}s.')
+                await asyncio.sleep(delay)
+            else:
+                self.backoff.reset()
+                self.connected.set()
+                return
+
+    async def _async_join_room(self):
+        if self.outbound_queue is None:
+            self.outbound_queue = asyncio.Queue()
+        # A new connection gets a new framer, nothing left over from the last one
+        self.line_framer = LineFramer()
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.writer.write(self._get_handshake())
+        await self.writer.drain()
+
+        channels_joined = 0
+        while channels_joined < len(self.channels):
+            read_buffer = await self.reader.read(2048)
+            if len(read_buffer) == 0:
+                raise ConnectionError('Disconnected while joining the room')
+            for line in self.line_framer.feed(read_buffer):
+                if 'End of /NAMES list' in line:
+                    channels_joined += 1
+                else:
+                    self._handle_handshake_line(line)
+
+    async def _read_lines(self, bots):
+        while True:
+            read_buffer = await self.reader.read(4096)
+            if len(read_buffer) == 0:
+                raise ConnectionError('Disconnected')
+            for line in self.line_framer.feed(read_buffer):
+                self.event_logger.info(f'received: {line}'.encode('utf-8'))
+                self._capture_line(line)
+                parsed_line = parse_line(line)
+                if parsed_line.command in ['PRIVMSG', 'WHISPER']:
+                    channel = parsed_line.channel if parsed_line.command == 'PRIVMSG' else self.channel
+                    # Fire and forget, _handle_message logs its own errors.
+                    self.loop.run_in_executor(self._command_executor(channel), self._handle_chat_line,
+                                              line, parsed_line, bots)
+                else:
+                    message = self._line_to_message(line, parsed_line)
+                    self._handle_message(message, self._get_bot_for_message(message, bots))
+
+    def _command_executor(self, channel):
+        if channel not in self.command_executors:
+            self.command_executors[channel] = concurrent.futures.ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix=f'{channel}-chat')
+        return self.command_executors[channel]
+
+    def _handle_chat_line(self, line, parsed_line, bots):
+        """
+        Runs on the channel's executor, a whisper's mod check can take a request to twitch.
+        """
+        message = self._line_to_message(line, parsed_line)
+        self._handle_message(message, self._get_bot_for_message(message, bots))
+
+    async def _write_lines(self):
+        """
+        Takes every line that's ready, up to write_batch_bytes, and writes them together.
+        A batch that doesn't make it is written again after reconnecting.
+        """
+        while True:
+            if self._unsent_lines is None:
+                lines = [await self.outbound_queue.get()]
+                size = len(lines[0])
+                while not self.outbound_queue.empty() and size < self.write_batch_bytes:
+                    lines.append(self.outbound_queue.get_nowait())
+                    size += len(lines[-1])
+                self._unsent_lines = lines
+            data = b''.join(self._unsent_lines)
+            self.writer.write(data)
+            await self.writer.drain()
+            self.lines_written += len(self._unsent_lines)
+            self.writes += 1
+            self.event_logger.info(f'sent: {data}')
+            self._unsent_lines = None
+
+    async def _run(self, bots):
+        while True:
+            tasks = [asyncio.ensure_future(self._read_lines(bots)),
+                     asyncio.ensure_future(self._write_lines())]
+            done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            for task in pending:
+                task.cancel()
+            for task in done:
+                if task.exception() is not None:
+                    print(f'{str(task.exception())}: Attempting to reconnecting to the socket.')
+                    self.event_logger.info(f'{str(task.exception())}: Attempting to reconnecting to the socket.')
+            self.connected.clear()
+            self.writer.close()
+            self.reconnect_count += 1
+            await self._async_connect()
+
+    def run(self, bots):
+        if not isinstance(bots, dict):
+            bots = {self.channel: bots}
+        self.loop.run_until_complete(self._run(bots))
@@ -1,48 +1,24 @@
-import collections
-import importlib
-import inspect
+import concurrent.futures
+import contextlib
 import os
 import threading
 import time
 from enum import Enum, auto
 
 import sqlalchemy
-from pyshorteners import Shortener
 from sqlalchemy.orm import sessionmaker
 
 import src.google_auth as google_auth
 import src.models as models
+import src.outbound as outbound
+import src.plugins as plugins
+import src.sheets as sheets
 import src.utils as utils
+from src.command_registry import CommandRegistry, DynamicCommandCache
+from src.connection import Backoff
 from src.message import Message
-
-
-def collect_mixin_classes(directory_name):
-    """
-    Collect all the Mixin classes from all the modules in the specified directory
-    Store these class objects in a mixin_classes list
-    Return that list so that the bot can inherit from them
-    """
-    print(F'Loading Modules from {directory_name}')
-    cur_dir = os.path.dirname(os.path.realpath(__file__))
-    modules_dir = os.path.join(cur_dir, directory_name)
-    module_files = [f for f in os.listdir(modules_dir) if os.path.isfile(os.path.join(modules_dir, f))]
-    mixin_classes = []
-
-    for file in module_files:
-        if file != '__init__.py' and file[-3:] == '.py':
-            # Take these .py files and import them, turning them into module objects
-            imported = importlib.import_module(f'src.{directory_name}.{file[:-3]}')
-            for item in dir(imported):
-                if item[0] != '_':
-                    if isinstance(getattr(imported, item), type) and 'Mixin' in item:
-                        mixin_classes.append(getattr(imported, item))
-                        print(item)
-    return mixin_classes
-
-
-mixin_classes = []
-mixin_classes += collect_mixin_classes('core_modules')
-mixin_classes += collect_mixin_classes('streamer_specific_modules')
+from src.queues import PriorityMessageQueue, WaitableDeque
+from src.worker_pool import KeyedWorkerPool
 
 
 class CommandTypes(Enum):
@@ -51,25 +27,59 @@ class CommandTypes(Enum):
 
 
 # noinspection PyArgumentList,PyIncorrectDocstring
-class Bot(*mixin_classes):
-    def __init__(self, service, bot_info, bitly_access_token, current_dir, data_dir):
+class Bot(object):
+    # Set on the classes bot_class builds, this one on its own has no plugins
+    plugins = ()
+    mixin_classes = ()
+
+    def __init__(self, service, bot_info, bitly_access_token, current_dir, data_dir, credentials=None,
+                 command_workers=4, command_debounce=2.0, sheets_client=None, shortener=None, sheets_enabled=True):
+        """
+        Starting up happens in two stages. Everything chat needs is set up here, then the bot is online.
+        Everything to do with google happens afterwards on the startup thread, and sheets_ready is set
+        once that's done. Until then, anything that needs the sheets says the bot is still warming up.
+        With sheets_enabled False the google half never happens, sheets_ready is never set,
+        and anything that needs the sheets says they're turned off.
+        How long each part took ends up in startup_timings, and how long each plugin took in plugin_timings.
+        """
+        startup_started = time.monotonic()
+        self.startup_timings = {}
+        self.plugin_timings = {}
         self.service = service
         self.info = bot_info
 
-        self.sorted_methods = self._sort_methods()
-
-        # Most functions run in the main thread, but we can put slow ones here
-        self.command_queue = collections.deque()
-
-        self.public_message_queue = collections.deque()
-        self.private_message_queue = collections.deque()
-
-        self.shortener = Shortener('Bitly', bitly_token=bitly_access_token)
-
-        self.Session = self._initialize_db(data_dir)
-        db_session = self.Session()
-
-        self.credentials = google_auth.get_credentials(credentials_parent_dir=current_dir, client_secret_dir=current_dir)
+        # Worked out once here so a message only costs a dict lookup to dispatch
+        with self._startup_phase('command_registry'):
+            self.command_registry = CommandRegistry(self)
+            self.sorted_methods = self.command_registry.sorted_methods()
+
+        # Most functions run in the main thread, but we can put slow ones here.
+        # Slow jobs for different things run side by side, a burst of the same job runs once.
+        # Jobs that write to the same spreadsheet run one after another.
+        self.command_queue = KeyedWorkerPool(self._run_queued_command, max_workers=command_workers,
+                                             debounce=command_debounce, error_logger=service.error_logger,
+                                             name=f"{bot_info['channel']}-command", group=self._command_spreadsheet)
+        # spreadsheet -> the lock utils.uses_spreadsheet holds while writing to it
+        self.spreadsheet_locks = {}
+
+        # Moderation first, then replies, then announcements like auto quotes
+        self.public_message_queue = PriorityMessageQueue()
+        self.private_message_queue = WaitableDeque()
+
+        with self._startup_phase('database'):
+            self.Session = self._initialize_db(data_dir)
+            db_session = self.Session()
+            # Commands made in chat, so a !word that isn't one is a dict lookup rather than a query
+            self.dynamic_commands = DynamicCommandCache()
+            self.dynamic_commands.load(db_session)
+
+        # All set by the startup thread, unless they're passed in
+        self.shortener = shortener
+        self.credentials = credentials
+        self.sheets = sheets_client
+        self.sheets_enabled = sheets_enabled
+        self.sheets_ready = threading.Event()
+        self.startup_thread = None
 
         self.starting_spreadsheets_list = []
         self.spreadsheets = {}
@@ -88,77 +98,146 @@ class Bot(*mixin_classes):
         self.whisper_thread.daemon = True
         self.whisper_thread.start()
 
-        self.command_thread = threading.Thread(target=self._process_command_queue,
-                                               kwargs={'command_queue': self.command_queue})
-        self.command_thread.daemon = True
-        self.command_thread.start()
-
         # Run all the init methods of all the mixins that have them.
         # This currently doesn't use super because not all mixins have an init method that calls super
         # That would almost certainly break the method resolution order and cause things to fail.
-        for mixin_class in mixin_classes:
-            if getattr(mixin_class, '__init__', None):
-                if callable(getattr(mixin_class, '__init__')):
+        with self._startup_phase('plugins'):
+            for name, mixin_class in zip(self.plugins, self.mixin_classes):
+                init_started = time.monotonic()
+                # Only the mixin's own __init__, not one it would inherit from object
+                if '__init__' in vars(mixin_class):
                     mixin_class.__init__(self)
-
-        print('Finding Google Sheets')
-        for sheet in self.starting_spreadsheets_list:
-            sheet_name = '{}-{}-{}'.format(bot_info['channel'], bot_info['user'], sheet)
-            already_existed, spreadsheet_id = google_auth.ensure_file_exists(self.credentials, sheet_name)
-            web_view_link = 'https://docs.google.com/spreadsheets/d/{}'.format(spreadsheet_id)
-            sheet_tuple = (sheet_name, web_view_link)
-            self.spreadsheets[sheet] = sheet_tuple
-            if not already_existed:
-                init_command = '_initialize_{}_spreadsheet'.format(sheet)
-                getattr(self, init_command)(sheet_name)
+                self.plugin_timings[name] = {'import': plugins.load_timings.get(name, 0.0),
+                                             'init': time.monotonic() - init_started}
+        print(f"{bot_info['channel']} plugins: " +
+              ', '.join(f"{name}={(timing['import'] + timing['init']) * 1000:.1f}ms"
+                        for name, timing in self.plugin_timings.items()))
 
         utils.add_to_public_chat_queue(self, f"{bot_info['user']} is online")
 
-        active_auto_quotes = db_session.query(models.AutoQuote).filter(models.AutoQuote.active == True).all()
-        for aaq in active_auto_quotes:
-            self._create_timer_for_auto_quote_object(aaq)
+        if 'auto_quotes' in self.plugins:
+            active_auto_quotes = db_session.query(models.AutoQuote).filter(models.AutoQuote.active == True).all()
+            for aaq in active_auto_quotes:
+                self._create_timer_for_auto_quote_object(aaq)
         self.player_queue_credentials = None
         db_session.close()
-
-    def _sort_methods(self):
+        self.startup_timings['online'] = time.monotonic() - startup_started
+
+        self.startup_thread = threading.Thread(target=self._finish_startup, name=f"{bot_info['channel']}-startup",
+                                               kwargs={'startup_started': startup_started,
+                                                       'current_dir': current_dir,
+                                                       'bitly_access_token': bitly_access_token,
+                                                       'pool_size': command_workers + 1})
+        self.startup_thread.daemon = True
+        self.startup_thread.start()
+
+    @contextlib.contextmanager
+    def _startup_phase(self, phase):
+        started = time.monotonic()
+        yield
+        self.startup_timings[phase] = time.monotonic() - started
+
+    def _finish_startup(self, startup_started, current_dir, bitly_access_token, pool_size):
         """
-        Looks through the object's methods,
-        sorts them into lists by evaluating who can use them
-        puts those lists into a dictionary and returns it.
+        The slow half of starting up: the shortener, google credentials, and finding and setting up the sheets.
+        If any of it fails it's all tried again after a while, the bot carries on with chat in the meantime.
+        A google library that isn't installed turns the sheets off instead.
         """
-        # Collect all methods and properties of the object.
-        # Add them to self.my_dir if they don't start with an _
-        my_dir = [item for item in self.__dir__() if item[0] != '_']
-
-        my_methods = []
-        methods_dict = {'for_mods': [],
-                        'for_all': [],
-                        'private_message_allowed': [],
-                        'public_message_disallowed': []}
-
-        # Look at all the items in self.my_dir
-        # Check to see if they're callable.
-        # If they are add them to self.my_methods
-        for item in my_dir:
-            if callable(getattr(self, item)):
-                my_methods.append(item)
-
-        # Sort all methods in self.my_methods into either the for_mods list
-        # or the for_all list based on the function's _mods_only property
-        for method in my_methods:
-            if hasattr(getattr(self, method), '_mod_only'):
-                methods_dict['for_mods'].append(method)
-            else:
-                methods_dict['for_all'].append(method)
-            if hasattr(getattr(self, method), '_private_message_allowed'):
-                methods_dict['private_message_allowed'].append(method)
-            if hasattr(getattr(self, method), '_public_message_disallowed'):
-                methods_dict['public_message_disallowed'].append(method)
-
-        for method_list in methods_dict.values():
-            method_list.sort(key=lambda item: item.lower())
+        backoff = Backoff(base_delay=5.0, max_delay=300.0)
+        shortener_installed = True
+        while True:
+            try:
+                if self.shortener is None and shortener_installed:
+                    with self._startup_phase('shortener'):
+                        try:
+                            from pyshorteners import Shortener
+                        except ImportError:
+                            # Not worth retrying, links just won't be shortened
+                            shortener_installed = False
+                            print('pyshorteners is not installed, links will not be shortened')
+                        else:
+                            self.shortener = Shortener('Bitly', bitly_token=bitly_access_token)
+
+                if not self.sheets_enabled:
+                    break
+
+                with self._startup_phase('credentials'):
+                    # Bots for several channels can share one set of google credentials
+                    if self.credentials is None:
+                        self.credentials = google_auth.get_credentials(credentials_parent_dir=current_dir,
+                                                                       client_secret_dir=current_dir)
+                    # Logged in gspread client and cached sheet handles, which can be shared between bots too
+                    if self.sheets is None:
+                        self.sheets = sheets.SheetsClient(self.credentials, pool_size=pool_size)
+
+                print('Finding Google Sheets')
+                db_session = self.Session()
+                try:
+                    with self._startup_phase('find_sheets'):
+                        created = self._find_spreadsheets(db_session)
+                finally:
+                    db_session.close()
+
+                with self._startup_phase('initialize_sheets'):
+                    for sheet in created:
+                        init_command = '_initialize_{}_spreadsheet'.format(sheet)
+                        getattr(self, init_command)(self.spreadsheets[sheet][0])
+                break
+            except ImportError as e:
+                # Trying again won't install anything, so carry on without the sheets
+                print(f'{str(e)}: Running without the spreadsheets')
+                self.service.error_logger.exception('Google libraries missing, sheets turned off')
+                self.sheets_enabled = False
+                break
+            except Exception as e:
+                delay = backoff.next_delay()
+                print(f'{str(e)}: Startup failed, trying again in {delay:.0f}s')
+                self.service.error_logger.exception('Startup failed')
+                time.sleep(delay)
+
+        self.startup_timings['ready'] = time.monotonic() - startup_started
+        if self.sheets_enabled:
+            self.sheets_ready.set()
+        print(f"{self.info['channel']} startup: " +
+              ', '.join(f'{phase}={seconds:.2f}s' for phase, seconds in self.startup_timings.items()))
+
+    def _find_spreadsheets(self, db_session):
+        """
+        Finds the google sheet for everything in starting_spreadsheets_list, creating the ones that don't exist yet,
+        and fills in self.spreadsheets. Returns the sheets that had to be created.
 
-        return methods_dict
+        The ids are kept in the database, so usually finding a sheet is one small request
+        to check it's still there. All the lookups happen at once with one drive client.
+        """
+        sheet_names = {sheet: '{}-{}-{}'.format(self.info['channel'], self.info['user'], sheet)
+                       for sheet in self.starting_spreadsheets_list}
+        if not sheet_names:
+            return []
+        mv_keys = {sheet: f'spreadsheet-id-{sheet_name}' for sheet, sheet_name in sheet_names.items()}
+        mv_objs = db_session.query(models.MiscValue).filter(models.MiscValue.mv_key.in_(mv_keys.values())).all()
+        known_ids = {mv_obj.mv_key: mv_obj for mv_obj in mv_objs}
+
+        service = google_auth.build_drive_service(self.credentials)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(sheet_names)) as executor:
+            futures = {}
+            for sheet, sheet_name in sheet_names.items():
+                known_id = known_ids[mv_keys[sheet]].mv_value if mv_keys[sheet] in known_ids else None
+                futures[sheet] = executor.submit(google_auth.ensure_file_exists, self.credentials, sheet_name,
+                                                 service=service, known_file_id=known_id)
+
+        created = []
+        for sheet, future in futures.items():
+            already_existed, spreadsheet_id = future.result()
+            web_view_link = 'https://docs.google.com/spreadsheets/d/{}'.format(spreadsheet_id)
+            self.spreadsheets[sheet] = (sheet_names[sheet], web_view_link)
+            if mv_keys[sheet] in known_ids:
+                known_ids[mv_keys[sheet]].mv_value = spreadsheet_id
+            else:
+                db_session.add(models.MiscValue(mv_key=mv_keys[sheet], mv_value=spreadsheet_id))
+            if not already_existed:
+                created.append(sheet)
+        db_session.commit()
+        return created
 
     def _initialize_db(self, db_location):
         """
@@ -184,41 +263,52 @@ class Bot(*mixin_classes):
 
     def _process_chat_queue(self, chat_queue):
         """
-        If there are messages in the chat queue that need
-        to be sent, pop off the oldest one and pass it
-        to the ts.send_message function. Then sleep for
-        half a second to stay below the twitch rate limit.
+        Waits for a message to land in the chat queue,
+        pops off the next one and passes it
+        to the ts.send_message function. The service holds
+        on to it until the rate limit lets it through.
+        Short messages queued up together go out as one
+        and long ones are split to fit twitch's limit.
         """
         while self.allowed_to_chat:
-            if len(chat_queue) > 0:
-                self.service.send_public_message(chat_queue.pop())
-            time.sleep(.5)
+            # The timeout only matters for noticing allowed_to_chat was turned off
+            if chat_queue.wait(timeout=1):
+                for content in outbound.next_chat_messages(chat_queue):
+                    self.service.send_public_message(content)
 
     def _process_whisper_queue(self, whisper_queue):
         """
-        If there are whispers in the queue that need
-        to be sent, pop off the oldest one and pass it
-        to the ts.send_whisper function. Then sleep for
-        half a second to stay below the twitch rate limit.
+        Waits for a whisper to land in the queue,
+        pops off the oldest one and passes it
+        to the ts.send_whisper function. The service holds
+        on to it until the rate limit lets it through.
         """
         while True:
-            if len(whisper_queue) > 0:
-                whisper_tuple = (whisper_queue.pop())
-                self.service.send_private_message(whisper_tuple[0], whisper_tuple[1])
-            time.sleep(1.5)
+            whisper_queue.wait()
+            whisper_tuple = (whisper_queue.pop())
+            for content in outbound.split_message(whisper_tuple[1]):
+                self.service.send_private_message(whisper_tuple[0], content)
 
-    def _process_command_queue(self, command_queue):
+    def _run_queued_command(self, command_tuple):
         """
-        If there are commands in the queue, pop off the
-        oldest one and run it. Then sleep for half a second
-        to avoid busy waiting the CPU into a space heater.
+        Runs a command from the command queue on one of its worker threads.
         """
-        while True:
-            if len(command_queue) > 0:
-                command_tuple = command_queue.pop()
-                func, kwargs = command_tuple[0], command_tuple[1]
-                getattr(self, func)(**kwargs)
-            time.sleep(.5)
+        func, kwargs = command_tuple[0], command_tuple[1]
+        getattr(self, func)(**kwargs)
+
+    def _command_spreadsheet(self, command_tuple):
+        """
+        The spreadsheet a queued command writes to, if it's marked with utils.uses_spreadsheet.
+        """
+        return getattr(getattr(self, command_tuple[0], None), '_spreadsheet', None)
+
+    def queue_stats(self):
+        """
+        How deep each of the bot's queues is and how long things have been waiting in them.
+        """
+        return {'public': self.public_message_queue.stats(),
+                'private': self.private_message_queue.stats(),
+                'command': self.command_queue.stats()}
 
     def _act_on(self, message):
         """
@@ -238,50 +328,46 @@ class Bot(*mixin_classes):
             else:
                 utils.add_to_appropriate_chat_queue(self, message, self.service.get_message_content(message).replace('PING', 'PONG'))
 
-        db_session = self.Session()
-        command = self._get_command(message, db_session)
+        command = self._get_command(message)
         if command is not None:
             user = self.service.get_message_display_name(message)
             user_is_mod = self.service.get_mod_status(message)
             if self._has_permission(user, user_is_mod, command) and self._is_valid_message_type(command, message):
-                self._run_command(command, message, db_session)
-        db_session.commit()
-        db_session.close()
+                self._run_command(command, message)
 
-    def _get_command(self, message, db_session):
+    def _get_command(self, message):
         """
-        Takes a message from the user and a database session.
-        Returns a list which contains the command and the place where it can be found.
-        If it's a method, that place will be the key in the sorted_methods dictionary which
-        has the corresponding list containing the command. Otherwise it will be the word 'Database'.
+        Takes a message from the user.
+        Returns a list which contains the type of command and the command itself.
+        That's a CommandRecord from the command registry for a hardcoded one,
+        or a DynamicCommand from the dynamic command cache. Neither needs the database.
         """
         first_word = self.service.get_message_content(message).split(' ')[0]
         if len(first_word) > 1 and first_word[0] == '!':
             potential_command = first_word[1:].lower()
         else:
             return None
-        if potential_command in self.sorted_methods['for_all'] or potential_command in self.sorted_methods['for_mods']:
-            return [CommandTypes.HARDCODED, potential_command]
-        db_result = db_session.query(models.Command).filter(models.Command.call == potential_command).all()
-        if db_result:
-            return [CommandTypes.DYNAMIC, db_result[0]]
+        record = self.command_registry.get(potential_command)
+        if record is not None:
+            return [CommandTypes.HARDCODED, record]
+        dynamic_command = self.dynamic_commands.get(potential_command)
+        if dynamic_command is not None:
+            return [CommandTypes.DYNAMIC, dynamic_command]
         return None
 
     def _has_permission(self, user, user_is_mod, command):
         """
-        Takes a message from the user, and a list which contains the
-        command and where it's found, and a database session.
+        Takes the user, whether they're a mod, and a list which contains the
+        type of command and the command.
         Returns True or False depending on whether the user that
         sent the command has the authority to use that command
         """
         if command[0] == CommandTypes.HARDCODED:
-            if command[1] in self.sorted_methods['for_all'] or (command[1] in self.sorted_methods['for_mods'] and user_is_mod):
+            if not command[1].mod_only or user_is_mod:
                 return True
         else:
-            db_command = command[1]
-            if bool(db_command.permissions) is False:
-                return True
-            elif user in [permission.user_entity for permission in db_command.permissions]:
+            dynamic_command = command[1]
+            if not dynamic_command.allowed_users or user in dynamic_command.allowed_users:
                 return True
         return False
 
@@ -289,26 +375,41 @@ class Bot(*mixin_classes):
         if self.service.get_mod_status(message):
             return True
         if command[0] == CommandTypes.HARDCODED:
-            if self.service.get_message_type(message) == 'PUBLIC':
-                return command[1] not in self.sorted_methods['public_message_disallowed']
-            elif self.service.get_message_type(message) == 'PRIVATE':
-                return command[1] in self.sorted_methods['private_message_allowed']
+            return self.service.get_message_type(message) in command[1].message_types
         else:
             return self.service.get_message_type(message) == 'PUBLIC'
 
-    def _run_command(self, command, message, db_session):
+    def _run_command(self, command, message):
         """
         If the command is a database command, send the response to the chat queue.
-        Otherwise call the relevant function, supplying the message and db_session arguments as needed.
+        Otherwise call the relevant function, its invoker already knows which of message and db_session it takes.
+        Only commands that take a db_session get one, everything else never touches the database.
         """
         if command[0] == CommandTypes.DYNAMIC:
-            db_command = command[1]
-            utils.add_to_appropriate_chat_queue(self, message, db_command.response)
+            utils.add_to_appropriate_chat_queue(self, message, command[1].response)
+        elif command[1].takes_db_session:
+            db_session = self.Session()
+            command[1].invoke(message, db_session)
+            db_session.commit()
+            # Only now that they're in the database can chat see new or changed commands
+            self.dynamic_commands.apply_committed(db_session)
+            db_session.close()
         else:
-            method_command = command[1]
-            kwargs = {}
-            if 'message' in inspect.signature(getattr(self, method_command)).parameters:
-                kwargs['message'] = message
-            if 'db_session' in inspect.signature(getattr(self, method_command)).parameters:
-                kwargs['db_session'] = db_session
-            getattr(self, method_command)(**kwargs)
+            command[1].invoke(message, None)
+
+
+# tuple of plugin names -> the Bot class built from them
+_bot_classes = {}
+
+
+def bot_class(plugin_names):
+    """
+    A Bot class with just the mixins for plugin_names, in that order, importing them if they haven't been yet.
+    Channels with the same plugins share a class.
+    """
+    plugin_names = tuple(plugin_names)
+    if plugin_names not in _bot_classes:
+        mixin_classes = tuple(plugins.load_plugin(name) for name in plugin_names)
+        _bot_classes[plugin_names] = type('Bot', (Bot,) + mixin_classes,
+                                          {'plugins': plugin_names, 'mixin_classes': mixin_classes})
+    return _bot_classes[plugin_names]
@@ -0,0 +1,167 @@
+import inspect
+
+import src.models as models
+
+
+class CommandRecord(object):
+    """
+    Everything dispatching a chat command needs to know about it, worked out once when the bot starts.
+    message_types are the message types anyone can use it from, mods can use everything from anywhere.
+    """
+    __slots__ = ('name', 'mod_only', 'private_message_allowed', 'public_message_disallowed',
+                 'message_types', 'takes_db_session', 'invoke', 'doc')
+
+    def __init__(self, name, method):
+        self.name = name
+        self.mod_only = hasattr(method, '_mod_only')
+        self.private_message_allowed = hasattr(method, '_private_message_allowed')
+        self.public_message_disallowed = hasattr(method, '_public_message_disallowed')
+        message_types = set()
+        if not self.public_message_disallowed:
+            message_types.add('PUBLIC')
+        if self.private_message_allowed:
+            message_types.add('PRIVATE')
+        self.message_types = frozenset(message_types)
+        self.takes_db_session = 'db_session' in inspect.signature(method).parameters
+        self.invoke = make_invoker(method)
+        self.doc = method.__doc__
+
+
+def make_invoker(method):
+    """
+    Takes a bound method and returns a function of (message, db_session) that calls it
+    with whichever of those it takes. They're passed by keyword, requires_sheets looks for message there.
+    """
+    parameters = inspect.signature(method).parameters
+    wants_message = 'message' in parameters
+    wants_db_session = 'db_session' in parameters
+    if wants_message and wants_db_session:
+        return lambda message, db_session: method(message=message, db_session=db_session)
+    if wants_message:
+        return lambda message, db_session: method(message=message)
+    if wants_db_session:
+        return lambda message, db_session: method(db_session=db_session)
+    return lambda message, db_session: method()
+
+
+def command_names(mixin_classes):
+    """
+    The chat commands are the public functions the plugins' mixins define, anyone in chat can call
+    any of them that isn't mod_only. So helpers in a mixin need a leading underscore.
+    The bot's own methods and attributes, like queue_stats or Session, aren't commands.
+    """
+    names = set()
+    for mixin_class in mixin_classes:
+        for cls in inspect.getmro(mixin_class):
+            if cls is object:
+                continue
+            names.update(name for name, value in vars(cls).items()
+                         if name[0] != '_' and inspect.isfunction(value))
+    return names
+
+
+class CommandRegistry(object):
+    """
+    Command name -> CommandRecord for every chat command a bot has, so dispatching a message is one dict lookup.
+    """
+    def __init__(self, bot):
+        self.records = {name: CommandRecord(name, getattr(bot, name))
+                        for name in command_names(type(bot).mixin_classes)}
+
+    def get(self, name):
+        return self.records.get(name)
+
+    def __contains__(self, name):
+        return name in self.records
+
+    def __len__(self):
+        return len(self.records)
+
+    def sorted_methods(self):
+        """
+        The command names in the lists show_commands and the command sheet use, sorted the way people read them.
+        """
+        methods_dict = {'for_mods': [],
+                        'for_all': [],
+                        'private_message_allowed': [],
+                        'public_message_disallowed': []}
+        for record in self.records.values():
+            methods_dict['for_mods' if record.mod_only else 'for_all'].append(record.name)
+            if record.private_message_allowed:
+                methods_dict['private_message_allowed'].append(record.name)
+            if record.public_message_disallowed:
+                methods_dict['public_message_disallowed'].append(record.name)
+        for method_list in methods_dict.values():
+            method_list.sort(key=lambda item: item.lower())
+        return methods_dict
+
+
+class DynamicCommand(object):
+    """
+    A command made with !add_command. allowed_users is empty if everyone can use it.
+    """
+    __slots__ = ('call', 'response', 'allowed_users')
+
+    def __init__(self, call, response, allowed_users=()):
+        self.call = call
+        self.response = response
+        self.allowed_users = frozenset(allowed_users)
+
+
+class DynamicCommandCache(object):
+    """
+    Every command in the COMMANDS table, kept in memory so checking a !word against them doesn't touch the database.
+    Whatever changes the table has to change this too, the commands plugin's _add_command, _edit_command
+    and _delete_command do. They only note their changes on the db_session with put_after_commit and
+    remove_after_commit, and the bot applies them with apply_committed once the session has committed,
+    so a change that's rolled back never reaches chat.
+    Reads happen without a lock, every change swaps in a whole new DynamicCommand.
+    """
+    def __init__(self):
+        self.commands = {}
+
+    def load(self, db_session):
+        """
+        Reads all the commands and their permissions, in two queries rather than one per command.
+        """
+        allowed_users = {}
+        for permission in db_session.query(models.Permission).all():
+            allowed_users.setdefault(permission.command_id, []).append(permission.user_entity)
+        self.commands = {db_command.call: DynamicCommand(db_command.call, db_command.response,
+                                                         allowed_users.get(db_command.id, ()))
+                         for db_command in db_session.query(models.Command).all()}
+
+    def get(self, call):
+        return self.commands.get(call)
+
+    def __contains__(self, call):
+        return call in self.commands
+
+    def __len__(self):
+        return len(self.commands)
+
+    def put(self, call, response, allowed_users=()):
+        self.commands[call] = DynamicCommand(call, response, allowed_users)
+
+    def remove(self, call):
+        self.commands.pop(call, None)
+
+    @staticmethod
+    def _pending(db_session):
+        return db_session.info.setdefault('dynamic_command_changes', [])
+
+    def put_after_commit(self, db_session, call, response, allowed_users=()):
+        self._pending(db_session).append((call, DynamicCommand(call, response, allowed_users)))
+
+    def remove_after_commit(self, db_session, call):
+        self._pending(db_session).append((call, None))
+
+    def apply_committed(self, db_session):
+        """
+        Applies the changes noted on db_session, call it once the session has committed.
+        """
+        for call, dynamic_command in db_session.info.pop('dynamic_command_changes', ()):
+            if dynamic_command is None:
+                self.commands.pop(call, None)
+            else:
+                self.commands[call] = dynamic_command
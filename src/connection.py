@@ -0,0 +1,36 @@
+import random
+
+
+class Backoff(object):
+    """
+    How long to wait before each reconnect attempt.
+
+    The wait doubles with every failure in a row, up to max_delay, and each one is picked
+    at random between nothing and that limit ("full jitter"), so a crowd of bots that lost
+    their connections at the same moment don't all come back at the same moment too.
+    """
+    def __init__(self, base_delay=1.0, max_delay=120.0, factor=2.0):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.factor = factor
+        self.failures = 0
+
+    def limit(self):
+        """
+        The longest the next wait can be.
+        """
+        return min(self.max_delay, self.base_delay * self.factor ** self.failures)
+
+    def next_delay(self):
+        """
+        Counts another failure and returns how many seconds to wait before trying again.
+        """
+        delay = random.uniform(0, self.limit())
+        self.failures += 1
+        return delay
+
+    def reset(self):
+        """
+        Call this once a connection attempt succeeds.
+        """
+        self.failures = 0
@@ -1,12 +1,14 @@
 import threading
 import time
 
-import gspread
 import sqlalchemy
 
 import src.models as models
+import src.sheet_sync as sheet_sync
 import src.utils as utils
 
+AUTO_QUOTE_SHEET_HEADERS = ['Auto Quote Index', 'Quote', 'Period\n(In seconds)', 'Active']
+
 
 class AutoQuoteMixin:
     def __init__(self):
@@ -14,30 +16,23 @@ class AutoQuoteMixin:
         self.auto_quotes_timers = {}
 
     @utils.retry_gspread_func
+    @utils.uses_spreadsheet('auto_quotes')
     def _initialize_auto_quotes_spreadsheet(self, spreadsheet_name):
         """
         Populate the auto_quotes google sheet with its initial data.
         """
-        gc = gspread.authorize(self.credentials)
-        sheet = gc.open(spreadsheet_name)
-        sheet.worksheets()  # Necessary to remind gspread that Sheet1 exists, otherwise gpsread forgets about it
-
-        try:
-            aqs = sheet.worksheet('Auto Quotes')
-        except gspread.exceptions.WorksheetNotFound:
-            aqs = sheet.add_worksheet('Auto Quotes', 1000, 4)
-            sheet1 = sheet.get_worksheet(0)
-            sheet.del_worksheet(sheet1)
-
-        aqs.update_acell('A1', 'Auto Quote Index')
-        aqs.update_acell('B1', 'Quote')
-        aqs.update_acell('C1', 'Period\n(In seconds)')
-        aqs.update_acell('D1', 'Active')
+        self.sheets.ensure_worksheet(spreadsheet_name, 'Auto Quotes', 1000, 4)
 
+        db_session = self.Session()
+        sheet_sync.forget_sheet(db_session, f'{spreadsheet_name}/Auto Quotes')
+        db_session.commit()
+        db_session.close()
         self.update_auto_quote_spreadsheet()
 
     @utils.mod_only
     @utils.retry_gspread_func
+    @utils.requires_sheets
+    @utils.uses_spreadsheet('auto_quotes')
     def update_auto_quote_spreadsheet(self):
         """
         Updates the auto_quote spreadsheet with all current auto quotes
@@ -52,34 +47,21 @@ class AutoQuoteMixin:
         # http://docs.sqlalchemy.org/en/latest/orm/session_api.html#sqlalchemy.orm.session.Session.flush
         db_session = self.Session()
         spreadsheet_name, web_view_link = self.spreadsheets['auto_quotes']
-        gc = gspread.authorize(self.credentials)
-        sheet = gc.open(spreadsheet_name)
-        aqs = sheet.worksheet('Auto Quotes')
-        worksheet_width = 4
+        aqs = self.sheets.worksheet(spreadsheet_name, 'Auto Quotes')
 
         auto_quotes = db_session.query(models.AutoQuote).all()
 
-        cells = aqs.range(f'A2:D{len(auto_quotes)+11}')
-        for cell in cells:
-            cell.value = ''
-        aqs.update_cells(cells)
-
-        cells = aqs.range(f'A2:D{len(auto_quotes)+1}')
-        for index, auto_quote_obj in enumerate(auto_quotes):
-            human_readable_index_cell_index = index * worksheet_width
-            auto_quote_cell_index = human_readable_index_cell_index + 1
-            period_cell_index = auto_quote_cell_index + 1
-            active_cell_index = period_cell_index + 1
-
-            cells[human_readable_index_cell_index].value = index + 1
-            cells[auto_quote_cell_index].value = auto_quote_obj.quote
-            cells[period_cell_index].value = auto_quote_obj.period
-            cells[active_cell_index].value = auto_quote_obj.active
-        aqs.update_cells(cells)
+        rows = [[index + 1, auto_quote_obj.quote, auto_quote_obj.period, auto_quote_obj.active]
+                for index, auto_quote_obj in enumerate(auto_quotes)]
+        sync = sheet_sync.SheetSync(aqs, db_session, f'{spreadsheet_name}/Auto Quotes')
+        sync.add_row('A', AUTO_QUOTE_SHEET_HEADERS)
+        sync.add_table('A', 4, rows)
+        sync.push()
 
         db_session.commit()
         db_session.close()
 
+    @utils.requires_sheets
     def show_auto_quotes(self, message):
         """
         Links to a google spreadsheet containing all auto quotes
@@ -87,7 +69,7 @@ class AutoQuoteMixin:
         !show_auto_quotes
         """
         web_view_link = self.spreadsheets['auto_quotes'][1]
-        short_url = self.shortener.short(web_view_link)
+        short_url = utils.short_link(self, web_view_link)
         utils.add_to_appropriate_chat_queue(self, message, 'View the auto quotes at: {}'.format(short_url))
 
     @utils.mod_only
@@ -1,59 +1,37 @@
 import threading
 
-import gspread
-
 import src.models as models
+import src.sheet_sync as sheet_sync
 import src.utils as utils
 
+# first column -> headers
+COMMAND_SHEET_HEADERS = {
+    'A': ['Commands\nfor\nEveryone', 'Command\nDescription'],
+    'D': ['Commands\nfor\nMods', 'Command\nDescription'],
+    'G': ['User\nCreated\nCommands', 'Bot Response'],
+    'J': ['User\nSpecific\nCommands', 'Bot Response', 'User List'],
+}
+
 
 class CommandsMixin:
     def __init__(self):
         self.starting_spreadsheets_list.append('commands')
 
     @utils.retry_gspread_func
+    @utils.uses_spreadsheet('commands')
     def _initialize_commands_spreadsheet(self, spreadsheet_name):
         """
         Populate the commands google sheet with its initial data.
         """
-        gc = gspread.authorize(self.credentials)
-        sheet = gc.open(spreadsheet_name)
-        sheet.worksheets()  # Necessary to remind gspread that Sheet1 exists, otherwise gpsread forgets about it
-
-        try:
-            cs = sheet.worksheet('Commands')
-        except gspread.exceptions.WorksheetNotFound:
-            cs = sheet.add_worksheet('Commands', 1000, 20)
-            sheet1 = sheet.get_worksheet(0)
-            sheet.del_worksheet(sheet1)
-
-        cs.update_acell('A1', 'Commands\nfor\nEveryone')
-        cs.update_acell('B1', 'Command\nDescription')
-        cs.update_acell('D1', 'Commands\nfor\nMods')
-        cs.update_acell('E1', 'Command\nDescription')
-        cs.update_acell('G1', 'User\nCreated\nCommands')
-        cs.update_acell('H1', 'Bot Response')
-        cs.update_acell('J1', 'User\nSpecific\nCommands')
-        cs.update_acell('K1', 'Bot Response')
-        cs.update_acell('L1', 'User List')
-
-        for index in range(len(self.sorted_methods['for_all']) + 10):
-            cs.update_cell(index + 2, 1, '')
-            cs.update_cell(index + 2, 2, '')
-
-        for index, method in enumerate(self.sorted_methods['for_all']):
-            cs.update_cell(index + 2, 1, '!{}'.format(method))
-            cs.update_cell(index + 2, 2, getattr(self, method).__doc__)
-
-        for index in range(len(self.sorted_methods['for_mods']) + 10):
-            cs.update_cell(index + 2, 4, '')
-            cs.update_cell(index + 2, 5, '')
-
-        for index, method in enumerate(self.sorted_methods['for_mods']):
-            cs.update_cell(index + 2, 4, '!{}'.format(method))
-            cs.update_cell(index + 2, 5, getattr(self, method).__doc__)
+        self.sheets.ensure_worksheet(spreadsheet_name, 'Commands', 1000, 20)
 
+        db_session = self.Session()
+        sheet_sync.forget_sheet(db_session, f'{spreadsheet_name}/Commands')
+        db_session.commit()
+        db_session.close()
         self.update_command_spreadsheet()
 
+    @utils.requires_sheets
     def show_commands(self, message):
         """
         Links the google spreadsheet containing all commands in chat
@@ -61,14 +39,16 @@ class CommandsMixin:
         !show_commands
         """
         web_view_link = self.spreadsheets['commands'][1]
-        short_url = self.shortener.short(web_view_link)
+        short_url = utils.short_link(self, web_view_link)
         utils.add_to_appropriate_chat_queue(self, message, 'View the commands at: {}'.format(short_url))
 
     @utils.mod_only
     @utils.retry_gspread_func
+    @utils.requires_sheets
+    @utils.uses_spreadsheet('commands')
     def update_command_spreadsheet(self):
         """
-        Updates the commands google sheet with all available user commands.
+        Updates the commands google sheet with the built in commands and all user commands.
         Only call directly if you really need to as the bot
         won't be able to do anything else while updating.
 
@@ -76,9 +56,7 @@ class CommandsMixin:
         """
         db_session = self.Session()
         spreadsheet_name, web_view_link = self.spreadsheets['commands']
-        gc = gspread.authorize(self.credentials)
-        sheet = gc.open(spreadsheet_name)
-        cs = sheet.worksheet('Commands')
+        cs = self.sheets.worksheet(spreadsheet_name, 'Commands')
 
         db_commands = db_session.query(models.Command).all()
         everyone_commands = []
@@ -89,34 +67,21 @@ class CommandsMixin:
             else:
                 user_specific_commands.append(command)
 
-        cells = cs.range(f'G2:H{len(everyone_commands) + 11}')
-        for cell in cells:
-            cell.value = ''
-        cs.update_cells(cells)
-
-        cells = cs.range(f'G2:H{len(everyone_commands) + 1}')
-        cell_range_width = 2
-
-        for index, command in enumerate(everyone_commands):
-            cells[index*cell_range_width].value = f'!{command.call}'
-            cells[(index * cell_range_width) + 1].value = command.response
-        cs.update_cells(cells)
-
-        cells = cs.range(f'J2:L{len(user_specific_commands) + 11}')
-        for cell in cells:
-            cell.value = ''
-        cs.update_cells(cells)
-
-        cells = cs.range(f'J2:L{len(user_specific_commands) + 1}')
-        cell_range_width = 3
-
-        for index, command in enumerate(user_specific_commands):
+        user_specific_rows = []
+        for command in user_specific_commands:
             users = [permission.user_entity for permission in command.permissions]
-            users_str = ', '.join(users)
-            cells[index * cell_range_width].value = f'!{command.call}'
-            cells[(index * cell_range_width) + 1].value = command.response
-            cells[(index * cell_range_width) + 2].value = users_str
-        cs.update_cells(cells)
+            user_specific_rows.append([f'!{command.call}', command.response, ', '.join(users)])
+
+        sync = sheet_sync.SheetSync(cs, db_session, f'{spreadsheet_name}/Commands')
+        for first_col, headers in COMMAND_SHEET_HEADERS.items():
+            sync.add_row(first_col, headers)
+        sync.add_table('A', 2, [[f'!{method}', getattr(self, method).__doc__]
+                                for method in self.sorted_methods['for_all']])
+        sync.add_table('D', 2, [[f'!{method}', getattr(self, method).__doc__]
+                                for method in self.sorted_methods['for_mods']])
+        sync.add_table('G', 2, [[f'!{command.call}', command.response] for command in everyone_commands])
+        sync.add_table('J', 3, user_specific_rows)
+        sync.push()
 
         db_session.commit()
         db_session.close()
@@ -224,6 +189,7 @@ class CommandsMixin:
                     permissions.append(models.Permission(user_entity=user))
                 db_command.permissions = permissions
             db_session.add(db_command)
+            self.dynamic_commands.put_after_commit(db_session, command_str, response, users)
             utils.add_to_command_queue(self, 'update_command_spreadsheet')
             return 'Command added.'
 
@@ -233,6 +199,8 @@ class CommandsMixin:
             response_str = 'Sorry, that command does not exist.'
         else:
             command_obj.response = response
+            self.dynamic_commands.put_after_commit(db_session, command_str, response,
+                                                   [permission.user_entity for permission in command_obj.permissions])
             utils.add_to_command_queue(self, 'update_command_spreadsheet')
             response_str = 'Command edited.'
         return response_str
@@ -241,6 +209,7 @@ class CommandsMixin:
         command_obj = db_session.query(models.Command).filter(models.Command.call == command_str).one_or_none()
         if command_obj is not None:
             db_session.delete(command_obj)
+            self.dynamic_commands.remove_after_commit(db_session, command_str)
             response_str = 'Command deleted.'
             utils.add_to_command_queue(self, 'update_command_spreadsheet')
         else:
@@ -1,36 +1,35 @@
-import concurrent.futures
-
-import gspread
 import sqlalchemy
 
 import config
 import src.models as models
+import src.sheet_sync as sheet_sync
 import src.utils as utils
 
+PLAYER_GUESSES_SHEET_HEADERS = ['User', 'Current Guess', 'Total Guess']
+
 
 class DeathGuessingMixin:
     def __init__(self):
         self.starting_spreadsheets_list.append('player_guesses')
 
-    @utils.retry_gspread_func
+    @utils.uses_spreadsheet('player_guesses')
     def _initialize_player_guesses_spreadsheet(self, spreadsheet_name):
         """
         Populate the player_guesses google sheet with its initial data.
+        Setting the worksheet up and filling it in are retried separately,
+        so a failed push doesn't set the worksheet up all over again.
         """
-        gc = gspread.authorize(self.credentials)
-        sheet = gc.open(spreadsheet_name)
-        sheet.worksheets()  # Necessary to remind gspread that Sheet1 exists, otherwise gpsread forgets about it
+        self._prepare_player_guesses_worksheet(spreadsheet_name)
+        self._update_player_guesses_spreadsheet()
 
-        try:
-            pgs = sheet.worksheet('Player Guesses')
-        except gspread.exceptions.WorksheetNotFound:
-            pgs = sheet.add_worksheet('Player Guesses', 1000, 3)
-            sheet1 = sheet.get_worksheet(0)
-            sheet.del_worksheet(sheet1)
+    @utils.retry_gspread_func
+    def _prepare_player_guesses_worksheet(self, spreadsheet_name):
+        self.sheets.ensure_worksheet(spreadsheet_name, 'Player Guesses', 1000, 3)
 
-        pgs.update_acell('A1', 'User')
-        pgs.update_acell('B1', 'Current Guess')
-        pgs.update_acell('C1', 'Total Guess')
+        db_session = self.Session()
+        sheet_sync.forget_sheet(db_session, f'{spreadsheet_name}/Player Guesses')
+        db_session.commit()
+        db_session.close()
 
     @utils.mod_only
     def start_guessing(self, db_session):
@@ -156,38 +155,24 @@ class DeathGuessingMixin:
         utils.add_to_public_chat_queue(self, "Guesses for the total number of deaths have been cleared.")
 
     @utils.retry_gspread_func
-    def update_player_guesses_spreadsheet(self):
+    @utils.requires_sheets
+    @utils.uses_spreadsheet('player_guesses')
+    def _update_player_guesses_spreadsheet(self):
         """
         Updates the player guesses spreadsheet from the database.
         """
-        with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
-            db_session = self.Session()
-            spreadsheet_name, web_view_link = self.spreadsheets['player_guesses']
-            gc = gspread.authorize(self.credentials)
-            sheet = gc.open(spreadsheet_name)
-            ws = sheet.worksheet('Player Guesses')
-
-            worksheet_width = 3
-
-            all_users = db_session.query(models.User).all()
-            users = [user for user in all_users if user.current_guess is not None or user.total_guess is not None]
-
-            cells = ws.range(f'A2:C{len(users)+11}')
-            for cell in cells:
-                cell.value = ''
-            ws.update_cells(cells)
-
-            cells = ws.range(f'A2:C{len(users)+1}')
-            for index, user in enumerate(users):
-                name_cell_index = index * worksheet_width
-                current_guess_cell_index = name_cell_index + 1
-                total_guess_cell_index = current_guess_cell_index + 1
+        db_session = self.Session()
+        spreadsheet_name, web_view_link = self.spreadsheets['player_guesses']
+        ws = self.sheets.worksheet(spreadsheet_name, 'Player Guesses')
 
-                cells[name_cell_index].value = user.name
-                cells[current_guess_cell_index].value = user.current_guess
-                cells[total_guess_cell_index].value = user.total_guess
+        all_users = db_session.query(models.User).all()
+        users = [user for user in all_users if user.current_guess is not None or user.total_guess is not None]
 
-            ws.update_cells(cells)
+        sync = sheet_sync.SheetSync(ws, db_session, f'{spreadsheet_name}/Player Guesses')
+        sync.add_row('A', PLAYER_GUESSES_SHEET_HEADERS)
+        sync.add_table('A', 3, [[user.name, user.current_guess, user.total_guess] for user in users])
+        sync.push()
+        db_session.close()
         return web_view_link
 
     @utils.mod_only
@@ -201,13 +186,15 @@ class DeathGuessingMixin:
         """
         utils.add_to_command_queue(self, '_update_guess_spreadsheet')
 
+    @utils.requires_sheets
+    @utils.uses_spreadsheet('player_guesses')
     def _update_guess_spreadsheet(self):
         """
         Do all the actual work of updating the guess spreadsheet so that we can stick it in a function queue
         """
         web_view_link = self.spreadsheets['player_guesses'][1]
-        short_url = self.shortener.short(web_view_link)
-        self.update_player_guesses_spreadsheet()
+        short_url = utils.short_link(self, web_view_link)
+        self._update_player_guesses_spreadsheet()
         utils.add_to_public_chat_queue(self, f"Spreadsheet updated. {short_url}")
 
     @utils.mod_only
@@ -1,5 +1,3 @@
-from pynput.keyboard import Key, Listener, KeyCode
-
 import src.utils as utils
 
 
@@ -15,6 +13,7 @@ class KeyboardListenerMixin:
 
     def _on_release(self, key):
         # print('{0} released'.format(key))
+        from pynput.keyboard import KeyCode
         if isinstance(key, KeyCode):
             if key.char == '+':
                 db_session = self.Session()
@@ -38,6 +37,12 @@ class KeyboardListenerMixin:
 
         !start_keylogger
         """
+        # pynput is optional, headless servers don't have anything to listen to
+        try:
+            from pynput.keyboard import Listener
+        except ImportError:
+            utils.add_to_public_chat_queue(self, 'Keyboard input needs pynput installed')
+            return
         if self.keyboard_listener is not None:
             self.keyboard_listener.stop()
         self.keyboard_listener = Listener(on_press=self._on_press, on_release=self._on_release)
@@ -51,5 +56,8 @@ class KeyboardListenerMixin:
 
         !stop_keylogger
         """
+        if self.keyboard_listener is None:
+            return
         self.keyboard_listener.stop()
+        self.keyboard_listener = None
         utils.add_to_public_chat_queue(self, 'No longer listening for keyboard input')
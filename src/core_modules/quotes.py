@@ -1,38 +1,39 @@
 import random
 
-import gspread
-
 import src.models as models
+import src.sheet_sync as sheet_sync
 import src.utils as utils
 
+# Quotes go into the database this many at a time when importing them from the spreadsheet
+QUOTE_IMPORT_BATCH_SIZE = 500
+# and chat hears how it's going every this many
+QUOTE_IMPORT_PROGRESS_INTERVAL = 5000
+
+QUOTE_SHEET_HEADERS = ['Quote Index', 'Quote']
+
 
 class QuotesMixin:
     def __init__(self):
         self.starting_spreadsheets_list.append('quotes')
 
     @utils.retry_gspread_func
+    @utils.uses_spreadsheet('quotes')
     def _initialize_quotes_spreadsheet(self, spreadsheet_name):
         """
         Populate the quotes google sheet with its initial data.
         """
-        gc = gspread.authorize(self.credentials)
-        sheet = gc.open(spreadsheet_name)
-        sheet.worksheets()  # Necessary to remind gspread that Sheet1 exists, otherwise gpsread forgets about it
-
-        try:
-            qs = sheet.worksheet('Quotes')
-        except gspread.exceptions.WorksheetNotFound:
-            qs = sheet.add_worksheet('Quotes', 1000, 2)
-            sheet1 = sheet.get_worksheet(0)
-            sheet.del_worksheet(sheet1)
-
-        qs.update_acell('A1', 'Quote Index')
-        qs.update_acell('B1', 'Quote')
+        self.sheets.ensure_worksheet(spreadsheet_name, 'Quotes', 1000, 2)
 
+        db_session = self.Session()
+        sheet_sync.forget_sheet(db_session, f'{spreadsheet_name}/Quotes')
+        db_session.commit()
+        db_session.close()
         self.update_quote_spreadsheet()
 
     @utils.retry_gspread_func
     @utils.mod_only
+    @utils.requires_sheets
+    @utils.uses_spreadsheet('quotes')
     def update_quote_spreadsheet(self):
         """
         Updates the quote spreadsheet from the database.
@@ -43,58 +44,71 @@ class QuotesMixin:
         """
         db_session = self.Session()
         spreadsheet_name, web_view_link = self.spreadsheets['quotes']
-        gc = gspread.authorize(self.credentials)
-        sheet = gc.open(spreadsheet_name)
-        qs = sheet.worksheet('Quotes')
-        worksheet_width = 2
+        qs = self.sheets.worksheet(spreadsheet_name, 'Quotes')
 
         quotes = db_session.query(models.Quote).all()
 
-        cells = qs.range(f'A2:B{len(quotes)+11}')
-        for cell in cells:
-            cell.value = ''
-        qs.update_cells(cells)
-
-        cells = qs.range(f'A2:B{len(quotes)+1}')
-        for index, quote_obj in enumerate(quotes):
-            human_readable_index_cell_index = index * worksheet_width
-            quote_cell_index = human_readable_index_cell_index + 1
-
-            cells[human_readable_index_cell_index].value = index + 1
-            cells[quote_cell_index].value = quote_obj.quote
-        qs.update_cells(cells)
+        sync = sheet_sync.SheetSync(qs, db_session, f'{spreadsheet_name}/Quotes')
+        sync.add_row('A', QUOTE_SHEET_HEADERS)
+        sync.add_table('A', 2, [[index + 1, quote_obj.quote] for index, quote_obj in enumerate(quotes)])
+        sync.push()
 
         db_session.commit()
         db_session.close()
 
     @utils.mod_only
-    def update_quote_db_from_spreadsheet(self, db_session):
+    def update_quote_db_from_spreadsheet(self):
         """
-        Updates the database from the quote spreadsheet.
-        Only call directly if you really need to as the bot
-        won't be able to do anything else while updating.
-        This function will stop looking for quotes when it
+        Replaces the quotes in the database with the ones in the quote spreadsheet.
+        This happens in the background, the bot says in chat how it's going.
+        It will stop looking for quotes when it
         finds an empty row in the spreadsheet.
 
         !update_quote_db_from_spreadsheet
         """
+        utils.add_to_public_chat_queue(self, 'Importing quotes from the spreadsheet.')
+        utils.add_to_command_queue(self, '_import_quotes_from_spreadsheet')
+
+    @utils.retry_gspread_func
+    @utils.requires_sheets
+    @utils.uses_spreadsheet('quotes')
+    def _import_quotes_from_spreadsheet(self):
+        """
+        Reads the whole quote column in one request and swaps it in for the QUOTES table.
+        The delete and all the inserts are one transaction, so anything reading quotes
+        in the meantime sees either all of the old ones or all of the new ones.
+        """
         spreadsheet_name, web_view_link = self.spreadsheets['quotes']
-        gc = gspread.authorize(self.credentials)
-        sheet = gc.open(spreadsheet_name)
-        qs = sheet.worksheet('Quotes')
-        cell_location = [2, 2]
-        quotes_list = []
-        while True:
-            if bool(qs.cell(*cell_location).value) is not False:
-                quotes_list.append(models.Quote(quote=qs.cell(*cell_location).value))
-                cell_location[0] += 1
-            else:
+        qs = self.sheets.worksheet(spreadsheet_name, 'Quotes')
+        quotes = []
+        # Row 1 is the header
+        for value in qs.col_values(2)[1:]:
+            if not value:
                 break
+            quotes.append(value)
 
-        db_session.execute(
-            "DELETE FROM QUOTES;"
-        )
-        db_session.add_all(quotes_list)
+        db_session = self.Session()
+        try:
+            db_session.execute(models.Quote.__table__.delete())
+            for start in range(0, len(quotes), QUOTE_IMPORT_BATCH_SIZE):
+                batch = quotes[start:start + QUOTE_IMPORT_BATCH_SIZE]
+                db_session.execute(models.Quote.__table__.insert(), [{'quote': quote} for quote in batch])
+                imported = start + len(batch)
+                passed_interval = imported // QUOTE_IMPORT_PROGRESS_INTERVAL > start // QUOTE_IMPORT_PROGRESS_INTERVAL
+                if passed_interval and imported < len(quotes):
+                    utils.add_to_public_chat_queue(self, f'Imported {imported} of {len(quotes)} quotes.')
+            # Whatever's in the sheet now isn't what we last pushed to it
+            sheet_sync.forget_sheet(db_session, f'{spreadsheet_name}/Quotes')
+            db_session.commit()
+        except Exception:
+            db_session.rollback()
+            raise
+        finally:
+            db_session.close()
+
+        utils.add_to_public_chat_queue(self, f'Imported {len(quotes)} quotes from the spreadsheet.')
+        # Renumbers the index column to match
+        utils.add_to_command_queue(self, 'update_quote_spreadsheet')
 
     def add_quote(self, message, db_session):
         """
@@ -138,6 +152,7 @@ class QuotesMixin:
             response_str = self._delete_quote(db_session, quote_id)
             utils.add_to_appropriate_chat_queue(self, message, response_str)
 
+    @utils.requires_sheets
     def show_quotes(self, message):
         """
         Links to the google spreadsheet containing all the quotes.
@@ -145,7 +160,7 @@ class QuotesMixin:
         !show_quotes
         """
         web_view_link = self.spreadsheets['quotes'][1]
-        short_url = self.shortener.short(web_view_link)
+        short_url = utils.short_link(self, web_view_link)
         utils.add_to_appropriate_chat_queue(self, message, 'View the quotes at: {}'.format(short_url))
 
     def quote(self, message, db_session):
@@ -1,16 +1,13 @@
 from __future__ import print_function
-import httplib2
 import os
 
-from apiclient import discovery
-import oauth2client
-from oauth2client import client
-from oauth2client import tools
+# The google client libraries are slow to import, so each function imports what it needs when it's first called.
 
 # If modifying these scopes, delete your previously saved credentials
 SCOPES = 'https://www.googleapis.com/auth/drive.file https://spreadsheets.google.com/feeds'
 CLIENT_SECRET_FILE = 'client_secret.json'
 APPLICATION_NAME = 'n0tb0t'
+SPREADSHEET_MIME_TYPE = 'application/vnd.google-apps.spreadsheet'
 
 
 def get_credentials(credentials_parent_dir, client_secret_dir=None):
@@ -28,7 +25,11 @@ def get_credentials(credentials_parent_dir, client_secret_dir=None):
     credential_path = os.path.join(credential_dir,
                                    'n0tb0t-credentials.json')
 
-    store = oauth2client.file.Storage(credential_path)
+    from oauth2client import client
+    from oauth2client import file
+    from oauth2client import tools
+
+    store = file.Storage(credential_path)
     credentials = store.get()
     if not credentials or credentials.invalid:
         if client_secret_dir is not None:
@@ -42,54 +43,93 @@ def get_credentials(credentials_parent_dir, client_secret_dir=None):
     return credentials
 
 
-def ensure_file_exists(credentials, filename):
+def authorized_http(credentials):
+    """
+    httplib2.Http objects can't be used from more than one thread at a time, so every request gets its own.
+    """
+    import httplib2
+    return credentials.authorize(httplib2.Http())
+
+
+def build_drive_service(credentials):
+    """
+    Builds a drive client that can be shared between threads,
+    as long as each request is executed with its own http from authorized_http.
+    Building one fetches the discovery document, so it's worth only doing once.
+    """
+    from apiclient import discovery
+    return discovery.build('drive', 'v3', http=authorized_http(credentials))
+
+
+def find_file(credentials, service, filename):
+    """
+    Returns the id of the spreadsheet in the user's drive with this name that isn't in the bin, or None.
+    Drive does the searching, but there can still be more than one page of results to look through.
+    """
+    escaped_name = filename.replace('\\', '\\\\').replace("'", "\\'")
+    query = f"name = '{escaped_name}' and mimeType = '{SPREADSHEET_MIME_TYPE}' and trashed = false"
+    page_token = None
+    while True:
+        request = service.files().list(q=query, spaces='drive', pageSize=100, pageToken=page_token,
+                                       fields='nextPageToken, files(id, name)')
+        results = request.execute(http=authorized_http(credentials))
+        for item in results.get('files', []):
+            if item['name'] == filename:
+                return item['id']
+        page_token = results.get('nextPageToken')
+        if page_token is None:
+            return None
+
+
+def file_is_usable(credentials, service, file_id, filename):
+    """
+    Checks a file id we found before still points at the spreadsheet we expect.
+    """
+    from apiclient import errors
+    try:
+        item = service.files().get(fileId=file_id, fields='id, name, trashed').execute(
+            http=authorized_http(credentials))
+    except errors.HttpError as e:
+        if e.resp.status == 404:
+            return False
+        raise
+    return item['name'] == filename and not item['trashed']
+
+
+def ensure_file_exists(credentials, filename, service=None, known_file_id=None):
     """
     Checks to see if a file exists in a users google drive.
     If it doesn't exist, creates the file.
+    Returns whether it already existed and its id.
 
-    Only checks the first thousand files,
-    because I don't want to mess with next page tokens.
+    If we already know the file's id, that's checked first, which is a single small request.
+    Pass in a service from build_drive_service when looking up several files.
     """
-    http = credentials.authorize(httplib2.Http())
-    service = discovery.build('drive', 'v3', http=http)
-
-    results = service.files().list(
-        pageSize=1000, fields="nextPageToken, files(id, name, trashed)").execute()
-    items = results.get('files', [])
-    found = False
-    if not items:
-        print('No files found.')
-    else:
-        for item in items:
-            if item["name"] == filename and item["trashed"] is False:
-                file_id = item["id"]
-                found = True
-                print("Found: {}".format(filename))
-                break
-
-    if not found:
-        print("Creating: {}".format(filename))
-        files_body = {
-          'mimeType': 'application/vnd.google-apps.spreadsheet',
-          'name': filename,
-        }
-        service.files().create(body=files_body).execute(http=http)
-
-        results = service.files().list(
-                pageSize=1000, fields="nextPageToken, files(id, name)").execute()
-        items = results.get('files', [])
-        for item in items:
-            if item["name"] == filename:
-                file_id = item["id"]
-                print("Found: {}".format(filename))
-                break
-        permissions_body = {
-            'role': 'reader',
-            'type': 'anyone'
-        }
-        service.permissions().create(fileId=file_id, body=permissions_body).execute(http=http)
-
-    return found, file_id
+    if service is None:
+        service = build_drive_service(credentials)
+
+    if known_file_id is not None and file_is_usable(credentials, service, known_file_id, filename):
+        return True, known_file_id
+
+    file_id = find_file(credentials, service, filename)
+    if file_id is not None:
+        print("Found: {}".format(filename))
+        return True, file_id
+
+    print("Creating: {}".format(filename))
+    files_body = {
+      'mimeType': SPREADSHEET_MIME_TYPE,
+      'name': filename,
+    }
+    created = service.files().create(body=files_body, fields='id').execute(http=authorized_http(credentials))
+    file_id = created['id']
+    permissions_body = {
+        'role': 'reader',
+        'type': 'anyone'
+    }
+    service.permissions().create(fileId=file_id, body=permissions_body).execute(http=authorized_http(credentials))
+
+    return False, file_id
 
 if __name__ == '__main__':
     from inspect import getsourcefile
@@ -0,0 +1,141 @@
+import codecs
+
+
+class LineFramer(object):
+    """
+    Turns the raw bytes coming off the socket into complete IRC lines.
+
+    A recv call can end halfway through a line (or halfway through a multi-byte character),
+    so anything after the last line ending is held onto until the next read finishes it.
+    Decoding is incremental and replaces undecodable bytes, so one bad byte
+    only costs us that character instead of the whole buffer.
+    """
+    def __init__(self, encoding='utf-8'):
+        self.encoding = encoding
+        self._decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+        self._tail = ''
+
+    def feed(self, data):
+        """
+        Takes the bytes from a single read.
+        Returns a list of every line those bytes completed, in the order they arrived.
+        Line endings are stripped and blank lines are skipped.
+        """
+        text = self._tail + self._decoder.decode(data)
+        *lines, self._tail = text.split('\n')
+        return [line.rstrip('\r') for line in lines if line.rstrip('\r')]
+
+    @property
+    def pending(self):
+        """
+        The partial line currently waiting for the rest of its bytes.
+        """
+        return self._tail
+
+    def reset(self):
+        """
+        Throws away any partial line.
+        Call this after reconnecting, the rest of that line is never coming.
+        """
+        self._decoder.reset()
+        self._tail = ''
+
+
+_TAG_ESCAPES = {':': ';', 's': ' ', '\\': '\\', 'r': '\r', 'n': '\n'}
+
+
+def unescape_tag_value(value):
+    """
+    Undoes the IRCv3 escaping on a tag value. \\: is a semicolon and \\s is a space.
+    """
+    if '\\' not in value:
+        return value
+    unescaped = []
+    chars = iter(value)
+    for char in chars:
+        if char == '\\':
+            escaped = next(chars, '')
+            unescaped.append(_TAG_ESCAPES.get(escaped, escaped))
+        else:
+            unescaped.append(char)
+    return ''.join(unescaped)
+
+
+class ParsedLine(object):
+    """
+    One IRC line split into its parts:
+
+    @tags :prefix COMMAND param param :trailing
+
+    The tag block is only split up the first time a tag is asked for,
+    and each value is only unescaped when it's read.
+    """
+    __slots__ = ('raw', 'prefix', 'command', 'params', 'trailing', '_raw_tags', '_tags')
+
+    def __init__(self, raw, raw_tags, prefix, command, params, trailing):
+        self.raw = raw
+        self._raw_tags = raw_tags
+        self._tags = None
+        self.prefix = prefix
+        self.command = command
+        self.params = params
+        self.trailing = trailing
+
+    @property
+    def tags(self):
+        """
+        A dictionary of the raw, still escaped tag values.
+        """
+        if self._tags is None:
+            self._tags = {}
+            if self._raw_tags:
+                for tag in self._raw_tags.split(';'):
+                    key, _, value = tag.partition('=')
+                    self._tags[key] = value
+        return self._tags
+
+    def get_tag(self, key, default=None):
+        value = self.tags.get(key)
+        if value is None:
+            return default
+        return unescape_tag_value(value)
+
+    @property
+    def nick(self):
+        """
+        The login name from a nick!user@host prefix.
+        """
+        return self.prefix.partition('!')[0]
+
+    @property
+    def channel(self):
+        """
+        The channel the line was sent to without the #, if it was sent to one.
+        """
+        if self.params and self.params[0][:1] == '#':
+            return self.params[0][1:]
+        return None
+
+
+def parse_line(line):
+    """
+    Takes a twitch IRC line and splits it into a ParsedLine in a single pass.
+    Nothing in the message text can be mistaken for a tag, because the tags are
+    only ever read from the block in front of the prefix.
+    """
+    rest = line
+    raw_tags = ''
+    if rest[:1] == '@':
+        raw_tags, _, rest = rest[1:].partition(' ')
+    prefix = ''
+    if rest[:1] == ':':
+        prefix, _, rest = rest[1:].partition(' ')
+    if rest[:1] == ':':
+        rest, trailing = '', rest[1:]
+    else:
+        rest, separator, trailing = rest.partition(' :')
+        if not separator:
+            trailing = None
+    params = rest.split()
+    command = params.pop(0) if params else ''
+    return ParsedLine(line, raw_tags, prefix, command, params, trailing)
@@ -58,3 +58,14 @@ class Permission(Base):
     id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True)
     command_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey(Command.id))
     user_entity = sqlalchemy.Column(sqlalchemy.String)
+
+
+class SheetRow(Base):
+    """
+    A hash of a row the bot last wrote to a google sheet, see src/sheet_sync.py
+    """
+    __tablename__ = 'SHEET-ROWS'
+    id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True)
+    table_key = sqlalchemy.Column(sqlalchemy.String, index=True)
+    row = sqlalchemy.Column(sqlalchemy.Integer)
+    row_hash = sqlalchemy.Column(sqlalchemy.String)
@@ -0,0 +1,167 @@
+import collections
+import threading
+import time
+from enum import Enum, auto
+
+# Twitch won't send a chat message over 500 characters. Counting bytes instead
+# keeps us under that whatever the message is written in.
+MAX_MESSAGE_BYTES = 500
+
+# Joins short messages that go out together as one
+COALESCE_SEPARATOR = ' | '
+
+# Messages starting with these are commands, for twitch or for other bots,
+# and only work if they're the whole message
+COMMAND_PREFIXES = ('/', '!', '.')
+
+
+def byte_length(content):
+    return len(content.encode('utf-8'))
+
+
+def truncate_to_bytes(content, max_bytes):
+    """
+    The longest start of content that fits in max_bytes without cutting a character in half.
+    """
+    return content.encode('utf-8')[:max_bytes].decode('utf-8', errors='ignore')
+
+
+def split_message(content, max_bytes=MAX_MESSAGE_BYTES):
+    """
+    Splits content into as few messages as possible that each fit in max_bytes,
+    breaking between words. A single word too long for a message on its own is broken wherever it has to be.
+    """
+    if byte_length(content) <= max_bytes:
+        return [content]
+    parts = []
+    current = ''
+    for word in content.split():
+        candidate = f'{current} {word}' if current else word
+        if byte_length(candidate) <= max_bytes:
+            current = candidate
+            continue
+        if current:
+            parts.append(current)
+        while byte_length(word) > max_bytes:
+            head = truncate_to_bytes(word, max_bytes)
+            parts.append(head)
+            word = word[len(head):]
+        current = word
+    if current:
+        parts.append(current)
+    return parts
+
+
+def can_coalesce(content):
+    return not content.startswith(COMMAND_PREFIXES)
+
+
+def next_chat_messages(queue, max_bytes=MAX_MESSAGE_BYTES, separator=COALESCE_SEPARATOR):
+    """
+    Takes the next message off the chat queue and returns what to send for it.
+
+    A message that's too long comes back split into several.
+    A short one takes as many of the messages queued up behind it as still fit along with it,
+    so a busy chat gets the same replies in fewer messages and fewer rate limit slots.
+    """
+    first = queue.pop()
+    if byte_length(first) > max_bytes:
+        return split_message(first, max_bytes)
+    if not can_coalesce(first):
+        return [first]
+
+    merged = [first]
+    length = byte_length(first)
+    separator_length = byte_length(separator)
+
+    def fits(following):
+        return can_coalesce(following) and length + separator_length + byte_length(following) <= max_bytes
+
+    while True:
+        following = queue.pop_if(fits)
+        if following is None:
+            break
+        merged.append(following)
+        length += separator_length + byte_length(following)
+    return [separator.join(merged)]
+
+
+class DuplicatePolicy(Enum):
+    DROP = auto()
+    VARY = auto()
+    DELAY = auto()
+
+
+# Twitch ignores this character when showing a message, but not when checking for duplicates
+INVISIBLE_VARIATION = '\U000E0000'
+
+
+class DuplicateFilter(object):
+    """
+    Twitch silently drops a message that's identical to one sent to the same channel
+    in the last 30 seconds, after it's already used up a rate limit slot.
+    This remembers what was sent where and when, so a duplicate can be caught before it's sent and either
+    dropped, made different with an invisible character, or held back until twitch will take it.
+    """
+    def __init__(self, window=30, policy=DuplicatePolicy.VARY):
+        self.window = window
+        self.policy = policy
+        self.lock = threading.Lock()
+        # (channel, content) -> when it was last sent, oldest first
+        self.sent = collections.OrderedDict()
+        self.counts = collections.Counter()
+
+    def _forget_old(self, now):
+        while self.sent:
+            key, sent_at = next(iter(self.sent.items()))
+            if now - sent_at < self.window:
+                break
+            del self.sent[key]
+
+    def _record(self, channel, content, now):
+        key = (channel, content)
+        self.sent.pop(key, None)
+        self.sent[key] = now
+
+    def check(self, channel, content):
+        """
+        Decides what to do with a message about to be sent to a channel.
+        Returns the content to send, or None if it should be dropped,
+        and how many seconds to wait before sending it.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self._forget_old(now)
+            if (channel, content) not in self.sent:
+                self._record(channel, content, now)
+                return content, 0
+            self.counts['duplicates'] += 1
+            if self.policy == DuplicatePolicy.DROP:
+                self.counts['dropped'] += 1
+                return None, 0
+            elif self.policy == DuplicatePolicy.DELAY:
+                self.counts['delayed'] += 1
+                return content, self.window - (now - self.sent[(channel, content)])
+            else:
+                variations = 1
+                while (channel, f'{content} {INVISIBLE_VARIATION * variations}') in self.sent:
+                    variations += 1
+                varied = f'{content} {INVISIBLE_VARIATION * variations}'
+                if byte_length(varied) > MAX_MESSAGE_BYTES:
+                    self.counts['dropped'] += 1
+                    return None, 0
+                self.counts['varied'] += 1
+                self._record(channel, varied, now)
+                return varied, 0
+
+    def stats(self):
+        """
+        Every dropped duplicate is a rate limit slot twitch would have taken for a message nobody saw.
+        Varied and delayed ones are still sent, so they still use a slot.
+        """
+        return {'duplicates': self.counts['duplicates'],
+                'dropped': self.counts['dropped'],
+                'varied': self.counts['varied'],
+                'delayed': self.counts['delayed'],
+                'wasted_sends_avoided': self.counts['dropped'],
+                'remembered': len(self.sent)}
@@ -0,0 +1,53 @@
+import importlib
+import time
+
+# Every plugin a channel can turn on, and where its mixin lives.
+# Streamer specific modules go in here too, with 'src.streamer_specific_modules.<module>:<Mixin>'.
+# Nothing listed here is imported until a channel that enables it starts up.
+PLUGINS = {
+    'auto_quotes': 'src.core_modules.auto_quotes:AutoQuoteMixin',
+    'chatter_select': 'src.core_modules.chatter_select:ChatterSelectionMixin',
+    'commands': 'src.core_modules.commands:CommandsMixin',
+    'death_guessing': 'src.core_modules.death_guessing:DeathGuessingMixin',
+    'following': 'src.core_modules.following:FollowingMixin',
+    'keyboard_listener': 'src.core_modules.keyboard_listener:KeyboardListenerMixin',
+    'quotes': 'src.core_modules.quotes:QuotesMixin',
+    'shout_out': 'src.core_modules.shout_out:ShoutOutMixin',
+    'uptime': 'src.core_modules.uptime:UptimeMixin',
+}
+
+# The plugins that keep a google sheet, they need google credentials and the gspread libraries
+SHEETS_PLUGINS = {'auto_quotes', 'commands', 'death_guessing', 'quotes'}
+
+# plugin name -> seconds it took to import, for the ones that have been
+load_timings = {}
+
+
+def enabled_plugins(channel, default_plugins, channel_plugins):
+    """
+    The plugins a channel should get: its own list from channel_plugins if it has one, otherwise default_plugins.
+    Raises ValueError for a plugin that isn't in PLUGINS.
+    """
+    plugins = channel_plugins.get(channel.lower(), channel_plugins.get(channel, default_plugins))
+    unknown = [name for name in plugins if name not in PLUGINS]
+    if unknown:
+        raise ValueError(f'Unknown plugins for {channel}: {", ".join(unknown)}. '
+                         f'The available ones are {", ".join(sorted(PLUGINS))}')
+    # Duplicates would put the same mixin in the class twice
+    return list(dict.fromkeys(plugins))
+
+
+def uses_sheets(plugin_names):
+    return any(name in SHEETS_PLUGINS for name in plugin_names)
+
+
+def load_plugin(name):
+    """
+    Imports a plugin's module, if it hasn't been already, and returns its mixin class.
+    """
+    module_name, class_name = PLUGINS[name].split(':')
+    started = time.monotonic()
+    module = importlib.import_module(module_name)
+    if name not in load_timings:
+        load_timings[name] = time.monotonic() - started
+    return getattr(module, class_name)
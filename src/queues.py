@@ -0,0 +1,208 @@
+import collections
+import threading
+import time
+from enum import IntEnum
+
+
+class WaitableDeque(collections.deque):
+    """
+    The deque the bot's queues have always been, plus a way for the thread
+    draining it to sleep until something arrives instead of polling.
+
+    Items still go in with appendleft and come out with pop, oldest first.
+    It also keeps track of how deep it is and how long items sat in it.
+    """
+    def __init__(self, iterable=(), maxlen=None, recent_waits=100):
+        collections.deque.__init__(self, iterable, maxlen)
+        self.condition = threading.Condition()
+        # When each item still in the deque was added, in the same order as the items
+        self._added_at = collections.deque(time.monotonic() for _ in self)
+        self.recent_waits = collections.deque(maxlen=recent_waits)
+        self.added = 0
+        self.removed = 0
+        self.max_depth = len(self)
+
+    def appendleft(self, item):
+        with self.condition:
+            collections.deque.appendleft(self, item)
+            self._added_at.appendleft(time.monotonic())
+            self.added += 1
+            self.max_depth = max(self.max_depth, len(self))
+            self.condition.notify()
+
+    def pop(self):
+        with self.condition:
+            item = collections.deque.pop(self)
+            if self._added_at:
+                self.recent_waits.append(time.monotonic() - self._added_at.pop())
+            self.removed += 1
+            return item
+
+    def clear(self):
+        with self.condition:
+            collections.deque.clear(self)
+            self._added_at.clear()
+
+    def peek(self):
+        """
+        The item pop would return next, without taking it.
+        """
+        return self[-1]
+
+    def pop_if(self, predicate):
+        """
+        Pops the next item if there is one and predicate(item) is true, otherwise returns None.
+        Nothing can jump in between the check and the pop.
+        """
+        with self.condition:
+            if len(self) and predicate(self.peek()):
+                return self.pop()
+            return None
+
+    def wait(self, timeout=None):
+        """
+        Blocks until there's something to pop or timeout seconds pass.
+        Returns whether there's something to pop.
+        """
+        with self.condition:
+            return self.condition.wait_for(lambda: len(self) > 0, timeout)
+
+    def stats(self):
+        waits = list(self.recent_waits)
+        return {'depth': len(self),
+                'max_depth': self.max_depth,
+                'added': self.added,
+                'removed': self.removed,
+                'mean_wait_ms': sum(waits) / len(waits) * 1000 if waits else 0.0,
+                'max_wait_ms': max(waits) * 1000 if waits else 0.0}
+
+
+class Priority(IntEnum):
+    """
+    Lower goes out first.
+    """
+    MODERATION = 0
+    REPLY = 1
+    ANNOUNCEMENT = 2
+
+
+# Chat commands that act on the channel rather than talk in it
+MODERATION_PREFIXES = ('/timeout', '/ban', '/unban', '/untimeout', '/delete', '/clear', '/slow', '/slowoff',
+                       '/followers', '/subscribers', '/emoteonly', '/r9kbeta')
+
+# How many seconds something can wait in the chat queue before it isn't worth saying any more. None is forever.
+DEFAULT_EXPIRY = {
+    Priority.MODERATION: None,
+    Priority.REPLY: 300,
+    Priority.ANNOUNCEMENT: 60,
+}
+
+
+class OutboundMessage(str):
+    """
+    A chat message that knows how urgent it is and who it's for.
+    It's still a str, so everything that just wants the text can ignore the rest.
+    """
+    def __new__(cls, content, priority=Priority.REPLY, user=None):
+        message = str.__new__(cls, content)
+        if content.startswith(MODERATION_PREFIXES):
+            priority = Priority.MODERATION
+        message.priority = priority
+        message.user = user
+        return message
+
+
+class PriorityMessageQueue(WaitableDeque):
+    """
+    The public chat queue, but pop hands out the most urgent message instead of the oldest.
+
+    Within a priority, users take turns, so one person spamming a command can't push
+    everyone else's replies back. Messages that have waited longer than their priority's
+    expiry are thrown away rather than said late.
+    Plain strings are treated as replies that aren't for anyone in particular.
+    """
+    def __init__(self, iterable=(), maxlen=None, recent_waits=100, expiry=None):
+        WaitableDeque.__init__(self, iterable, maxlen, recent_waits)
+        self.expiry = dict(DEFAULT_EXPIRY)
+        self.expiry.update(expiry or {})
+        # user -> (serve count, time) when they were last served, so the one who's waited longest goes next.
+        # Least recently served first. Anyone not served for longer than the longest expiry is forgotten,
+        # they'd have gone to the front anyway.
+        self.last_served = collections.OrderedDict()
+        self.forget_served_after = max([expiry for expiry in self.expiry.values() if expiry is not None] + [0])
+        self.serve_count = 0
+        self.expired = collections.Counter()
+
+    def _remove_expired(self, now):
+        for index in range(len(self) - 1, -1, -1):
+            priority = getattr(self[index], 'priority', Priority.REPLY)
+            expiry = self.expiry.get(priority)
+            if expiry is not None and now - self._added_at[index] > expiry:
+                del self[index]
+                del self._added_at[index]
+                self.expired[priority.name] += 1
+
+    def _next_index(self):
+        best_index, best_key = None, None
+        # Oldest first, so ties go to whatever has been waiting longest
+        for index in range(len(self) - 1, -1, -1):
+            message = self[index]
+            priority = getattr(message, 'priority', Priority.REPLY)
+            key = (priority, self.last_served.get(getattr(message, 'user', None), (-1,))[0])
+            if best_key is None or key < best_key:
+                best_index, best_key = index, key
+        return best_index
+
+    def peek(self):
+        with self.condition:
+            return self[self._next_index()]
+
+    def pop(self):
+        with self.condition:
+            if not len(self):
+                raise IndexError('pop from an empty deque')
+            index = self._next_index()
+            message = self[index]
+            del self[index]
+            self.recent_waits.append(time.monotonic() - self._added_at[index])
+            del self._added_at[index]
+            self.removed += 1
+            self.serve_count += 1
+            now = time.monotonic()
+            user = getattr(message, 'user', None)
+            if user is not None:
+                self.last_served.pop(user, None)
+                self.last_served[user] = (self.serve_count, now)
+            self._forget_old_users(now)
+            return message
+
+    def _forget_old_users(self, now):
+        while self.last_served:
+            user, (serve_count, served_at) = next(iter(self.last_served.items()))
+            if now - served_at <= self.forget_served_after:
+                break
+            del self.last_served[user]
+
+    def wait(self, timeout=None):
+        """
+        Throws away anything that's gone stale, then blocks until
+        there's something worth popping or timeout seconds pass.
+        Returns whether there's something to pop.
+        """
+        with self.condition:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while True:
+                now = time.monotonic()
+                self._remove_expired(now)
+                if len(self):
+                    return True
+                if deadline is not None and now >= deadline:
+                    return False
+                self.condition.wait(None if deadline is None else deadline - now)
+
+    def stats(self):
+        stats = WaitableDeque.stats(self)
+        depths = collections.Counter(getattr(message, 'priority', Priority.REPLY).name for message in list(self))
+        stats['depth_by_priority'] = dict(depths)
+        stats['expired'] = dict(self.expired)
+        return stats
@@ -0,0 +1,233 @@
+import re
+import threading
+import time
+
+
+class TokenBucket(object):
+    """
+    Holds up to capacity tokens and gains rate of them every second.
+    Sending something costs a token.
+    """
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    @classmethod
+    def for_window(cls, limit, period, burst, share=1):
+        """
+        A bucket that can never let more than limit sends through in any period seconds.
+        A full bucket lets burst of them out at once and refills with the rest of the limit
+        over the period, so even a burst straight after a quiet spell stays under it.
+        With share, this bucket gets 1/share of the limit, for when several processes send on one account.
+        It always holds at least one token, or it could never send anything. A limit too small to give
+        every share a whole send per period can't be split exactly, the bucket just keeps to its share on average.
+        """
+        limit = limit / share
+        capacity = max(1.0, burst / share)
+        if limit > capacity:
+            return cls(rate=(limit - capacity) / period, capacity=capacity)
+        return cls(rate=limit / period, capacity=capacity)
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now):
+        """
+        Seconds until there's a whole token to spend.
+        """
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def spend(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+    def empty(self, now):
+        self._refill(now)
+        self.tokens = min(self.tokens, 0)
+
+
+# limit class -> (messages, per this many seconds, how many of them can go out at once)
+# These are twitch's published limits for accounts that aren't known bots.
+RATE_LIMITS = {
+    'user': (20, 30, 10),
+    'moderator': (100, 30, 50),
+    'whisper_second': (3, 1, 1),
+    'whisper_minute': (100, 60, 50),
+}
+
+# Twitch drops a message from someone who isn't a moderator if it comes less than a second after their last one.
+USER_MESSAGE_INTERVAL = 1.0
+
+
+class RateLimiter(object):
+    """
+    Decides when the bot can next send something without twitch dropping it.
+
+    The chat limits are for the whole account. Messages in a channel where the bot is a
+    moderator (or the broadcaster) count against the moderator limit, everything else also
+    counts against the much lower user limit. Channels where the bot isn't a moderator get
+    a minimum gap between messages, which slow mode can make longer.
+
+    When twitch says we're sending too quickly anyway, the channel is paused,
+    for longer each time it happens again soon after.
+
+    When the account's channels are split across several processes each one has its own limiter,
+    so each gets 1/share of every limit.
+    """
+    def __init__(self, rate_limits=None, min_ratelimit_pause=5.0, max_ratelimit_pause=120.0, share=1):
+        rate_limits = rate_limits or RATE_LIMITS
+        self.share = share
+        self.buckets = {limit_class: TokenBucket.for_window(*limits, share=share)
+                        for limit_class, limits in rate_limits.items()}
+        self.lock = threading.Lock()
+        self.moderator_channels = set()
+        # channel -> seconds of slow mode
+        self.slow_mode = {}
+        # channel -> when the last message was sent there
+        self.last_sent = {}
+        # channel -> nothing more is sent there until this time
+        self.paused_until = {}
+        self.min_ratelimit_pause = min_ratelimit_pause
+        self.max_ratelimit_pause = max_ratelimit_pause
+        # channel -> (how long the last pause was, when it ended)
+        self.last_pause = {}
+        self.waited = 0.0
+        self.ratelimit_notices = 0
+
+    def _chat_buckets(self, channel):
+        if channel in self.moderator_channels:
+            return [self.buckets['moderator']]
+        return [self.buckets['moderator'], self.buckets['user']]
+
+    def _chat_wait_time(self, channel, now):
+        wait_time = max([bucket.wait_time(now) for bucket in self._chat_buckets(channel)] +
+                        [self.paused_until.get(channel, 0) - now])
+        if channel not in self.moderator_channels and channel in self.last_sent:
+            interval = max(USER_MESSAGE_INTERVAL, self.slow_mode.get(channel, 0))
+            wait_time = max(wait_time, self.last_sent[channel] + interval - now)
+        return wait_time
+
+    def _whisper_wait_time(self, now):
+        return max(self.buckets['whisper_second'].wait_time(now), self.buckets['whisper_minute'].wait_time(now))
+
+    def _acquire(self, wait_time_function, spend_function):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                wait_time = wait_time_function(now)
+                if wait_time <= 0:
+                    spend_function(now)
+                    return
+                self.waited += wait_time
+            time.sleep(wait_time)
+
+    def _spend_chat(self, channel, now):
+        for bucket in self._chat_buckets(channel):
+            bucket.spend(now)
+        self.last_sent[channel] = now
+
+    def _spend_whisper(self, now):
+        self.buckets['whisper_second'].spend(now)
+        self.buckets['whisper_minute'].spend(now)
+
+    def acquire_chat(self, channel):
+        """
+        Blocks until a message can be sent to the channel, then counts it as sent.
+        """
+        self._acquire(lambda now: self._chat_wait_time(channel, now), lambda now: self._spend_chat(channel, now))
+
+    def acquire_whisper(self):
+        """
+        Blocks until a whisper can be sent, then counts it as sent.
+        """
+        self._acquire(self._whisper_wait_time, self._spend_whisper)
+
+    def next_chat_time(self, channel, now):
+        """
+        For replays, which don't wait. Counts a message to the channel as sent at the
+        first time from now that it could be, and returns that time.
+        Calls have to come in order of now, the buckets can't go back in time.
+        """
+        with self.lock:
+            send_time = now + max(0.0, self._chat_wait_time(channel, now))
+            self._spend_chat(channel, send_time)
+            return send_time
+
+    def next_whisper_time(self, now):
+        """
+        Like next_chat_time, for whispers.
+        """
+        with self.lock:
+            send_time = now + max(0.0, self._whisper_wait_time(now))
+            self._spend_whisper(send_time)
+            return send_time
+
+    def set_moderator(self, channel, is_moderator):
+        with self.lock:
+            if is_moderator:
+                self.moderator_channels.add(channel)
+            else:
+                self.moderator_channels.discard(channel)
+
+    def set_slow_mode(self, channel, seconds):
+        with self.lock:
+            self.slow_mode[channel] = seconds
+
+    def pause(self, channel, seconds):
+        with self.lock:
+            now = time.monotonic()
+            self.paused_until[channel] = max(self.paused_until.get(channel, 0), now + seconds)
+
+    def ratelimited(self, channel):
+        """
+        Twitch dropped a message for coming too quickly.
+        Stops sending to the channel for a while and spends every token we thought we had.
+        The pause doubles if the last one ended less than a minute ago.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.ratelimit_notices += 1
+            last_pause, last_pause_end = self.last_pause.get(channel, (0, 0))
+            if now - last_pause_end < 60:
+                pause = min(self.max_ratelimit_pause, max(self.min_ratelimit_pause, last_pause * 2))
+            else:
+                pause = self.min_ratelimit_pause
+            self.paused_until[channel] = now + pause
+            self.last_pause[channel] = (pause, now + pause)
+            for bucket in self._chat_buckets(channel):
+                bucket.empty(now)
+        return pause
+
+    def handle_notice(self, channel, notice_id, content):
+        """
+        Takes the msg-id and text of a NOTICE twitch sent to a channel
+        and adjusts the limits if it's about sending too much.
+        Returns how many seconds the channel was paused for, or None.
+        """
+        if notice_id == 'msg_ratelimit':
+            return self.ratelimited(channel)
+        elif notice_id == 'msg_slowmode':
+            # "This room is in slow mode and you may send again in 12 seconds."
+            match = re.search(r'(\d+) seconds?', content or '')
+            seconds = int(match.group(1)) if match else self.slow_mode.get(channel, self.min_ratelimit_pause)
+            self.pause(channel, seconds)
+            return seconds
+        elif notice_id == 'slow_on':
+            match = re.search(r'(\d+) seconds?', content or '')
+            if match:
+                self.set_slow_mode(channel, int(match.group(1)))
+        elif notice_id == 'slow_off':
+            self.set_slow_mode(channel, 0)
+        return None
+
+    def stats(self):
+        return {'moderator_channels': sorted(self.moderator_channels),
+                'slow_mode': {channel: seconds for channel, seconds in self.slow_mode.items() if seconds},
+                'ratelimit_notices': self.ratelimit_notices,
+                'seconds_waited': self.waited}
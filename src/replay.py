@@ -0,0 +1,206 @@
+import collections
+import threading
+import time
+
+from src.twitch_service import TwitchService, MessageTypes
+
+
+class OfflineCredentials(object):
+    """
+    Stands in for the google credentials in a replay, which runs with the sheets turned off.
+    """
+    access_token = 'replay'
+    access_token_expired = False
+
+
+class OfflineSheetsClient(object):
+    """
+    Stands in for SheetsClient in a replay. The bots run with the sheets turned off,
+    this makes sure nothing can reach the real spreadsheets even if something tries.
+    """
+    def _refuse(self, *args, **kwargs):
+        raise RuntimeError('Replays never touch the google sheets')
+
+    get_client = spreadsheet = worksheet = ensure_worksheet = _refuse
+
+    def invalidate(self, spreadsheet_name=None):
+        pass
+
+    def stats(self):
+        return {}
+
+
+class OfflineShortener(object):
+    def short(self, url):
+        return url
+
+
+class RecordingService(TwitchService):
+    """
+    A TwitchService that never connects to anything.
+
+    Outbound messages are recorded instead of sent and the twitch API lookups
+    return placeholders, so captured traffic can be pushed through real bots offline.
+
+    Nothing waits for the rate limiter, but every message is given the time it would have gone out
+    if it had, so held_back can say how many would still be waiting. Chat and whispers each
+    go through the limiter one at a time, which is close to, but a little stricter than, the real thing.
+    """
+    def __init__(self, user, channel, error_logger, event_logger, extra_channels=(), simulate_rate_limits=True):
+        # (time sent, channel, whisper recipient or None, content)
+        self.sent = []
+        self.simulate_rate_limits = simulate_rate_limits
+        self.send_lock = threading.Lock()
+        # When the latest chat message and whisper would have gone out, on time.monotonic's clock
+        self.chat_clock = 0.0
+        self.whisper_clock = 0.0
+        # When each message that hasn't gone out yet would, oldest first
+        self.held_back_chat = collections.deque()
+        self.held_back_whispers = collections.deque()
+        TwitchService.__init__(self, pw='',
+                               user=user,
+                               channel=channel,
+                               twitch_api_client_id='',
+                               error_logger=error_logger,
+                               event_logger=event_logger,
+                               extra_channels=extra_channels)
+
+    def _connect(self):
+        self.connected.set()
+
+    def _send_pong(self):
+        pass
+
+    def send_public_message(self, message_content, channel=None):
+        channel = channel or self.channel
+        with self.send_lock:
+            self.sent.append((time.perf_counter(), channel, None, message_content))
+            if self.simulate_rate_limits:
+                now = max(time.monotonic(), self.chat_clock)
+                self.chat_clock = self.rate_limiter.next_chat_time(channel, now)
+                self.held_back_chat.append(self.chat_clock)
+
+    def send_private_message(self, recipient, whisper_content, channel=None):
+        with self.send_lock:
+            self.sent.append((time.perf_counter(), channel or self.channel, recipient, whisper_content))
+            if self.simulate_rate_limits:
+                now = max(time.monotonic(), self.whisper_clock)
+                self.whisper_clock = self.rate_limiter.next_whisper_time(now)
+                self.held_back_whispers.append(self.whisper_clock)
+
+    def held_back(self):
+        """
+        How many of the messages sent so far the rate limiter wouldn't have let out yet.
+        """
+        with self.send_lock:
+            now = time.monotonic()
+            for send_times in [self.held_back_chat, self.held_back_whispers]:
+                while send_times and send_times[0] <= now:
+                    send_times.popleft()
+            return len(self.held_back_chat) + len(self.held_back_whispers)
+
+    def seconds_until_caught_up(self):
+        """
+        How long until the rate limiter would have let everything sent so far out.
+        """
+        with self.send_lock:
+            return max(0.0, self.chat_clock - time.monotonic(), self.whisper_clock - time.monotonic())
+
+    def _get_user_id_from_user_name(self, username):
+        return username
+
+    def get_user_creation_date(self, username):
+        return '2000-01-01'
+
+    def _get_all_users(self):
+        return {'moderators': [], 'global_mods': [], 'viewers': [], 'admins': [], 'staff': []}
+
+    def get_live_time(self):
+        raise RuntimeError("Sorry, the channel doesn't seem to be live at the moment.")
+
+    def follow_time(self, userid, username):
+        return f'{username}, you aren\'t following this channel.'
+
+    def get_channel_url_and_last_played_game(self, username):
+        return f'https://www.twitch.tv/{username}', 'a game'
+
+
+def read_capture(capture_path):
+    """
+    Yields (seconds since the epoch, line) for every line in a capture file.
+    """
+    with open(capture_path, encoding='utf-8') as f:
+        for row in f:
+            timestamp, _, line = row.rstrip('\n').partition(' ')
+            yield int(timestamp) / 1000, line
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def backlog(service, bots):
+    """
+    Messages still waiting in the bots' queues, plus the ones the rate limiter would still be holding back.
+    """
+    return (sum(len(bot.public_message_queue) + len(bot.private_message_queue) for bot in bots.values()) +
+            service.held_back())
+
+
+def replay(capture_path, service, bots, speed=None):
+    """
+    Pushes every line in the capture through the service's parser and the bots.
+    A speed of 1 keeps the original timing, 10 replays ten times faster
+    and None replays as fast as the bots can handle it.
+    Returns a dictionary of how it went.
+    """
+    handling_latencies = []
+    lines = 0
+    max_backlog = 0
+    first_timestamp = None
+    sent_before = len(service.sent)
+    start = time.perf_counter()
+
+    for timestamp, line in read_capture(capture_path):
+        if speed is not None:
+            if first_timestamp is None:
+                first_timestamp = timestamp
+            delay = start + (timestamp - first_timestamp) / speed - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+        lines += 1
+        message = service._line_to_message(line)
+        bot = service._get_bot_for_message(message, bots)
+        handle_start = time.perf_counter()
+        service._handle_message(message, bot)
+        if message.message_type in [MessageTypes.PUBLIC, MessageTypes.PRIVATE] and bot is not None:
+            handling_latencies.append(time.perf_counter() - handle_start)
+
+        max_backlog = max(max_backlog, backlog(service, bots))
+
+    elapsed = time.perf_counter() - start
+    return {
+        'lines': lines,
+        'chat_messages': len(handling_latencies),
+        'seconds': elapsed,
+        'messages_per_second': len(handling_latencies) / elapsed if elapsed > 0 else 0.0,
+        'p50_ms': percentile(handling_latencies, 0.5) * 1000,
+        'p99_ms': percentile(handling_latencies, 0.99) * 1000,
+        'max_backlog': max_backlog,
+        'final_backlog': backlog(service, bots),
+        'catch_up_seconds': service.seconds_until_caught_up(),
+        'sent': len(service.sent) - sent_before,
+    }
+
+
+def format_report(report):
+    return (f"Replayed {report['lines']} lines ({report['chat_messages']} chat messages) in {report['seconds']:.2f}s\n"
+            f"{report['messages_per_second']:.1f} messages/s, "
+            f"handling latency p50 {report['p50_ms']:.2f}ms p99 {report['p99_ms']:.2f}ms\n"
+            f"Outbound backlog, counting what the rate limits would hold back: "
+            f"max {report['max_backlog']}, at the end {report['final_backlog']}, "
+            f"{report['sent']} messages sent, the last going out {report['catch_up_seconds']:.1f}s after the end")
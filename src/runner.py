@@ -0,0 +1,78 @@
+import importlib.util
+
+import config
+import src.google_auth as google_auth
+import src.plugins as plugins
+from src.bot import bot_class
+from src.twitch_service import TwitchService
+from src.async_twitch_service import AsyncTwitchService
+from src.loggers import event_logger, error_logger
+from src.outbound import DuplicateFilter, DuplicatePolicy
+from src.sheets import SheetsClient
+
+
+def sheets_libraries_missing():
+    """
+    The google libraries the sheets need that aren't installed, checked without importing them.
+    """
+    return [name for name in ['oauth2client', 'apiclient', 'httplib2', 'gspread', 'requests'] if importlib.util.find_spec(name) is None]
+
+
+def build_service_and_bots(channels, handle_whispers=True, rate_limit_share=1):
+    """
+    Connects to twitch, joins every channel in the list
+    and builds a bot for each one.
+    rate_limit_share is how many processes are sending for the bot's account, they split its rate limits.
+    Returns the service and a dictionary of the bots keyed by channel name.
+    """
+    bot_info = config.bot_info
+    service_class = AsyncTwitchService if config.use_asyncio else TwitchService
+    ts = service_class(pw=bot_info['pw'],
+                       user=bot_info['user'],
+                       channel=channels[0],
+                       twitch_api_client_id=bot_info['twitch_api_client_id'],
+                       error_logger=error_logger,
+                       event_logger=event_logger,
+                       extra_channels=channels[1:],
+                       handle_whispers=handle_whispers,
+                       capture_path=config.capture_path or None,
+                       host=config.irc_host,
+                       port=config.irc_port,
+                       duplicate_filter=DuplicateFilter(window=config.duplicate_window,
+                                                        policy=DuplicatePolicy[config.duplicate_policy.upper()]),
+                       rate_limit_share=rate_limit_share)
+
+    channel_plugins = {channel: plugins.enabled_plugins(channel, config.plugins, config.channel_plugins)
+                       for channel in channels}
+    sheets_channels = [channel for channel in channels if plugins.uses_sheets(channel_plugins[channel])]
+    # Google is only logged into when a channel has a plugin with a sheet, and only if the libraries are there
+    credentials = None
+    sheets_client = None
+    if sheets_channels:
+        missing = sheets_libraries_missing()
+        if missing:
+            error_logger.warning(f'{", ".join(missing)} not installed, running without the spreadsheets')
+            print(f'{", ".join(missing)} not installed, running without the spreadsheets')
+            sheets_channels = []
+        else:
+            credentials = google_auth.get_credentials(credentials_parent_dir=config.current_dir,
+                                                      client_secret_dir=config.current_dir)
+            # Each spreadsheet sends one request at a time, so at most every bot's command workers
+            # and one startup thread are sending at once
+            sheets_client = SheetsClient(credentials, pool_size=config.command_workers * len(sheets_channels) + 1)
+
+    bots = {}
+    for channel in channels:
+        channel_bot_info = dict(bot_info, channel=channel)
+        channel_bot_class = bot_class(channel_plugins[channel])
+        bots[channel.lower()] = channel_bot_class(bot_info=channel_bot_info,
+                                                  service=ts.get_channel(channel),
+                                                  bitly_access_token=config.bitly_access_token,
+                                                  current_dir=config.current_dir,
+                                                  data_dir=config.data_dir,
+                                                  credentials=credentials,
+                                                  command_workers=config.command_workers,
+                                                  command_debounce=config.command_debounce,
+                                                  sheets_client=sheets_client,
+                                                  sheets_enabled=channel in sheets_channels)
+    return ts, bots
@@ -0,0 +1,264 @@
+import multiprocessing
+import multiprocessing.connection
+import os
+import threading
+import time
+
+
+def plan_shards(channel_rates, worker_count):
+    """
+    Takes a dictionary of channel name to messages per second and a number of workers.
+    Spreads the channels across the workers so their message rates are as even as possible,
+    busiest channels first, each one going to the least loaded worker.
+    Returns a list with one list of channels per worker. Some may be empty.
+    """
+    shards = [[] for _ in range(worker_count)]
+    loads = [0.0] * worker_count
+    for channel in sorted(channel_rates, key=lambda c: (-channel_rates[c], c)):
+        index = min(range(worker_count), key=lambda i: (loads[i], len(shards[i])))
+        shards[index].append(channel)
+        loads[index] += channel_rates[channel]
+    return shards
+
+
+def shard_load(shard, channel_rates):
+    return sum(channel_rates.get(channel, 0.0) for channel in shard)
+
+
+def run_worker(channels, stats_connection, handle_whispers, report_interval, rate_limit_share=1):
+    """
+    The entry point of a worker process.
+    Serves its channels exactly like run.py does and
+    reports how it's doing to the supervisor every report_interval seconds.
+    Twitch's rate limits are for the whole account, the worker gets 1/rate_limit_share of them.
+    """
+    # Imported here so the supervisor itself never has to load the bot
+    from src.runner import build_service_and_bots
+
+    ts, bots = build_service_and_bots(channels, handle_whispers=handle_whispers, rate_limit_share=rate_limit_share)
+    started = time.time()
+
+    def report():
+        while True:
+            stats = {
+                'pid': os.getpid(),
+                'uptime': time.time() - started,
+                'threads': threading.active_count(),
+                'message_counts': dict(ts.message_counts),
+                'queue_depths': {channel: len(bot.public_message_queue) + len(bot.private_message_queue)
+                                 for channel, bot in bots.items()},
+                'queue_stats': {channel: bot.queue_stats() for channel, bot in bots.items()},
+                'startup': {channel: bot.startup_timings for channel, bot in bots.items()},
+                'rate_limits': ts.rate_limiter.stats(),
+                'duplicates': ts.duplicate_filter.stats(),
+                'writes': ts.write_stats()
+            }
+            try:
+                stats_connection.send(stats)
+            except (BrokenPipeError, EOFError, OSError):
+                return
+            time.sleep(report_interval)
+
+    report_thread = threading.Thread(target=report)
+    report_thread.daemon = True
+    report_thread.start()
+    ts.run(bots)
+
+
+class Worker(object):
+    """
+    The supervisor's handle on one worker process and the last stats it sent.
+    """
+    def __init__(self, index, channels):
+        self.index = index
+        self.channels = channels
+        self.process = None
+        self.connection = None
+        self.stats = {}
+        self.restarts = 0
+        self.restart_at = None
+        # channel -> (message count, time) at the previous report, used to work out message rates
+        self.last_counts = {}
+        self.rates = {}
+
+
+class Supervisor(object):
+    """
+    Runs the channels across a pool of worker processes,
+    each with its own TwitchService and bots, so one busy or stuck channel
+    can't hold up channels in another process.
+
+    Every worker sends on the same twitch account, so each gets an equal share of its rate limits.
+    That holds however busy the worker's channels are, an idle worker's share goes unused.
+
+    Workers that die are restarted with a growing delay.
+    Every rebalance_interval seconds the supervisor looks at each channel's message rate
+    and, if moving channels around would even the load out noticeably, restarts the
+    affected workers with their new channels.
+    """
+    def __init__(self, channels, worker_count, whisper_channel=None, report_interval=10,
+                 rebalance_interval=600, rebalance_threshold=0.75):
+        self.channels = [channel.lower() for channel in channels]
+        self.worker_count = max(1, min(worker_count, len(self.channels)))
+        self.whisper_channel = (whisper_channel or self.channels[0]).lower()
+        self.report_interval = report_interval
+        self.rebalance_interval = rebalance_interval
+        self.rebalance_threshold = rebalance_threshold
+        self.channel_rates = {channel: 0.0 for channel in self.channels}
+        self.workers = []
+        self.last_rebalance = time.time()
+        # How many ways the account's rate limits are split, set once the workers are planned
+        self.rate_limit_share = 1
+
+    def start(self):
+        shards = plan_shards(self.channel_rates, self.worker_count)
+        self.rate_limit_share = len(shards)
+        for index, shard in enumerate(shards):
+            worker = Worker(index, shard)
+            self.workers.append(worker)
+            self._start_worker(worker)
+
+    def _start_worker(self, worker):
+        # The whisper channel goes first so that worker's service routes whispers to it
+        channels = sorted(worker.channels, key=lambda channel: channel != self.whisper_channel)
+        receive_end, send_end = multiprocessing.Pipe(duplex=False)
+        worker.process = multiprocessing.Process(target=run_worker,
+                                                 kwargs={'channels': channels,
+                                                         'stats_connection': send_end,
+                                                         'handle_whispers': self.whisper_channel in channels,
+                                                         'report_interval': self.report_interval,
+                                                         'rate_limit_share': self.rate_limit_share},
+                                                 name=f'n0tb0t-worker-{worker.index}')
+        worker.process.daemon = True
+        worker.process.start()
+        send_end.close()
+        worker.connection = receive_end
+        worker.last_counts = {}
+        worker.rates = {}
+        worker.restart_at = None
+        print(f'Started worker {worker.index} (pid {worker.process.pid}) for {", ".join(channels)}')
+
+    def _stop_worker(self, worker):
+        if worker.process is not None and worker.process.is_alive():
+            worker.process.terminate()
+            worker.process.join(5)
+        if worker.connection is not None:
+            worker.connection.close()
+            worker.connection = None
+
+    def collect_stats(self, timeout):
+        """
+        Waits up to timeout seconds for reports from the workers and records them.
+        """
+        connections = {worker.connection: worker for worker in self.workers if worker.connection is not None}
+        for connection in multiprocessing.connection.wait(list(connections), timeout=timeout):
+            worker = connections[connection]
+            try:
+                stats = connection.recv()
+            except (EOFError, OSError):
+                # The worker hung up, check_workers will restart it
+                connection.close()
+                worker.connection = None
+                continue
+            self._record_stats(worker, stats)
+
+    def _record_stats(self, worker, stats):
+        now = time.time()
+        for channel, count in stats['message_counts'].items():
+            last_count, last_time = worker.last_counts.get(channel, (0, now - stats['uptime']))
+            if count < last_count:
+                last_count = 0
+            if now > last_time:
+                worker.rates[channel] = (count - last_count) / (now - last_time)
+                self.channel_rates[channel] = worker.rates[channel]
+            worker.last_counts[channel] = (count, now)
+        worker.stats = stats
+
+    def check_workers(self):
+        """
+        Restarts any worker whose process has died.
+        Each crash in a row doubles the wait before the next restart, up to five minutes.
+        """
+        now = time.time()
+        for worker in self.workers:
+            if not worker.channels:
+                continue
+            if worker.process.is_alive():
+                if worker.stats.get('uptime', 0) > 300:
+                    worker.restarts = 0
+                continue
+            if worker.restart_at is None:
+                delay = min(300, 2 ** worker.restarts)
+                print(f'Worker {worker.index} exited with code {worker.process.exitcode}, restarting in {delay}s')
+                worker.restart_at = now + delay
+                worker.restarts += 1
+                worker.stats = {}
+            elif now >= worker.restart_at:
+                self._stop_worker(worker)
+                self._start_worker(worker)
+
+    def rebalance(self):
+        """
+        Moves channels between workers if that would bring the busiest worker's
+        message rate down below rebalance_threshold of what it is now.
+        Only the workers whose channels change are restarted.
+        """
+        self.last_rebalance = time.time()
+        current_max = max(shard_load(worker.channels, self.channel_rates) for worker in self.workers)
+        if current_max == 0:
+            return
+        shards = plan_shards(self.channel_rates, len(self.workers))
+        planned_max = max(shard_load(shard, self.channel_rates) for shard in shards)
+        if planned_max >= current_max * self.rebalance_threshold:
+            return
+
+        # Match each new shard to the worker that already has most of its channels, to restart as few as possible
+        unmatched = list(self.workers)
+        for shard in sorted(shards, key=len, reverse=True):
+            worker = max(unmatched, key=lambda w: len(set(w.channels) & set(shard)))
+            unmatched.remove(worker)
+            if set(worker.channels) != set(shard):
+                print(f'Rebalancing worker {worker.index}: {worker.channels} -> {shard}')
+                worker.channels = shard
+                self._stop_worker(worker)
+                if shard:
+                    self._start_worker(worker)
+
+    def health(self):
+        """
+        A summary of every worker for printing or logging.
+        """
+        return [{'index': worker.index,
+                 'alive': worker.process.is_alive() if worker.process is not None else False,
+                 'channels': worker.channels,
+                 'restarts': worker.restarts,
+                 'rates': dict(worker.rates),
+                 'stats': worker.stats} for worker in self.workers]
+
+    def print_health(self):
+        for worker_health in self.health():
+            stats = worker_health['stats']
+            rate = sum(worker_health['rates'].values())
+            max_wait = max([queue['max_wait_ms'] for queues in stats.get('queue_stats', {}).values()
+                            for queue in queues.values()] + [0])
+            print(f"Worker {worker_health['index']}: alive={worker_health['alive']} "
+                  f"pid={stats.get('pid')} channels={len(worker_health['channels'])} "
+                  f"messages/s={rate:.2f} queued={sum(stats.get('queue_depths', {}).values())} "
+                  f"max_queue_wait={max_wait:.0f}ms "
+                  f"threads={stats.get('threads')} restarts={worker_health['restarts']}")
+
+    def run(self, health_interval=60):
+        self.start()
+        last_health = time.time()
+        try:
+            while True:
+                self.collect_stats(timeout=1)
+                self.check_workers()
+                if time.time() - self.last_rebalance > self.rebalance_interval:
+                    self.rebalance()
+                if time.time() - last_health > health_interval:
+                    self.print_health()
+                    last_health = time.time()
+        finally:
+            for worker in self.workers:
+                self._stop_worker(worker)
@@ -0,0 +1,208 @@
+import hashlib
+
+import src.models as models
+
+# Changed rows at most this far apart are fetched as one range, it's cheaper than another request
+MAX_ROW_GAP = 5
+
+# With nothing pushed before, this many rows past the end of the table are blanked too,
+# in case the sheet still has whatever was written before the bot started keeping track
+UNKNOWN_EXTRA_ROWS = 10
+
+# Sheet rows start at 1, so a stored row 0 just says the table was pushed with no rows at all
+EMPTY_TABLE_ROW = 0
+
+# If every changed cell fits in a box this big, the whole box is fetched in one request instead of a run at a time
+SPANNING_RANGE_CELLS = 1500
+
+
+def row_hash(values):
+    """
+    What a row looks like in the sheet, boiled down to something short enough to store.
+    Values are compared the way gspread writes them, as strings.
+    """
+    return hashlib.sha1('\x1f'.join(str(value) for value in values).encode('utf-8')).hexdigest()
+
+
+def diff_rows(old_hashes, rows, width, first_row=2):
+    """
+    Takes what was pushed last time (row number -> hash) and the rows the sheet should have now.
+    Returns (row number -> values to write for every row that changed, row number -> hash of every row now).
+    Rows that were there last time but aren't any more are written as blanks.
+    """
+    changes = {}
+    new_hashes = {}
+    for index, values in enumerate(rows):
+        row = first_row + index
+        new_hashes[row] = row_hash(values)
+        if old_hashes.get(row) != new_hashes[row]:
+            changes[row] = list(values)
+    for row in old_hashes:
+        if row not in new_hashes:
+            changes[row] = [''] * width
+    return changes, new_hashes
+
+
+def row_runs(row_numbers, max_gap=MAX_ROW_GAP):
+    """
+    Groups row numbers into (first, last) runs, joining runs with at most max_gap rows between them.
+    """
+    runs = []
+    for row in sorted(row_numbers):
+        if runs and row - runs[-1][1] <= max_gap + 1:
+            runs[-1][1] = row
+        else:
+            runs.append([row, row])
+    return [tuple(run) for run in runs]
+
+
+def column_number(letters):
+    """
+    'A' is 1, 'Z' is 26, 'AA' is 27.
+    """
+    number = 0
+    for letter in letters.upper():
+        number = number * 26 + ord(letter) - ord('A') + 1
+    return number
+
+
+def cell_label(row, col):
+    """
+    The A1 style label of a cell, (2, 28) is 'AB2'.
+    """
+    letters = ''
+    while col > 0:
+        col, remainder = divmod(col - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+    return f'{letters}{row}'
+
+
+def forget_sheet(db_session, sheet_key):
+    """
+    Throws away what we think is in a sheet, so the next push writes all of it.
+    """
+    # Sheet names have _ in them, which like would match any character
+    escaped_key = sheet_key.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    db_session.query(models.SheetRow).filter(
+        models.SheetRow.table_key.like(f'{escaped_key}!%', escape='\\')).delete(synchronize_session=False)
+
+
+class _Table(object):
+    def __init__(self, key, first_col, width, rows, first_row, unknown_extra_rows):
+        self.key = key
+        self.first_col = first_col
+        self.first_col_number = column_number(first_col)
+        self.width = width
+        self.rows = rows
+        self.first_row = first_row
+        self.unknown_extra_rows = unknown_extra_rows
+
+
+class SheetSync(object):
+    """
+    Pushes tables of rows to a worksheet, but only the rows that changed since the last push.
+
+    A hash of every row we pushed is kept in the database, so working out what changed doesn't
+    need to read the sheet. gspread needs the cells from the sheet to update them, so the changed
+    rows are fetched, in one range if they're close enough together or a run at a time if not,
+    and all of the changes go out in a single update_cells. The hashes are only saved once
+    that's gone through, so a push that fails just gets done again next time.
+
+    Headers and other fixed rows can go in with add_row, so laying out a new sheet
+    is the same single push, and costs nothing after that.
+
+    This assumes nobody edits these cells by hand. If they do, forget_sheet will make the next push write everything.
+    """
+    def __init__(self, worksheet, db_session, sheet_key):
+        self.worksheet = worksheet
+        self.db_session = db_session
+        self.sheet_key = sheet_key
+        self.tables = []
+
+    def add_table(self, first_col, width, rows, first_row=2):
+        """
+        rows is a list of lists of cell values, to go in width columns starting at first_col ('A')
+        and first_row. Several tables can go in one sheet as long as they don't overlap.
+        """
+        key = f'{self.sheet_key}!{first_col}{first_row}'
+        self.tables.append(_Table(key, first_col, width, rows, first_row, UNKNOWN_EXTRA_ROWS))
+
+    def add_row(self, first_col, values, row=1):
+        """
+        A single row that's always there, like the headers.
+        """
+        key = f'{self.sheet_key}!{first_col}{row}'
+        self.tables.append(_Table(key, first_col, len(values), [values], row, 0))
+
+    def _fetch_cells(self, boxes):
+        """
+        Takes (first row, first col, last row, last col) boxes and returns
+        the cells in them, along with how many requests that took.
+        """
+        if len(boxes) > 1:
+            top, left = min(box[0] for box in boxes), min(box[1] for box in boxes)
+            bottom, right = max(box[2] for box in boxes), max(box[3] for box in boxes)
+            if (bottom - top + 1) * (right - left + 1) <= SPANNING_RANGE_CELLS:
+                boxes = [(top, left, bottom, right)]
+        cells = []
+        for top, left, bottom, right in boxes:
+            cells += self.worksheet.range(f'{cell_label(top, left)}:{cell_label(bottom, right)}')
+        return cells, len(boxes)
+
+    def push(self):
+        """
+        Sends the changes and returns how much had to be sent.
+        """
+        # (row, col) -> value for every cell that needs writing
+        values = {}
+        boxes = []
+        stored_rows = {}
+        table_changes = {}
+        for table in self.tables:
+            row_objs = self.db_session.query(models.SheetRow).filter(models.SheetRow.table_key == table.key).all()
+            stored_rows[table.key] = {row_obj.row: row_obj for row_obj in row_objs}
+            if row_objs:
+                old_hashes = {row_obj.row: row_obj.row_hash for row_obj in row_objs if row_obj.row != EMPTY_TABLE_ROW}
+            else:
+                old_hashes = {table.first_row + index: None
+                              for index in range(len(table.rows) + table.unknown_extra_rows)}
+
+            changes, new_hashes = diff_rows(old_hashes, table.rows, table.width, table.first_row)
+            table_changes[table.key] = (changes, new_hashes)
+            for row, row_values in changes.items():
+                for offset, value in enumerate(row_values):
+                    values[(row, table.first_col_number + offset)] = value
+            last_col_number = table.first_col_number + table.width - 1
+            boxes += [(first, table.first_col_number, last, last_col_number) for first, last in row_runs(changes)]
+
+        cells, ranges = self._fetch_cells(boxes)
+        cells_to_update = []
+        for cell in cells:
+            if (cell.row, cell.col) in values:
+                cell.value = values[(cell.row, cell.col)]
+                cells_to_update.append(cell)
+        if cells_to_update:
+            self.worksheet.update_cells(cells_to_update)
+
+        changed_rows = 0
+        for table in self.tables:
+            changes, new_hashes = table_changes[table.key]
+            row_objs = stored_rows[table.key]
+            changed_rows += len(changes)
+            for row in changes:
+                row_obj = row_objs.get(row)
+                if row not in new_hashes:
+                    if row_obj is not None:
+                        self.db_session.delete(row_obj)
+                elif row_obj is None:
+                    self.db_session.add(models.SheetRow(table_key=table.key, row=row, row_hash=new_hashes[row]))
+                else:
+                    row_obj.row_hash = new_hashes[row]
+            # An empty table still needs something stored, or the next push would blank the rows after it again
+            empty_marker = row_objs.get(EMPTY_TABLE_ROW)
+            if not new_hashes and empty_marker is None:
+                self.db_session.add(models.SheetRow(table_key=table.key, row=EMPTY_TABLE_ROW, row_hash=''))
+            elif new_hashes and empty_marker is not None:
+                self.db_session.delete(empty_marker)
+        self.db_session.commit()
+        return {'changed_rows': changed_rows, 'cells': len(cells_to_update), 'ranges': ranges}
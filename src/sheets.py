@@ -0,0 +1,155 @@
+import collections
+import threading
+
+
+class SpreadsheetConnection(object):
+    """
+    The gspread client one spreadsheet's requests go through, and the lock they take turns behind.
+    """
+    def __init__(self, client):
+        self.client = client
+        self.request_lock = threading.Lock()
+        # The token the session's Authorization header was last set with
+        self.access_token = None
+        self.requests = 0
+
+
+class SheetsClient(object):
+    """
+    One place for everything that touches google sheets.
+
+    gspread.authorize, gc.open and sheet.worksheet each cost at least one request, and open
+    has to list every spreadsheet the account can see to find one by name. This only refreshes
+    the token when it has expired, and keeps the spreadsheet and worksheet handles it finds
+    so the next update can go straight to work.
+
+    Neither gspread's session nor requests' is safe to send on from several threads at once,
+    so each spreadsheet gets its own gspread client and session, and requests for it take turns,
+    including the ones made with the cached handles. Different spreadsheets send side by side.
+    All the sessions share one connection pool, pool_size should be how many sheet jobs can run at once.
+    Bots for several channels can share one of these, it's safe to use from any thread.
+    """
+    def __init__(self, credentials, pool_size=8):
+        self.credentials = credentials
+        self.pool_size = pool_size
+        # Held for looking things up and logging in, always taken before a request_lock if both are needed
+        self.lock = threading.RLock()
+        self.adapter = None
+        # spreadsheet name -> SpreadsheetConnection
+        self.connections = {}
+        # spreadsheet name -> Spreadsheet
+        self.spreadsheets = {}
+        # (spreadsheet name, worksheet title) -> Worksheet
+        self.worksheets = {}
+        self.counts = collections.Counter()
+
+    def _new_client(self):
+        # Only imported once there's something to do with the sheets, it takes a while
+        import gspread
+        import requests
+        from gspread.httpsession import HTTPSession
+
+        if self.adapter is None:
+            self.adapter = requests.adapters.HTTPAdapter(pool_maxsize=self.pool_size)
+        session = HTTPSession()
+        session.requests_session.mount('https://', self.adapter)
+        return gspread.Client(auth=self.credentials, http_session=session)
+
+    def _serialize_requests(self, connection):
+        session = connection.client.session
+        send = session.request
+
+        def request(*args, **kwargs):
+            with connection.request_lock:
+                connection.requests += 1
+                return send(*args, **kwargs)
+
+        session.request = request
+
+    def _login(self, connection):
+        # Logging in changes the session's headers, so nothing can be sending on it at the same time
+        with connection.request_lock:
+            connection.client.login()
+        connection.access_token = self.credentials.access_token
+        self.counts['logins'] += 1
+
+    def get_client(self, spreadsheet_name):
+        """
+        The logged in client for a spreadsheet, logging in again first if the token has run out
+        or another spreadsheet's client has already got a new one.
+        """
+        with self.lock:
+            connection = self.connections.get(spreadsheet_name)
+            if connection is None:
+                connection = SpreadsheetConnection(self._new_client())
+                self._serialize_requests(connection)
+                self.connections[spreadsheet_name] = connection
+                self._login(connection)
+            elif (not self.credentials.access_token or getattr(self.credentials, 'access_token_expired', False)
+                  or connection.access_token != self.credentials.access_token):
+                self._login(connection)
+            return connection.client
+
+    def spreadsheet(self, spreadsheet_name):
+        with self.lock:
+            client = self.get_client(spreadsheet_name)
+            if spreadsheet_name in self.spreadsheets:
+                self.counts['hits'] += 1
+            else:
+                self.counts['misses'] += 1
+                self.spreadsheets[spreadsheet_name] = client.open(spreadsheet_name)
+            return self.spreadsheets[spreadsheet_name]
+
+    def worksheet(self, spreadsheet_name, title):
+        """
+        Raises gspread.exceptions.WorksheetNotFound like Spreadsheet.worksheet does.
+        """
+        with self.lock:
+            key = (spreadsheet_name, title)
+            if key in self.worksheets:
+                self.get_client(spreadsheet_name)
+                self.counts['hits'] += 1
+            else:
+                self.counts['misses'] += 1
+                self.worksheets[key] = self.spreadsheet(spreadsheet_name).worksheet(title)
+            return self.worksheets[key]
+
+    def ensure_worksheet(self, spreadsheet_name, title, rows, cols):
+        """
+        The worksheet, after adding it if the spreadsheet doesn't have it yet.
+        New spreadsheets come with an empty Sheet1, which goes once the real worksheet is there.
+        """
+        import gspread
+
+        sheet = self.spreadsheet(spreadsheet_name)
+        sheet.worksheets()  # Necessary to remind gspread that Sheet1 exists, otherwise gpsread forgets about it
+        try:
+            return self.worksheet(spreadsheet_name, title)
+        except gspread.exceptions.WorksheetNotFound:
+            worksheet = sheet.add_worksheet(title, rows, cols)
+            sheet.del_worksheet(sheet.get_worksheet(0))
+            self.invalidate(spreadsheet_name)
+            return worksheet
+
+    def invalidate(self, spreadsheet_name=None):
+        """
+        Forgets the handles for a spreadsheet, or for all of them.
+        Call this after adding or deleting worksheets, or when a request with a handle failed.
+        """
+        with self.lock:
+            if spreadsheet_name is None:
+                self.spreadsheets.clear()
+                self.worksheets.clear()
+            else:
+                self.spreadsheets.pop(spreadsheet_name, None)
+                for key in [key for key in self.worksheets if key[0] == spreadsheet_name]:
+                    del self.worksheets[key]
+
+    def stats(self):
+        with self.lock:
+            return {'logins': self.counts['logins'],
+                    'requests': sum(connection.requests for connection in self.connections.values()),
+                    'cache_hits': self.counts['hits'],
+                    'cache_misses': self.counts['misses'],
+                    'spreadsheets': len(self.spreadsheets),
+                    'worksheets': len(self.worksheets)}
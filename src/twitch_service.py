@@ -1,28 +1,19 @@
+import collections
 import datetime
-import functools
 import socket
+import threading
 import time
 from enum import Enum, auto
 from dateutil.relativedelta import relativedelta
 
 import requests
 
+from src.connection import Backoff
+from src.irc import LineFramer, parse_line
+from src.rate_limiter import RateLimiter
 from src.service import Service
 from src.message import Message
-
-
-def reconnect_on_error(f):
-    @functools.wraps(f)
-    def wrapper(*args, **kwargs):
-        try:
-            f(*args, **kwargs)
-        except Exception as e:
-            print(f'{str(e)}: Attempting to reconnecting to the socket.')
-            args[0].event_logger.info(f'{str(e)}: Attempting to reconnecting to the socket.')
-            args[0].sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            args[0]._join_room()
-            f(*args, **kwargs)
-    return wrapper
+from src.outbound import DuplicateFilter
 
 
 class MessageTypes(Enum):
@@ -30,34 +21,108 @@ class MessageTypes(Enum):
     PRIVATE = auto()
     NOTICE = auto()
     PING = auto()
+    ROOMSTATE = auto()
+    USERSTATE = auto()
     SYSTEM_MESSAGE = auto()
 
 
 class TwitchMessage(Message):
-    def __init__(self, message_type=None, user=None, content=None, display_name=None, is_mod=False):
+    def __init__(self, message_type=None, user=None, content=None, display_name=None, is_mod=False, channel=None,
+                 tags=None):
         Message.__init__(self, service=Service.TWITCH,
                          message_type=message_type,
                          user=user, content=content,
                          display_name=display_name,
                          is_mod=is_mod)
+        self.channel = channel
+        self.tags = tags or {}
 
 
 class TwitchService(object):
-    def __init__(self, pw, user, channel, twitch_api_client_id, error_logger, event_logger):
-        self.host = 'irc.chat.twitch.tv'
-        self.port = 6667
+    def __init__(self, pw, user, channel, twitch_api_client_id, error_logger, event_logger, extra_channels=(),
+                 handle_whispers=True, capture_path=None, host='irc.chat.twitch.tv', port=6667,
+                 handshake_timeout=10, backoff=None, duplicate_filter=None, rate_limit_share=1):
+        self.host = host
+        self.port = port
         self.pw = pw
         self.user = user.lower()
         self.display_user = user
         self.channel = channel.lower()
+        # Every channel joined on this connection. The first one is where whispers are handled.
+        self.channels = [self.channel] + [extra_channel.lower() for extra_channel in extra_channels]
+        self.channel_services = {}
+        # Every connection logged in as the bot gets the bot's whispers.
+        # When several processes share the account, only one of them should answer.
+        self.handle_whispers = handle_whispers
+        self.message_counts = collections.Counter()
+        # Shared by every channel, twitch counts messages per account.
+        # rate_limit_share is how many processes are sending for the account, including this one.
+        self.rate_limiter = RateLimiter(share=rate_limit_share)
+        if user.lower() in self.channels:
+            self.rate_limiter.set_moderator(user.lower(), True)
+        self.duplicate_filter = duplicate_filter or DuplicateFilter()
         self.twitch_api_client_id = twitch_api_client_id
         self.display_channel = channel
-        self.channel_id = self._get_channel_id_from_channel_name(channel.lower())
+        # One pool of HTTP connections for every api call made on behalf of every channel
+        self.http_session = requests.Session()
+        # channel -> id, looked up in the background or whenever one's first needed if that comes sooner
+        self.channel_ids = {}
+        self.channel_ids_lock = threading.Lock()
         self.error_logger = error_logger
         self.event_logger = event_logger
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        # Every received line can be written to a capture file to be replayed later with replay.py
+        self.capture_file = None
+        if capture_path:
+            self.capture_file = open(capture_path, 'a', encoding='utf-8', buffering=1)
+        # Replaced with a new one for every connection, only the handshake reads it until connected is set
+        self.line_framer = LineFramer()
+
+        # Connection state. Anything that sends waits on connected while a reconnect is under way,
+        # and only one thread at a time gets to reconnect.
+        self.sock = None
+        self.connected = threading.Event()
+        self.reconnect_lock = threading.Lock()
+        self.handshake_timeout = handshake_timeout
+        self.backoff = backoff or Backoff()
+        self.reconnect_count = 0
+
+        # Lines waiting for the writer thread, the only thing that writes to the socket once we're connected
+        self.write_buffer = collections.deque()
+        self.write_condition = threading.Condition()
+        self.write_batch_bytes = 4096
+        self.lines_written = 0
+        self.writes = 0
+
+        self._connect()
+        self._start_writer()
+
+        channel_id_thread = threading.Thread(target=self._look_up_channel_ids, name='channel-ids')
+        channel_id_thread.daemon = True
+        channel_id_thread.start()
+
+    @property
+    def channel_id(self):
+        return self.get_channel_id(self.channel)
+
+    def get_channel_id(self, channel):
+        """
+        The id of one of the joined channels. Only asks twitch the first time.
+        """
+        with self.channel_ids_lock:
+            if channel not in self.channel_ids:
+                self.channel_ids[channel] = self._get_channel_id_from_channel_name(channel)
+            return self.channel_ids[channel]
 
-        self._join_room()
+    def _look_up_channel_ids(self):
+        """
+        Fetches every joined channel's id in the background, so starting up doesn't wait on the twitch api.
+        """
+        for channel in self.channels:
+            try:
+                self.get_channel_id(channel)
+            except Exception as e:
+                print(f'{str(e)}: Could not look up the channel id for {channel}')
+                self.error_logger.exception(f'Could not look up the channel id for {channel}')
 
     def _get_channel_id_from_channel_name(self, channel_name):
         """
@@ -66,58 +131,217 @@ class TwitchService(object):
         """
         return self._get_user_id_from_user_name(channel_name)
 
-    @reconnect_on_error
-    def send_public_message(self, message_content):
+    def get_channel(self, channel):
+        """
+        Returns the TwitchChannel a bot uses to talk to one of the joined channels.
+        """
+        if channel.lower() not in self.channel_services:
+            self.channel_services[channel.lower()] = TwitchChannel(self, channel)
+        return self.channel_services[channel.lower()]
+
+    def send_public_message(self, message_content, channel=None):
         """
         Sends a message to the twitch public chat
+        Defaults to the first channel this service joined.
+        Waits until the message can be sent without breaking twitch's rate limits.
         """
-        message_temp = f'PRIVMSG #{self.channel} :{message_content}\r\n'.encode('utf-8')
+        channel = channel or self.channel
+        message_content = self._filter_duplicate(message_content, channel)
+        if message_content is None:
+            return
+        self.rate_limiter.acquire_chat(channel)
+        message_temp = f'PRIVMSG #{channel} :{message_content}\r\n'.encode('utf-8')
         print('{} PUBLIC {}: {}'.format(
             time.strftime('%Y-%m-%d %H:%M:%S'),
             self.display_user,
             message_content))
-        self.sock.send(message_temp)
-        self.event_logger.info(f'sent: {message_temp}')
+        self._send_line(message_temp)
 
-    @reconnect_on_error
-    def send_private_message(self, recipient, whisper_content):
+    def send_private_message(self, recipient, whisper_content, channel=None):
         """
         Sends a whisper with the specified content to the specified user 
+        Waits until the whisper can be sent without breaking twitch's rate limits.
         """
-        message_temp = f'PRIVMSG #{self.channel} :/w {recipient} {whisper_content}\r\n'.encode('utf-8')
+        channel = channel or self.channel
+        self.rate_limiter.acquire_whisper()
+        message_temp = f'PRIVMSG #{channel} :/w {recipient} {whisper_content}\r\n'.encode('utf-8')
         print('{} PRIVATE {} to {}: {}'.format(
             time.strftime('%Y-%m-%d %H:%M:%S'),
             self.display_user,
             recipient,
             whisper_content))
-        self.sock.send(message_temp)
-        self.event_logger.info(f'sent: {message_temp}')
-
-    @reconnect_on_error
-    def _join_room(self):
-        self.sock.connect((self.host, self.port))
-        self.sock.send('PASS {PASS}\r\n'.format(PASS=self.pw).encode('utf-8'))
-        self.sock.send('NICK {USER}\r\n'.format(USER=self.user).encode('utf-8'))
-        self.sock.send('JOIN #{CHANNEL}\r\n'.format(CHANNEL=self.channel).encode('utf-8'))
-
-        messages = ''
-        loading = True
-        while loading:
+        self._send_line(message_temp)
+
+    def _filter_duplicate(self, message_content, channel):
+        """
+        Returns what to send instead of a message twitch would drop as a duplicate,
+        or None if there's nothing to send right now.
+        Messages held back for the duplicate window are sent again from a timer once it's passed.
+        """
+        message_content, delay = self.duplicate_filter.check(channel, message_content)
+        if message_content is not None and delay > 0:
+            timer = threading.Timer(delay, self.send_public_message, args=(message_content, channel))
+            timer.daemon = True
+            timer.start()
+            return None
+        return message_content
+
+    def _send_line(self, line, urgent=False):
+        """
+        Hands an encoded line to the writer thread.
+        While the connection is down this waits for it to come back, so the sending thread pauses
+        instead of piling up lines that would all go out at once afterwards.
+        Urgent lines, like PONGs, go to the front of the buffer.
+        """
+        self.connected.wait()
+        with self.write_condition:
+            if urgent:
+                self.write_buffer.appendleft(line)
+            else:
+                self.write_buffer.append(line)
+            self.write_condition.notify()
+
+    def _start_writer(self):
+        self.writer_thread = threading.Thread(target=self._write_lines)
+        self.writer_thread.daemon = True
+        self.writer_thread.start()
+
+    def _next_write(self):
+        """
+        Waits for something to write and takes every line that's ready, up to write_batch_bytes,
+        so lines sent at about the same time go out in a single write.
+        """
+        with self.write_condition:
+            self.write_condition.wait_for(lambda: len(self.write_buffer) > 0)
+            lines = [self.write_buffer.popleft()]
+            size = len(lines[0])
+            while self.write_buffer and size + len(self.write_buffer[0]) <= self.write_batch_bytes:
+                lines.append(self.write_buffer.popleft())
+                size += len(lines[-1])
+        return lines
+
+    def _write_lines(self):
+        """
+        The writer thread. sendall keeps going until every byte is written,
+        and a batch that fails is held onto and written again on the new connection.
+        """
+        while True:
+            lines = self._next_write()
+            data = b''.join(lines)
+            while True:
+                self.connected.wait()
+                sock = self.sock
+                try:
+                    sock.sendall(data)
+                except OSError as e:
+                    self._reconnect(sock, f'{str(e)} while sending')
+                else:
+                    break
+            self.lines_written += len(lines)
+            self.writes += 1
+            self.event_logger.info(f'sent: {data}')
+
+    def write_stats(self):
+        return {'lines_written': self.lines_written,
+                'writes': self.writes,
+                'lines_per_write': self.lines_written / self.writes if self.writes else 0.0,
+                'buffered': len(self.write_buffer)}
+
+    def _connect(self):
+        """
+        Keeps trying to connect and join every channel until it works,
+        waiting a little longer (with jitter) after each failed attempt.
+        """
+        while True:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            line_framer = LineFramer()
+            try:
+                self._join_room(sock, line_framer)
+            except OSError as e:
+                sock.close()
+                delay = self.backoff.next_delay()
+                print(f'{str(e)}: Connecting failed, retrying in {delay:.1f}s.')
+                self.error_logger.warning(f'{str(e)}: Connecting failed, retrying in {delay:.1f}s.')
+                time.sleep(delay)
+            else:
+                self.backoff.reset()
+                # The framer before the socket, so a reader that picks up the new socket gets its framer too
+                self.line_framer = line_framer
+                self.sock = sock
+                self.connected.set()
+                return
+
+    def _reconnect(self, failed_sock, reason):
+        """
+        Replaces a connection that has failed.
+        The reader and the senders can all notice the same failure,
+        only the first of them to get here reconnects and the rest just wait for it.
+        """
+        with self.reconnect_lock:
+            if self.sock is not failed_sock:
+                return
+            self.connected.clear()
+            print(f'{reason}: Attempting to reconnecting to the socket.')
+            self.event_logger.info(f'{reason}: Attempting to reconnecting to the socket.')
             try:
-                read_buffer = self.sock.recv(2048)
-                messages = messages + read_buffer.decode('utf-8')
-                last_message = messages.split('\r\n')[-2]
-                messages = ""
-                if 'End of /NAMES list' in last_message:
-                    loading = False
+                # Shutting it down wakes up a reader that's still blocked on it
+                failed_sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            failed_sock.close()
+            self.reconnect_count += 1
+            self._connect()
+
+    def _join_room(self, sock, line_framer):
+        """
+        Logs in and joins every channel on a new connection, reading it with its own line framer.
+        Nothing else uses either of them until this is done.
+        Gives up with an OSError if twitch hasn't finished the handshake within handshake_timeout seconds.
+        """
+        sock.settimeout(self.handshake_timeout)
+        sock.connect((self.host, self.port))
+        sock.sendall(self._get_handshake())
+
+        # Twitch ends the NAMES list once for every channel we asked to join
+        deadline = time.time() + self.handshake_timeout
+        channels_joined = 0
+        while channels_joined < len(self.channels):
+            if time.time() > deadline:
+                raise socket.timeout('Timed out joining the channels')
+            read_buffer = sock.recv(2048)
+            if len(read_buffer) == 0:
+                raise ConnectionError('Disconnected while joining the channels')
+            for line in line_framer.feed(read_buffer):
+                if 'End of /NAMES list' in line:
+                    channels_joined += 1
                 else:
-                    loading = True
-            except:
-                continue
+                    self._handle_handshake_line(line)
+        sock.settimeout(None)
+
+    def _handle_handshake_line(self, line):
+        """
+        The room state lines twitch sends while we're joining still need to reach the rate limiter.
+        Chat that arrives before every channel is joined is dropped, the bots aren't running yet.
+        """
+        message = self._line_to_message(line)
+        if message.message_type in [MessageTypes.NOTICE, MessageTypes.ROOMSTATE, MessageTypes.USERSTATE]:
+            self._handle_message(message, None)
+
+    def _get_handshake(self):
+        """
+        Everything we send to log in and join, as one write.
+        The capabilities are asked for before joining so the USERSTATE and ROOMSTATE for each channel come with their tags.
+        """
+        return b''.join(['PASS {PASS}\r\n'.format(PASS=self.pw).encode('utf-8'),
+                         'NICK {USER}\r\n'.format(USER=self.user).encode('utf-8'),
+                         "CAP REQ :twitch.tv/tags\r\n".encode('utf-8'),
+                         'CAP REQ :twitch.tv/commands\r\n'.encode('utf-8'),
+                         # 'CAP REQ :twitch.tv/membership\r\n'.encode('utf-8'),
+                         self._get_join_line()])
 
-        self.sock.send("CAP REQ :twitch.tv/tags\r\n".encode('utf-8'))
-        self.sock.send('CAP REQ :twitch.tv/commands\r\n'.encode('utf-8'))
-        # self.sock.send('CAP REQ :twitch.tv/membership\r\n'.encode('utf-8'))
+    def _get_join_line(self):
+        channels_str = ','.join(f'#{channel}' for channel in self.channels)
+        return f'JOIN {channels_str}\r\n'.encode('utf-8')
 
     # Getter methods
     @staticmethod
@@ -144,7 +368,7 @@ class TwitchService(object):
         url = f'https://api.twitch.tv/kraken/users?login={username}'
         for attempt in range(5):
             try:
-                r = requests.get(url, headers={
+                r = self.http_session.get(url, headers={
                     "Client-ID": self.twitch_api_client_id,
                     "Accept": "application/vnd.twitchtv.v5+json"})
                 user_id = r.json()['users'][0]['_id']
@@ -169,7 +393,7 @@ class TwitchService(object):
         url = 'https://api.twitch.tv/kraken/users/{}'.format(user_id)
         for attempt in range(5):
             try:
-                r = requests.get(url, headers={"Client-ID": self.twitch_api_client_id,
+                r = self.http_session.get(url, headers={"Client-ID": self.twitch_api_client_id,
                                                "Accept": "application/vnd.twitchtv.v5+json"})
                 creation_date = r.json()['created_at']
                 cut_creation_date = creation_date[:10]
@@ -192,7 +416,7 @@ class TwitchService(object):
         url = 'http://tmi.twitch.tv/group/user/{channel}/chatters'.format(channel=self.channel)
         for attempt in range(5):
             try:
-                r = requests.get(url)
+                r = self.http_session.get(url)
                 chatters = r.json()['chatters']
             except ValueError:
                 continue
@@ -220,12 +444,12 @@ class TwitchService(object):
         Uses the kraken API to fetch the start time of the current stream.
         Computes how long the stream has been running, returns that value in a dictionary.
         """
-        channel_id = self._get_channel_id_from_channel_name(self.channel)
+        channel_id = self.channel_id
 
         url = 'https://api.twitch.tv/kraken/streams/{}'.format(channel_id)
         for attempt in range(5):
             try:
-                r = requests.get(url, headers={"Client-ID": self.twitch_api_client_id,
+                r = self.http_session.get(url, headers={"Client-ID": self.twitch_api_client_id,
                                                "Accept": "application/vnd.twitchtv.v5+json"})
                 r.raise_for_status()
                 start_time_str = r.json()['stream']['created_at']
@@ -262,7 +486,7 @@ class TwitchService(object):
         url = f'https://api.twitch.tv/kraken/users/{userid}/follows/channels/{channel_id}'
         for attempt in range(5):
             try:
-                r = requests.get(url, headers={
+                r = self.http_session.get(url, headers={
                     "Client-ID": self.twitch_api_client_id,
                     "Accept": "application/vnd.twitchtv.v5+json"})
                 if "created_at" in r.json():
@@ -287,7 +511,7 @@ class TwitchService(object):
         url = f'https://api.twitch.tv/kraken/channels/{channel_id}'
         for attempt in range(5):
             try:
-                r = requests.get(url, headers={"Client-ID": self.twitch_api_client_id,
+                r = self.http_session.get(url, headers={"Client-ID": self.twitch_api_client_id,
                                                "Accept": "application/vnd.twitchtv.v5+json"})
                 r.raise_for_status()
                 game = r.json()['game']
@@ -302,69 +526,52 @@ class TwitchService(object):
             raise RuntimeError("Sorry, there was a problem talking to the twitch api. Maybe wait a bit and retry your command?")
 
     @staticmethod
-    def _get_username_from_line(line):
-        exclam_index = None
-        at_index = None
-        for i, char in enumerate(line):
-            if char == '!':
-                exclam_index = i
-            if char == '@' and exclam_index is not None:
-                at_index = i
-                break
-        return line[exclam_index+1:at_index]
-
-    @staticmethod
-    def _get_data_from_line(line, data_type):
-        if data_type in line:
-            _, *rest_of_line = line.split("{}=".format(data_type), 1)
-            for i, char in enumerate(rest_of_line[0]):
-                if char in [':', ';']:
-                    return rest_of_line[0][:i].strip()
-
-    def _get_display_name_from_line(self, line):
-        display_name = self._get_data_from_line(line, 'display-name')
+    def _get_display_name_from_parsed_line(parsed_line):
+        display_name = parsed_line.get_tag('display-name')
         if display_name not in [None, '']:
             return display_name
         else:
-            username = self._get_username_from_line(line)
+            username = parsed_line.nick
             display_name = f'{username[0].upper()}{username[1:]}'
             return display_name
 
-    def _get_user_id_from_line(self, line):
-        return self._get_data_from_line(line, 'user-id')
-
-    def _check_mod_from_line(self, line):
-        if "PRIVMSG" in line:
-            return ('user-type=mod' in line) or (self._get_display_name_from_line(line).lower() == self.channel.lower())
-        elif "WHISPER" in line:
-            return (self._get_username_from_line(line) in self.get_mods()) or (self._get_username_from_line(line) == self.channel.lower())
+    def _check_mod_from_parsed_line(self, parsed_line, display_name):
+        if parsed_line.command == 'PRIVMSG':
+            return (parsed_line.get_tag('user-type') == 'mod') or (display_name.lower() == parsed_line.channel)
+        elif parsed_line.command == 'WHISPER':
+            return (parsed_line.nick in self.get_mods()) or (parsed_line.nick == self.channel.lower())
 
-    def _line_to_message(self, line):
+    def _line_to_message(self, line, parsed_line=None):
         """
         Takes a twitch IRC line and converts it to a Message
         
         @params:
             line is a twitch IRC line
+            parsed_line is what parse_line made of it, if that's already been done
         """
         kwargs = {}
         try:
-            if line == 'PING :tmi.twitch.tv':
+            if parsed_line is None:
+                parsed_line = parse_line(line)
+            if parsed_line.command == 'PING':
                 kwargs['message_type'] = MessageTypes.PING
-            elif 'PRIVMSG' in line:
-                kwargs['user'] = self._get_user_id_from_line(line)
-                kwargs['display_name'] = self._get_display_name_from_line(line)
-                kwargs['message_type'] = MessageTypes.PUBLIC
-                kwargs['content'] = line.split(f'#{self.channel} :')[1]
-                kwargs['is_mod'] = self._check_mod_from_line(line)
-            elif 'WHISPER' in line:
-                kwargs['user'] = self._get_user_id_from_line(line)
-                kwargs['display_name'] = self._get_display_name_from_line(line)
-                kwargs['message_type'] = MessageTypes.PRIVATE
-                kwargs['content'] = line.split(f'WHISPER {self.user} :')[1]
-                kwargs['is_mod'] = self._check_mod_from_line(line)
-            elif 'NOTICE' in line:
-                kwargs['message_type'] = MessageTypes.NOTICE
+            elif parsed_line.command in ['PRIVMSG', 'WHISPER']:
+                display_name = self._get_display_name_from_parsed_line(parsed_line)
+                kwargs['user'] = parsed_line.get_tag('user-id')
+                kwargs['display_name'] = display_name
+                if parsed_line.command == 'PRIVMSG':
+                    kwargs['message_type'] = MessageTypes.PUBLIC
+                    kwargs['channel'] = parsed_line.channel
+                else:
+                    kwargs['message_type'] = MessageTypes.PRIVATE
+                    kwargs['channel'] = self.channel
+                kwargs['content'] = parsed_line.trailing
+                kwargs['is_mod'] = self._check_mod_from_parsed_line(parsed_line, display_name)
+            elif parsed_line.command in ['NOTICE', 'ROOMSTATE', 'USERSTATE']:
+                kwargs['message_type'] = MessageTypes[parsed_line.command]
                 kwargs['content'] = line
+                kwargs['channel'] = parsed_line.channel
+                kwargs['tags'] = parsed_line.tags
             else:
                 kwargs['message_type'] = MessageTypes.SYSTEM_MESSAGE
                 kwargs['content'] = line
@@ -377,59 +584,149 @@ class TwitchService(object):
         message = f'/timeout {username} {seconds}'
         return message
 
-    def run(self, bot):
-        while True:
-            messages = []
-            lines = ''
-            try:
-                read_buffer = self.sock.recv(2048)
-            except Exception as e:
-                print('{}: Attempting to reconnecting to the socket.'.format(str(e)))
-                self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                self._join_room()
-                read_buffer = self.sock.recv(2048)
+    def _send_pong(self):
+        self._send_line('PONG :tmi.twitch.tv\r\n'.encode('utf-8'), urgent=True)
 
-            if len(read_buffer) == 0:
-                print('Disconnected: Attempting to reconnecting to the socket.')
-                self.event_logger.info(r'Disconnected: Attempting to reconnecting to the socket.'.encode('utf-8'))
-                self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                self._join_room()
-                read_buffer = self.sock.recv(2048)
+    def _capture_line(self, line):
+        """
+        Appends the line to the capture file, if there is one,
+        after the number of milliseconds since the epoch it was received at.
+        """
+        if self.capture_file is not None:
+            self.capture_file.write(f'{int(time.time() * 1000)} {line}\n')
+
+    def _handle_line(self, line, bots):
+        """
+        Takes a single complete IRC line and does whatever it calls for.
+        """
+        message = self._line_to_message(line)
+        self._handle_message(message, self._get_bot_for_message(message, bots))
+
+    def _get_bot_for_message(self, message, bots):
+        """
+        Chat messages go to the bot for the channel they were sent in.
+        Whispers aren't sent in a channel, so they go to the bot for the first channel.
+        """
+        if message.message_type == MessageTypes.PRIVATE and not self.handle_whispers:
+            return None
+        if message.channel is None:
+            return bots[self.channel]
+        return bots.get(message.channel)
+
+    def _handle_message(self, message, bot):
+        """
+        Answers PINGs, prints NOTICEs and hands chat messages to the bot.
+        NOTICE, ROOMSTATE and USERSTATE lines also tell the rate limiter about
+        slow mode, our moderator status and messages twitch dropped for coming too quickly.
+        """
+        if message.message_type == MessageTypes.NOTICE:
+            print(message.content)
+            if message.channel is not None:
+                pause = self.rate_limiter.handle_notice(message.channel, message.tags.get('msg-id'), message.content)
+                if pause:
+                    self.event_logger.info(f'Pausing messages to {message.channel} for {pause}s')
+        elif message.message_type == MessageTypes.ROOMSTATE:
+            if message.tags.get('slow', '').isdigit():
+                self.rate_limiter.set_slow_mode(message.channel, int(message.tags['slow']))
+        elif message.message_type == MessageTypes.USERSTATE:
+            is_moderator = (message.tags.get('mod') == '1' or 'broadcaster/' in message.tags.get('badges', '')
+                            or message.channel == self.user)
+            self.rate_limiter.set_moderator(message.channel, is_moderator)
+        elif message.message_type == MessageTypes.PING:
+            self._send_pong()
+        # elif message.message_type == MessageTypes.SYSTEM_MESSAGE:
+        #     print(message.content)
+        elif message.message_type in [MessageTypes.PUBLIC, MessageTypes.PRIVATE] and bot is not None:
+            self.message_counts[message.channel] += 1
             try:
-                lines = lines + read_buffer.decode(encoding='utf-8', errors='strict')
-                line_list = lines.split('\r\n')
-                self.event_logger.info(f'received: {line_list[-2]}'.encode('utf-8'))
+                bot._act_on(message)
+                print('{} {} {}: {}'.format(
+                    time.strftime('%Y-%m-%d %H:%M:%S'),
+                    message.message_type.name,
+                    message.display_name,
+                    message.content))
             except Exception as e:
                 print(e)
-                self.error_logger.exception("Error Decoding the buffer")
+                self.error_logger.exception(
+                    f"""Message type: {message.message_type} 
+                    Message content: {message.content} 
+                    User: {message.display_name}"""
+                )
+                bot.service.send_public_message('Something went wrong. The error has been logged.')
+
+    def run(self, bots):
+        """
+        Takes either a single bot or a dictionary of bots keyed by channel name
+        and keeps them fed with messages from the connection.
+        """
+        if not isinstance(bots, dict):
+            bots = {self.channel: bots}
+        while True:
+            self.connected.wait()
+            # The framer first, _connect swaps in the socket after it
+            line_framer = self.line_framer
+            sock = self.sock
+            try:
+                # Blocks until twitch sends something, so there's no need to wait between reads
+                read_buffer = sock.recv(2048)
+            except OSError as e:
+                self._reconnect(sock, str(e))
                 continue
-            for line in line_list:
-                messages.append(self._line_to_message(line))
-
-            last_message = messages[-2]
-            if last_message.message_type == MessageTypes.NOTICE:
-                print(last_message.content)
-            elif last_message.message_type == MessageTypes.PING:
-                resp = 'PONG :tmi.twitch.tv\r\n'.encode('utf-8')
-                self.sock.send(resp)
-                self.event_logger.info(f'sent: {resp}')
-            # elif last_message.message_type == MessageTypes.SYSTEM_MESSAGE:
-            #     print(last_message.content)
-            elif last_message.message_type in [MessageTypes.PUBLIC, MessageTypes.PRIVATE]:
-                try:
-                    bot._act_on(last_message)
-                    print('{} {} {}: {}'.format(
-                        time.strftime('%Y-%m-%d %H:%M:%S'),
-                        last_message.message_type.name,
-                        last_message.display_name,
-                        last_message.content))
-                except Exception as e:
-                    print(e)
-                    self.error_logger.exception(
-                        f"""Message type: {last_message.message_type} 
-                        Message content: {last_message.content} 
-                        User: {last_message.display_name}"""
-                    )
-                    self.send_public_message('Something went wrong. The error has been logged.')
-
-            time.sleep(.02)
+
+            if len(read_buffer) == 0:
+                self._reconnect(sock, 'Disconnected')
+                continue
+
+            # Every complete line gets handled, in order. A partial line at the end
+            # of the buffer waits in the framer until the next read completes it.
+            for line in line_framer.feed(read_buffer):
+                self.event_logger.info(f'received: {line}'.encode('utf-8'))
+                self._capture_line(line)
+                self._handle_line(line, bots)
+
+
+class TwitchChannel(object):
+    """
+    What a single channel's bot uses as its service when one TwitchService
+    has joined several channels.
+
+    The connection, the HTTP session and everything that doesn't care about the channel
+    are shared with the TwitchService. Sending messages and the channel specific lookups
+    run the same code as the service, but against this channel.
+    """
+    def __init__(self, service, channel):
+        self.service = service
+        self.channel = channel.lower()
+        self.display_channel = channel
+
+    @property
+    def channel_id(self):
+        return self.service.get_channel_id(self.channel)
+
+    def __getattr__(self, item):
+        return getattr(self.service, item)
+
+    def send_public_message(self, message_content):
+        self.service.send_public_message(message_content, channel=self.channel)
+
+    def send_private_message(self, recipient, whisper_content):
+        self.service.send_private_message(recipient, whisper_content, channel=self.channel)
+
+    # These run the service's own implementation with this channel in place of the service's channel.
+    def _get_all_users(self):
+        return type(self.service)._get_all_users(self)
+
+    def get_mods(self):
+        return type(self.service).get_mods(self)
+
+    def get_viewers(self):
+        return type(self.service).get_viewers(self)
+
+    def get_all_chatters(self):
+        return type(self.service).get_all_chatters(self)
+
+    def get_live_time(self):
+        return type(self.service).get_live_time(self)
+
+    def follow_time(self, userid, username):
+        return type(self.service).follow_time(self, userid, username)
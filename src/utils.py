@@ -1,14 +1,14 @@
 import functools
+import inspect
 import random
+import threading
 import time
 
-import gspread
-import praw
-
 from config import reddit_client_id
 from config import reddit_client_secret
 from config import reddit_user_agent
 from src.loggers import error_logger
+from src.queues import OutboundMessage, Priority
 
 
 # DECORATORS #
@@ -20,6 +20,7 @@ def retry_gspread_func(f):
 
     @functools.wraps(f)
     def wrapper(*args, **kwargs):
+        import gspread
         while True:
             try:
                 f(*args, **kwargs)
@@ -30,6 +31,10 @@ def retry_gspread_func(f):
             except (gspread.exceptions.GSpreadException, TypeError) as e:
                 print('Gspread failure; retrying')
                 error_logger.exception('Gspread failure')
+                # The cached sheet handles might be what's broken, so look them up again
+                sheets_client = getattr(args[0], 'sheets', None) if args else None
+                if sheets_client is not None:
+                    sheets_client.invalidate()
                 time.sleep(5)
                 continue
             break
@@ -37,6 +42,81 @@ def retry_gspread_func(f):
     return wrapper
 
 
+def requires_sheets(f):
+    """
+    For functions that use the google sheets, which take a little while to be ready after the bot starts.
+    Before then, commands from chat say the bot is still warming up, jobs on the command workers wait,
+    and anything else goes on the command queue to run once the sheets are ready.
+    The startup thread that gets the sheets ready runs them straight away.
+    If the bot was started without the sheets they don't run at all.
+    Queued calls are stored by keyword, so positional arguments are turned into keywords first.
+    """
+    signature = inspect.signature(f)
+
+    @functools.wraps(f)
+    def wrapper(self, *args, **kwargs):
+        if args:
+            kwargs = _keyword_arguments(signature, self, args, kwargs)
+        if not getattr(self, 'sheets_enabled', True):
+            if 'message' in kwargs:
+                add_to_appropriate_chat_queue(self, kwargs['message'], 'The spreadsheets are turned off.')
+            return None
+        current_thread = threading.current_thread()
+        if not self.sheets_ready.is_set() and current_thread is not self.startup_thread:
+            if 'message' in kwargs:
+                add_to_appropriate_chat_queue(self, kwargs['message'], 'Still warming up, try again in a minute.')
+                return None
+            if current_thread in getattr(self.command_queue, 'threads', ()):
+                self.sheets_ready.wait()
+            else:
+                add_to_command_queue(self, f.__name__, kwargs)
+                return None
+        return f(self, **kwargs)
+
+    return wrapper
+
+
+def _keyword_arguments(signature, self, args, kwargs):
+    """
+    The arguments of a call, everything but self, all by keyword.
+    Raises TypeError if they don't fit the signature or some can only be passed by position.
+    """
+    arguments = signature.bind(self, *args, **kwargs).arguments
+    parameters = list(signature.parameters.values())
+    keyword_arguments = {}
+    for parameter in parameters[1:]:
+        if parameter.name not in arguments:
+            continue
+        if parameter.kind == parameter.VAR_KEYWORD:
+            keyword_arguments.update(arguments[parameter.name])
+        elif parameter.kind in (parameter.POSITIONAL_ONLY, parameter.VAR_POSITIONAL):
+            raise TypeError(f"{parameter.name} can only be passed by position, so the call can't be queued")
+        else:
+            keyword_arguments[parameter.name] = arguments[parameter.name]
+    return keyword_arguments
+
+
+def uses_spreadsheet(sheet):
+    """
+    For functions that write to one of the bot's spreadsheets, like 'quotes'.
+    Only one of them runs at a time for each spreadsheet, so they never push over each other's changes
+    or the row hashes sheet_sync keeps. On the command workers they're queued one after another,
+    anywhere else they wait for the spreadsheet's lock.
+    Goes under requires_sheets, so nothing holds the lock while waiting for the sheets.
+    """
+    def decorator(f):
+        @functools.wraps(f)
+        def wrapper(self, *args, **kwargs):
+            # setdefault so two threads can't each make their own lock
+            with self.spreadsheet_locks.setdefault(sheet, threading.RLock()):
+                return f(self, *args, **kwargs)
+
+        wrapper._spreadsheet = sheet
+        return wrapper
+
+    return decorator
+
+
 def mod_only(f):
     f._mod_only = True
     return f
@@ -54,11 +134,13 @@ def public_message_disallowed(f):
 # END DECORATORS #
 
 
-def add_to_public_chat_queue(bot, content):
+def add_to_public_chat_queue(bot, content, priority=Priority.ANNOUNCEMENT):
     """
     Adds the message to the left side of the chat queue.
+    Messages that aren't a reply to anyone are announcements unless told otherwise,
+    and wait behind replies and moderation.
     """
-    bot.public_message_queue.appendleft(content)
+    bot.public_message_queue.appendleft(OutboundMessage(content, priority))
 
 
 def add_to_private_chat_queue(bot, user_display_name, content):
@@ -72,7 +154,7 @@ def add_to_private_chat_queue(bot, user_display_name, content):
 
 def add_to_appropriate_chat_queue(bot, message, content):
     if message.message_type.name == 'PUBLIC':
-        bot.public_message_queue.appendleft(content)
+        bot.public_message_queue.appendleft(OutboundMessage(content, Priority.REPLY, user=message.user))
     elif message.message_type.name == 'PRIVATE':
         user_display_name = message.display_name
         whisper_tuple = (user_display_name, content)
@@ -93,10 +175,22 @@ def add_to_command_queue(bot, function_name, kwargs=None):
     bot.command_queue.appendleft(command_tuple)
 
 
+def short_link(bot, link):
+    """
+    The bitly link for a sheet, or the whole link if pyshorteners isn't installed.
+    """
+    if bot.shortener is None:
+        return link
+    return bot.shortener.short(link)
+
+
 def fetch_random_reddit_post_title(subreddit, time_filter='day', limit=10):
     """
     Fetches a random title from the specified subreddit
     """
+    # praw is optional and slow to import, it's only needed here
+    import praw
+
     reddit_specific_words = ['reddit', 'karma', 'repost', 'vote', '/r/']
     valid_thoughts = []
     r = praw.Reddit(client_id=reddit_client_id,
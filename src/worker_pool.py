@@ -0,0 +1,143 @@
+import collections
+import threading
+import time
+
+
+class _PendingJob(object):
+    __slots__ = ('item', 'group', 'due', 'submitted')
+
+    def __init__(self, item, group, due, submitted):
+        self.item = item
+        self.group = group
+        self.due = due
+        self.submitted = submitted
+
+
+def command_key(command_tuple):
+    """
+    Commands with the same function name and arguments are the same job.
+    """
+    func, kwargs = command_tuple
+    return func, tuple(sorted((name, repr(value)) for name, value in kwargs.items()))
+
+
+class KeyedWorkerPool(object):
+    """
+    Runs jobs on a fixed number of threads, where every job has a key.
+
+    Jobs with different keys run side by side. Jobs with the same key never do:
+    one submitted while another with its key is waiting just replaces it, and one submitted
+    while its key is running waits for that run to finish. A job for a key that was submitted
+    less than debounce seconds ago waits until debounce seconds have passed without another one,
+    so a burst of them turns into one more run. A job that isn't being asked for again starts straight away.
+
+    Jobs can also share a group, like every job that writes to one spreadsheet. Jobs in a group
+    run one after another, in the order their keys were first submitted, even when a resubmitted
+    key is still waiting out its debounce. Unlike jobs with the same key none of them gets replaced.
+    A job without a group is in a group of its own key.
+
+    It has an appendleft that takes the bot's (function name, kwargs) command tuples,
+    so it can stand in for the old command queue. group is a function that takes one of those
+    and returns its group, or None.
+    """
+    def __init__(self, handler, max_workers=4, debounce=0.0, error_logger=None, name='worker', group=None):
+        self.handler = handler
+        self.group = group
+        self.debounce = debounce
+        self.error_logger = error_logger
+        self.condition = threading.Condition()
+        # key -> the job waiting to run for it, oldest first
+        self.pending = collections.OrderedDict()
+        # key -> when a job for it was last submitted, oldest first, only kept for debounce seconds
+        self.last_submitted = collections.OrderedDict()
+        # The groups with a job running
+        self.running = set()
+        self.recent_waits = collections.deque(maxlen=100)
+        self.counts = collections.Counter()
+        self.threads = []
+        for index in range(max_workers):
+            thread = threading.Thread(target=self._work, name=f'{name}-{index}')
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def _forget_old_submissions(self, now):
+        while self.last_submitted:
+            key, submitted = next(iter(self.last_submitted.items()))
+            if now - submitted < self.debounce:
+                break
+            del self.last_submitted[key]
+
+    def submit(self, key, item, group=None):
+        with self.condition:
+            now = time.monotonic()
+            self.counts['submitted'] += 1
+            self._forget_old_submissions(now)
+            due = now + self.debounce if key in self.last_submitted else now
+            if key in self.pending:
+                self.counts['collapsed'] += 1
+                submitted = self.pending[key].submitted
+            else:
+                submitted = now
+            # Replacing a waiting job keeps its place, the pending jobs stay in order of first submission
+            self.pending[key] = _PendingJob(item, key if group is None else group, due, submitted)
+            if self.debounce > 0:
+                self.last_submitted.pop(key, None)
+                self.last_submitted[key] = now
+            self.condition.notify()
+
+    def appendleft(self, command_tuple):
+        group = self.group(command_tuple) if self.group is not None else None
+        self.submit(command_key(command_tuple), command_tuple, group)
+
+    def __len__(self):
+        with self.condition:
+            return len(self.pending) + len(self.running)
+
+    def _next_job(self):
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                next_due = None
+                # Groups with a job running or an earlier job still waiting, nothing later in them can start
+                blocked = set(self.running)
+                for key, job in self.pending.items():
+                    if job.group in blocked:
+                        continue
+                    if job.due <= now:
+                        del self.pending[key]
+                        self.running.add(job.group)
+                        self.recent_waits.append(now - job.submitted)
+                        return key, job.group, job.item
+                    blocked.add(job.group)
+                    next_due = job.due if next_due is None else min(next_due, job.due)
+                self.condition.wait(None if next_due is None else next_due - now)
+
+    def _work(self):
+        while True:
+            key, group, item = self._next_job()
+            try:
+                self.handler(item)
+                self.counts['completed'] += 1
+            except Exception as e:
+                self.counts['failed'] += 1
+                print(f'{str(e)}: {key} failed')
+                if self.error_logger is not None:
+                    self.error_logger.exception(f'{key} failed')
+            finally:
+                with self.condition:
+                    self.running.discard(group)
+                    # Another job in this group may have been waiting on this one
+                    self.condition.notify_all()
+
+    def stats(self):
+        with self.condition:
+            waits = list(self.recent_waits)
+            return {'depth': len(self.pending),
+                    'running': len(self.running),
+                    'submitted': self.counts['submitted'],
+                    'collapsed': self.counts['collapsed'],
+                    'completed': self.counts['completed'],
+                    'failed': self.counts['failed'],
+                    'mean_wait_ms': sum(waits) / len(waits) * 1000 if waits else 0.0,
+                    'max_wait_ms': max(waits) * 1000 if waits else 0.0}
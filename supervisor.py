@@ -0,0 +1,15 @@
+import config
+from src.sharding import Supervisor
+
+
+bot_info = config.bot_info
+
+if __name__ == '__main__':
+    if config.service == config.Service.TWITCH:
+        supervisor = Supervisor(channels=[bot_info['channel']] + config.extra_channels,
+                                worker_count=config.worker_count,
+                                whisper_channel=bot_info['channel'])
+        supervisor.run()
+
+    else:
+        raise NotImplementedError("We don't actually care about anything but Twitch yet. Sorry")
@@ -0,0 +1,335 @@
+"""
+A small local IRC server that speaks enough of twitch's dialect for the bot to run against it.
+
+It handles the PASS/NICK/JOIN handshake and ends each NAMES list the way twitch does,
+acknowledges CAP REQs, PINGs its clients and sends tagged PRIVMSGs and WHISPERs
+from as many simulated chatters as you like. It can also drop every connection on a timer.
+Like twitch, it drops messages that break the chat rate limit and sends a msg_ratelimit NOTICE instead.
+
+Every so often a chatter sends the probe command, and each reply the bot sends to that
+channel is matched to the oldest unanswered probe to measure command to reply latency.
+
+Point irc_host and irc_port in config.py at it and start run.py:
+
+python tests/integration_tests/mock_twitch_server.py --channel somestreamer --chatters 300 --rate 50
+"""
+import argparse
+import collections
+import random
+import socket
+import socketserver
+import threading
+import time
+import uuid
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+class MockClient(object):
+    """
+    One connection to the mock server.
+    Lines can be sent to it from the handler and the simulator threads at the same time.
+    """
+    def __init__(self, request):
+        self.request = request
+        self.nick = None
+        self.channels = set()
+        self.lock = threading.Lock()
+        self.connected = True
+
+    def send_line(self, line):
+        with self.lock:
+            if not self.connected:
+                return
+            try:
+                self.request.sendall(f'{line}\r\n'.encode('utf-8'))
+            except OSError:
+                self.connected = False
+
+    def disconnect(self):
+        with self.lock:
+            self.connected = False
+            try:
+                # Shutting down, not just closing, so the client sees it even while the handler is reading
+                self.request.shutdown(socket.SHUT_RDWR)
+                self.request.close()
+            except OSError:
+                pass
+
+
+class MockTwitchHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        client = MockClient(self.request)
+        self.server.add_client(client)
+        try:
+            for raw_line in self.rfile:
+                if not client.connected:
+                    break
+                line = raw_line.decode('utf-8', errors='replace').rstrip('\r\n')
+                if line:
+                    self.server.handle_client_line(client, line)
+        except OSError:
+            pass
+        finally:
+            client.connected = False
+            self.server.remove_client(client)
+
+
+class MockTwitchServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 6667), probe_command='!quote', rate_limit=(20, 30)):
+        socketserver.ThreadingTCPServer.__init__(self, address, MockTwitchHandler)
+        self.probe_command = probe_command
+        # (messages, per this many seconds) the bot can send before they're dropped
+        self.rate_limit = rate_limit
+        self.sent_times = collections.defaultdict(collections.deque)
+        self.ratelimited = 0
+        self.clients = []
+        self.clients_lock = threading.Lock()
+        self.stats_lock = threading.Lock()
+        # channel -> deque of the times unanswered probes were sent
+        self.outstanding_probes = collections.defaultdict(collections.deque)
+        self.latencies = []
+        self.pong_count = 0
+        self.messages_from_bot = 0
+        self.whispers_from_bot = 0
+        self.messages_to_bot = 0
+        self.disconnects = 0
+        self.started = time.time()
+
+    def add_client(self, client):
+        with self.clients_lock:
+            self.clients.append(client)
+
+    def remove_client(self, client):
+        with self.clients_lock:
+            if client in self.clients:
+                self.clients.remove(client)
+
+    def clients_in(self, channel):
+        with self.clients_lock:
+            return [client for client in self.clients if channel in client.channels]
+
+    def handle_client_line(self, client, line):
+        command, _, rest = line.partition(' ')
+        if command == 'PASS':
+            pass
+        elif command == 'NICK':
+            client.nick = rest.strip().lower()
+            client.send_line(f':tmi.twitch.tv 001 {client.nick} :Welcome, GLHF!')
+            client.send_line(f':tmi.twitch.tv 376 {client.nick} :>')
+        elif command == 'JOIN':
+            for channel in rest.strip().split(','):
+                channel = channel.strip().lstrip('#').lower()
+                client.channels.add(channel)
+                nick = client.nick
+                client.send_line(f':{nick}!{nick}@{nick}.tmi.twitch.tv JOIN #{channel}')
+                client.send_line(f':{nick}.tmi.twitch.tv 353 {nick} = #{channel} :{nick}')
+                client.send_line(f':{nick}.tmi.twitch.tv 366 {nick} #{channel} :End of /NAMES list')
+                client.send_line(f'@badges=;color=;display-name={nick};emote-sets=0;mod=0;subscriber=0;user-type= '
+                                 f':tmi.twitch.tv USERSTATE #{channel}')
+                client.send_line(f'@emote-only=0;followers-only=-1;r9k=0;rituals=0;room-id=1;slow=0;subs-only=0 '
+                                 f':tmi.twitch.tv ROOMSTATE #{channel}')
+        elif command == 'CAP':
+            capability = rest.partition(':')[2]
+            client.send_line(f':tmi.twitch.tv CAP * ACK :{capability}')
+        elif command == 'PONG':
+            with self.stats_lock:
+                self.pong_count += 1
+        elif command == 'PRIVMSG':
+            target, _, content = rest.partition(' :')
+            channel = target.lstrip('#').lower()
+            now = time.time()
+            with self.stats_lock:
+                sent_times = self.sent_times[client.nick]
+                while sent_times and sent_times[0] < now - self.rate_limit[1]:
+                    sent_times.popleft()
+                if not content.startswith('/w ') and len(sent_times) >= self.rate_limit[0]:
+                    self.ratelimited += 1
+                    client.send_line(f'@msg-id=msg_ratelimit :tmi.twitch.tv NOTICE #{channel} '
+                                     f':Your message was not sent because you are sending messages too quickly.')
+                    return
+                if content.startswith('/w '):
+                    self.whispers_from_bot += 1
+                else:
+                    self.messages_from_bot += 1
+                    sent_times.append(now)
+                    if self.outstanding_probes[channel]:
+                        self.latencies.append(now - self.outstanding_probes[channel].popleft())
+
+    def send_chat(self, channel, chatter, content, is_mod=False):
+        """
+        Sends a tagged PRIVMSG from a simulated chatter to every client in the channel.
+        """
+        user_id = abs(hash(chatter)) % 10 ** 8
+        user_type = 'mod' if is_mod else ''
+        line = (f'@badges=;color=;display-name={chatter};emotes=;id={uuid.uuid4()};mod={int(is_mod)};'
+                f'room-id=1;subscriber=0;tmi-sent-ts={int(time.time() * 1000)};turbo=0;user-id={user_id};'
+                f'user-type={user_type} :{chatter.lower()}!{chatter.lower()}@{chatter.lower()}.tmi.twitch.tv '
+                f'PRIVMSG #{channel} :{content}')
+        clients = self.clients_in(channel)
+        with self.stats_lock:
+            self.messages_to_bot += len(clients)
+            if content.split(' ')[0] == self.probe_command and clients:
+                self.outstanding_probes[channel].append(time.time())
+        for client in clients:
+            client.send_line(line)
+
+    def send_whisper(self, chatter, content):
+        with self.clients_lock:
+            clients = list(self.clients)
+        for client in clients:
+            client.send_line(f'@badges=;color=;display-name={chatter};emotes=;message-id=1;thread-id=1;turbo=0;'
+                             f'user-id={abs(hash(chatter)) % 10 ** 8};user-type= '
+                             f':{chatter.lower()}!{chatter.lower()}@{chatter.lower()}.tmi.twitch.tv '
+                             f'WHISPER {client.nick} :{content}')
+
+    def ping_all(self):
+        with self.clients_lock:
+            clients = list(self.clients)
+        for client in clients:
+            client.send_line('PING :tmi.twitch.tv')
+
+    def disconnect_all(self):
+        with self.clients_lock:
+            clients = list(self.clients)
+        for client in clients:
+            client.disconnect()
+        with self.stats_lock:
+            self.disconnects += 1
+            self.outstanding_probes.clear()
+
+    def stats(self):
+        with self.stats_lock:
+            latencies = list(self.latencies)
+            elapsed = time.time() - self.started
+            return {
+                'clients': len(self.clients),
+                'messages_to_bot': self.messages_to_bot,
+                'messages_from_bot': self.messages_from_bot,
+                'whispers_from_bot': self.whispers_from_bot,
+                'replies_per_second': self.messages_from_bot / elapsed if elapsed > 0 else 0.0,
+                'probes_answered': len(latencies),
+                'probes_outstanding': sum(len(probes) for probes in self.outstanding_probes.values()),
+                'latency_p50_ms': percentile(latencies, 0.5) * 1000,
+                'latency_p99_ms': percentile(latencies, 0.99) * 1000,
+                'pongs': self.pong_count,
+                'ratelimited': self.ratelimited,
+                'disconnects': self.disconnects,
+            }
+
+
+class ChatSimulator(object):
+    """
+    Keeps a crowd of chatters talking in a channel at a steady rate,
+    sprinkling in probe commands, whispers, PINGs and (optionally) dropped connections.
+    """
+    def __init__(self, server, channel, chatters=100, rate=10.0, probe_rate=1.0, whisper_rate=0.0,
+                 ping_interval=60.0, disconnect_every=0.0,
+                 chatter_lines=('hello', 'PogChamp', '!guess 5', '!giveaway', 'what game is this?', '!deaths')):
+        self.server = server
+        self.channel = channel.lower()
+        self.chatters = [f'Chatter{index}' for index in range(chatters)]
+        self.rate = rate
+        self.probe_rate = probe_rate
+        self.whisper_rate = whisper_rate
+        self.ping_interval = ping_interval
+        self.disconnect_every = disconnect_every
+        self.chatter_lines = chatter_lines
+        self.running = False
+
+    def _every(self, rate, action):
+        if rate <= 0:
+            return
+        interval = 1 / rate
+        next_time = time.time()
+        while self.running:
+            next_time += interval
+            delay = next_time - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            if self.running:
+                action()
+
+    def _chat(self):
+        self.server.send_chat(self.channel, random.choice(self.chatters), random.choice(self.chatter_lines))
+
+    def _probe(self):
+        self.server.send_chat(self.channel, random.choice(self.chatters), self.server.probe_command)
+
+    def _whisper(self):
+        self.server.send_whisper(random.choice(self.chatters), random.choice(self.chatter_lines))
+
+    def start(self):
+        self.running = True
+        actions = [(self.rate, self._chat), (self.probe_rate, self._probe), (self.whisper_rate, self._whisper)]
+        if self.ping_interval > 0:
+            actions.append((1 / self.ping_interval, self.server.ping_all))
+        if self.disconnect_every > 0:
+            actions.append((1 / self.disconnect_every, self.server.disconnect_all))
+        for rate, action in actions:
+            thread = threading.Thread(target=self._every, args=(rate, action))
+            thread.daemon = True
+            thread.start()
+
+    def stop(self):
+        self.running = False
+
+
+def start_server(host='127.0.0.1', port=6667, probe_command='!quote', rate_limit=(20, 30)):
+    """
+    Starts a MockTwitchServer on a background thread and returns it.
+    Use port 0 to let the OS pick a free port, server.server_address has the one it picked.
+    """
+    server = MockTwitchServer((host, port), probe_command=probe_command, rate_limit=rate_limit)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run a mock twitch IRC server for load testing the bot.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6667)
+    parser.add_argument('--channel', action='append', required=True, help='Can be given more than once.')
+    parser.add_argument('--chatters', type=int, default=300)
+    parser.add_argument('--rate', type=float, default=20.0, help='Chat messages per second per channel.')
+    parser.add_argument('--probe-command', default='!quote', help='A command the bot always answers publicly.')
+    parser.add_argument('--probe-rate', type=float, default=1.0)
+    parser.add_argument('--whisper-rate', type=float, default=0.0)
+    parser.add_argument('--ping-interval', type=float, default=60.0)
+    parser.add_argument('--disconnect-every', type=float, default=0.0, help='Seconds between dropping every connection.')
+    parser.add_argument('--duration', type=float, default=0.0, help='Stop after this many seconds. 0 runs forever.')
+    parser.add_argument('--report-every', type=float, default=10.0)
+    args = parser.parse_args()
+
+    mock_server = start_server(args.host, args.port, args.probe_command)
+    print(f'Listening on {args.host}:{args.port}')
+    simulators = [ChatSimulator(mock_server, channel, chatters=args.chatters, rate=args.rate,
+                                probe_rate=args.probe_rate, whisper_rate=args.whisper_rate,
+                                ping_interval=args.ping_interval, disconnect_every=args.disconnect_every)
+                  for channel in args.channel]
+    for simulator in simulators:
+        simulator.start()
+
+    start_time = time.time()
+    try:
+        while True:
+            time.sleep(args.report_every)
+            print(mock_server.stats())
+            if args.duration and time.time() - start_time > args.duration:
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for simulator in simulators:
+            simulator.stop()
+        mock_server.shutdown()
@@ -0,0 +1,80 @@
+from inspect import getsourcefile
+import os
+import socket
+import sys
+import time
+
+import pytest
+
+current_path = os.path.abspath(getsourcefile(lambda: 0))
+current_dir = os.path.dirname(current_path)
+sys.path.append(current_dir)
+
+from mock_twitch_server import ChatSimulator, start_server
+
+
+def read_until(sock, text, timeout=5):
+    sock.settimeout(timeout)
+    received = ''
+    while text not in received:
+        data = sock.recv(4096)
+        if not data:
+            break
+        received += data.decode('utf-8')
+    return received
+
+
+@pytest.fixture
+def mock_server():
+    server = start_server(port=0)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def bot_socket(mock_server):
+    sock = socket.create_connection(mock_server.server_address)
+    sock.sendall(b'PASS oauth:test\r\nNICK TestBot\r\nJOIN #first,#second\r\n')
+    yield sock
+    sock.close()
+
+
+def test_handshake_ends_names_list_per_channel(bot_socket):
+    received = read_until(bot_socket, '#second :End of /NAMES list')
+    assert ':testbot.tmi.twitch.tv 366 testbot #first :End of /NAMES list' in received
+    bot_socket.sendall(b'CAP REQ :twitch.tv/tags\r\n')
+    assert 'CAP * ACK :twitch.tv/tags' in read_until(bot_socket, 'ACK')
+
+
+def test_chat_reaches_joined_channels_and_replies_are_timed(mock_server, bot_socket):
+    read_until(bot_socket, '#second :End of /NAMES list')
+    mock_server.send_chat('first', 'Chatter1', '!quote')
+    received = read_until(bot_socket, 'PRIVMSG #first :!quote')
+    assert 'display-name=Chatter1;' in received
+    bot_socket.sendall(b'PRIVMSG #first :#1 a quote\r\n')
+    time.sleep(0.2)
+    stats = mock_server.stats()
+    assert stats['messages_from_bot'] == 1
+    assert stats['probes_answered'] == 1
+
+
+def test_simulated_disconnect(mock_server, bot_socket):
+    read_until(bot_socket, '#second :End of /NAMES list')
+    simulator = ChatSimulator(mock_server, 'first', chatters=5, rate=50, probe_rate=0, ping_interval=0,
+                              disconnect_every=0.3)
+    simulator.start()
+    time.sleep(0.6)
+    simulator.stop()
+    bot_socket.settimeout(1)
+    received = b''
+    try:
+        while True:
+            data = bot_socket.recv(4096)
+            if not data:
+                break
+            received += data
+    except OSError:
+        pass
+    assert b'PRIVMSG #first' in received
+    assert mock_server.stats()['disconnects'] >= 1
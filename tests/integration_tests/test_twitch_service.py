@@ -0,0 +1,121 @@
+from inspect import getsourcefile
+import logging
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+current_path = os.path.abspath(getsourcefile(lambda: 0))
+current_dir = os.path.dirname(current_path)
+root_dir = os.path.join(current_dir, os.pardir, os.pardir)
+sys.path.append(current_dir)
+sys.path.append(root_dir)
+
+from mock_twitch_server import start_server
+from src.connection import Backoff
+from src.twitch_service import TwitchService
+
+logger = logging.getLogger('test_twitch_service')
+
+
+class RecordingBot(object):
+    def __init__(self):
+        self.messages = []
+
+    def _act_on(self, message):
+        self.messages.append(message.content)
+
+
+@pytest.fixture
+def mock_server():
+    server = start_server(port=0, rate_limit=(1000, 30))
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def service(mock_server, monkeypatch):
+    monkeypatch.setattr(TwitchService, '_get_user_id_from_user_name', lambda self, username: f'id-{username}')
+    service = TwitchService(pw='oauth:test', user='first', channel='first', twitch_api_client_id='',
+                            error_logger=logger, event_logger=logger, extra_channels=['second'],
+                            host='127.0.0.1', port=mock_server.server_address[1],
+                            handshake_timeout=2, backoff=Backoff(base_delay=0.05, max_delay=0.2))
+    bots = {'first': RecordingBot(), 'second': RecordingBot()}
+    run_thread = threading.Thread(target=service.run, args=(bots,))
+    run_thread.daemon = True
+    run_thread.start()
+    service.bots = bots
+    return service
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_chat_is_routed_to_each_channels_bot(mock_server, service):
+    mock_server.send_chat('first', 'Chatter1', 'hello first')
+    mock_server.send_chat('second', 'Chatter2', 'hello second')
+    assert wait_for(lambda: service.bots['first'].messages and service.bots['second'].messages)
+    assert service.bots['first'].messages == ['hello first']
+    assert service.bots['second'].messages == ['hello second']
+
+
+class SlowSocket(object):
+    """
+    Takes a while over every sendall, like a connection with a full send buffer.
+    """
+    def __init__(self, sock):
+        self.sock = sock
+
+    def sendall(self, data):
+        time.sleep(0.05)
+        self.sock.sendall(data)
+
+    def __getattr__(self, name):
+        return getattr(self.sock, name)
+
+
+def test_lines_sent_together_are_written_together(mock_server, service):
+    assert wait_for(service.connected.is_set)
+    service.sock = SlowSocket(service.sock)
+    senders = [threading.Thread(target=service.get_channel('first').send_public_message, args=(f'message {index}',))
+               for index in range(20)]
+    for sender in senders:
+        sender.start()
+    for sender in senders:
+        sender.join()
+    assert wait_for(lambda: mock_server.stats()['messages_from_bot'] == 20)
+    assert service.write_stats()['lines_written'] == 20
+    # The lines that came in while a write was going out are written together
+    assert service.write_stats()['writes'] < 20
+    assert service.write_stats()['lines_per_write'] > 1
+
+
+def test_sending_survives_a_dropped_connection(mock_server, service):
+    service.send_public_message('before')
+    assert wait_for(lambda: mock_server.stats()['messages_from_bot'] == 1)
+    line_framer = service.line_framer
+    # Half a line the old connection never finishes
+    for client in list(mock_server.clients):
+        client.request.sendall(b'@display-name=Chatter1 :chatter1!chatter1@chatter1.tmi.twitch.tv PRIVMSG #first :half')
+    mock_server.disconnect_all()
+    assert wait_for(lambda: service.reconnect_count == 1 and service.connected.is_set())
+    assert service.line_framer is not line_framer
+    service.send_public_message('after')
+    assert wait_for(lambda: mock_server.stats()['messages_from_bot'] == 2)
+    mock_server.send_chat('first', 'Chatter2', 'whole')
+    assert wait_for(lambda: service.bots['first'].messages)
+    assert service.bots['first'].messages == ['whole']
+
+
+def test_pings_are_answered(mock_server, service):
+    mock_server.ping_all()
+    assert wait_for(lambda: mock_server.stats()['pongs'] == 1)
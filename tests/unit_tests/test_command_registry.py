@@ -0,0 +1,158 @@
+from inspect import getsourcefile
+from collections import deque
+import os
+import sys
+
+import pytest
+import sqlalchemy
+from sqlalchemy.orm import sessionmaker
+
+current_path = os.path.abspath(getsourcefile(lambda: 0))
+current_dir = os.path.dirname(current_path)
+root_dir = os.path.join(current_dir, os.pardir, os.pardir)
+sys.path.append(root_dir)
+
+import src.models as models
+import src.utils as utils
+from src.bot import Bot, CommandTypes
+from src.command_registry import CommandRegistry, DynamicCommandCache, command_names
+from src.message import Message
+from src.twitch_service import MessageTypes, TwitchService
+
+
+class FakeMixin:
+    def __init__(self):
+        self.calls = []
+
+    def hello(self, message):
+        """Says hello"""
+        self.calls.append(('hello', message.content))
+
+    @utils.mod_only
+    @utils.private_message_allowed
+    def reset(self, db_session):
+        self.calls.append(('reset', db_session))
+
+    @utils.public_message_disallowed
+    def secret(self, message, db_session):
+        self.calls.append(('secret', message.content, db_session))
+
+    def _helper(self):
+        pass
+
+
+class FakeSession(object):
+    def __init__(self):
+        self.info = {}
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def bot():
+    bot_class = type('Bot', (Bot, FakeMixin), {'plugins': ('fake',), 'mixin_classes': (FakeMixin,)})
+    bot = bot_class.__new__(bot_class)
+    FakeMixin.__init__(bot)
+    bot.service = TwitchService
+    bot.Session = FakeSession
+    bot.command_registry = CommandRegistry(bot)
+    bot.dynamic_commands = DynamicCommandCache()
+    bot.public_message_queue = deque()
+    return bot
+
+
+def test_only_plugin_commands_are_registered(bot):
+    assert sorted(bot.command_registry.records) == ['hello', 'reset', 'secret']
+    assert 'queue_stats' not in bot.command_registry and 'Session' not in bot.command_registry
+
+
+def test_records_have_their_flags(bot):
+    reset = bot.command_registry.get('reset')
+    assert reset.mod_only and reset.message_types == {'PUBLIC', 'PRIVATE'}
+    assert bot.command_registry.get('secret').message_types == frozenset()
+    assert bot.command_registry.get('hello').doc == 'Says hello'
+    assert bot.command_registry.sorted_methods() == {'for_mods': ['reset'], 'for_all': ['hello', 'secret'],
+                                                     'private_message_allowed': ['reset'],
+                                                     'public_message_disallowed': ['secret']}
+
+
+def test_invokers_pass_what_the_command_takes(bot):
+    message = Message(message_type=MessageTypes.PUBLIC, content='!hello')
+    for name in ['hello', 'reset', 'secret']:
+        bot.command_registry.get(name).invoke(message, 'session')
+    assert bot.calls == [('hello', '!hello'), ('reset', 'session'), ('secret', '!hello', 'session')]
+
+
+def test_dispatch_checks_permissions_and_message_types(bot):
+    def message(content, is_mod=False, message_type=MessageTypes.PUBLIC):
+        return Message(message_type=message_type, display_name='Someone', content=content, is_mod=is_mod)
+
+    command = bot._get_command(message('!HELLO there'))
+    assert command[0] == CommandTypes.HARDCODED and command[1].name == 'hello'
+    bot._act_on(message('!reset'))
+    bot._act_on(message('!secret'))
+    bot._act_on(message('!hello', message_type=MessageTypes.PRIVATE))
+    assert bot.calls == []
+    bot._act_on(message('!reset', is_mod=True))
+    bot._act_on(message('!secret', is_mod=True))
+    assert [call[0] for call in bot.calls] == ['reset', 'secret']
+
+
+def test_dynamic_commands_load_with_their_permissions():
+    engine = sqlalchemy.create_engine('sqlite://')
+    models.Base.metadata.create_all(engine)
+    db_session = sessionmaker(bind=engine)()
+    db_session.add_all([models.Command(call='discord', response='Join us'),
+                        models.Command(call='secret', response='Shh', permissions=[models.Permission(user_entity='Friend')])])
+    db_session.commit()
+
+    cache = DynamicCommandCache()
+    cache.load(db_session)
+    db_session.close()
+    assert len(cache) == 2
+    assert cache.get('discord').allowed_users == frozenset()
+    assert cache.get('secret').response == 'Shh' and cache.get('secret').allowed_users == {'Friend'}
+
+
+def test_unknown_words_never_open_a_session(bot):
+    def no_session():
+        raise AssertionError('opened a database session')
+
+    bot.Session = no_session
+    bot.dynamic_commands.put('discord', 'Join us')
+    bot.dynamic_commands.put('vip', 'Shh', ['Friend'])
+    for content in ['!typo', '!discord', '!vip', 'just chatting']:
+        bot._act_on(Message(message_type=MessageTypes.PUBLIC, display_name='Someone', content=content, is_mod=False))
+    bot._act_on(Message(message_type=MessageTypes.PUBLIC, display_name='Friend', content='!vip', is_mod=False))
+    assert list(bot.public_message_queue) == ['Shh', 'Join us']
+
+
+def test_plugin_helpers_are_not_commands():
+    from src.core_modules.death_guessing import DeathGuessingMixin
+    names = command_names([DeathGuessingMixin])
+    assert 'guess' in names and 'show_guesses' in names
+    assert not any(name.startswith('_') or 'spreadsheet' in name for name in names)
+    assert '_helper' not in command_names([FakeMixin])
+
+
+def test_dynamic_command_changes_wait_for_the_commit(bot):
+    class FailingSession(FakeSession):
+        def commit(self):
+            raise RuntimeError('database is locked')
+
+    def add_vip(message, db_session):
+        bot.dynamic_commands.put_after_commit(db_session, 'vip', 'Shh')
+
+    bot.command_registry.get('reset').invoke = add_vip
+    reset = Message(message_type=MessageTypes.PUBLIC, display_name='Mod', content='!reset', is_mod=True)
+    bot.Session = FailingSession
+    with pytest.raises(RuntimeError):
+        bot._act_on(reset)
+    assert 'vip' not in bot.dynamic_commands
+    bot.Session = FakeSession
+    bot._act_on(reset)
+    assert bot.dynamic_commands.get('vip').response == 'Shh'
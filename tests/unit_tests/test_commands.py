@@ -13,6 +13,7 @@ root_dir = os.path.join(current_dir, os.pardir, os.pardir)
 sys.path.append(root_dir)
 
 import src.core_modules.commands as commands
+from src.command_registry import DynamicCommandCache
 from src.message import Message
 from src.models import Command
 
@@ -34,12 +35,15 @@ class MessageTypes(Enum):
 
 @pytest.fixture
 def mock_db_session():
-    return Mock()
+    return Mock(info={})
 
 
 @pytest.fixture
 def command_mixin_obj():
-    command_mixin_obj = commands.CommandsMixin()
+    command_mixin_obj = commands.CommandsMixin.__new__(commands.CommandsMixin)
+    command_mixin_obj.starting_spreadsheets_list = []
+    commands.CommandsMixin.__init__(command_mixin_obj)
+    command_mixin_obj.dynamic_commands = DynamicCommandCache()
     command_mixin_obj.public_message_queue = deque()
     command_mixin_obj.command_queue = deque()
     command_mixin_obj.service = Service()
@@ -143,3 +147,28 @@ def test_command_delete(command_mixin_obj, mock_db_session):
     assert command_mixin_obj.public_message_queue[0] == 'Command deleted.'
     assert len(command_mixin_obj.command_queue) == 1
 
+
+
+def test_command_changes_reach_the_dynamic_command_cache(command_mixin_obj, mock_db_session):
+    filter_val = mock_db_session.query.return_value.filter.return_value
+    filter_val.one_or_none.return_value = None
+    command_mixin_obj.add_command(Message(content="!add_command SomeUser !test this is a test",
+                                          message_type=MessageTypes.PUBLIC), mock_db_session)
+    # Nothing changes until the session commits
+    assert 'test' not in command_mixin_obj.dynamic_commands
+    command_mixin_obj.dynamic_commands.apply_committed(mock_db_session)
+    cached = command_mixin_obj.dynamic_commands.get('test')
+    assert cached.response == 'this is a test' and cached.allowed_users == {'someuser'}
+
+    db_command = Command(call='test', response='this is a test')
+    filter_val.one_or_none.return_value = db_command
+    command_mixin_obj.edit_command(Message(content="!edit_command !test different now",
+                                           message_type=MessageTypes.PUBLIC), mock_db_session)
+    command_mixin_obj.dynamic_commands.apply_committed(mock_db_session)
+    assert command_mixin_obj.dynamic_commands.get('test').response == 'different now'
+
+    command_mixin_obj.delete_command(Message(content="!delete_command !test", message_type=MessageTypes.PUBLIC),
+                                     mock_db_session)
+    assert 'test' in command_mixin_obj.dynamic_commands
+    command_mixin_obj.dynamic_commands.apply_committed(mock_db_session)
+    assert 'test' not in command_mixin_obj.dynamic_commands
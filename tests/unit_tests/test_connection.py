@@ -0,0 +1,34 @@
+from inspect import getsourcefile
+import os
+import sys
+
+current_path = os.path.abspath(getsourcefile(lambda: 0))
+current_dir = os.path.dirname(current_path)
+root_dir = os.path.join(current_dir, os.pardir, os.pardir)
+sys.path.append(root_dir)
+
+from src.connection import Backoff
+
+
+def test_backoff_limit_doubles_up_to_the_max():
+    backoff = Backoff(base_delay=1, max_delay=10)
+    limits = []
+    for _ in range(6):
+        limits.append(backoff.limit())
+        backoff.next_delay()
+    assert limits == [1, 2, 4, 8, 10, 10]
+
+
+def test_backoff_delays_stay_within_the_limit():
+    backoff = Backoff(base_delay=1, max_delay=10)
+    for _ in range(50):
+        limit = backoff.limit()
+        assert 0 <= backoff.next_delay() <= limit
+
+
+def test_backoff_reset():
+    backoff = Backoff(base_delay=1, max_delay=10)
+    for _ in range(5):
+        backoff.next_delay()
+    backoff.reset()
+    assert backoff.limit() == 1
@@ -0,0 +1,34 @@
+from inspect import getsourcefile
+import os
+import sys
+
+import gspread
+
+current_path = os.path.abspath(getsourcefile(lambda: 0))
+current_dir = os.path.dirname(current_path)
+root_dir = os.path.join(current_dir, os.pardir, os.pardir)
+sys.path.append(root_dir)
+
+import src.core_modules.death_guessing as death_guessing
+import src.utils as utils
+
+
+def test_a_failed_push_doesnt_set_the_worksheet_up_again(monkeypatch):
+    monkeypatch.setattr(utils.time, 'sleep', lambda seconds: None)
+    calls = []
+
+    class Guessing(death_guessing.DeathGuessingMixin):
+        def _prepare_player_guesses_worksheet(self, spreadsheet_name):
+            calls.append('prepare')
+
+        @utils.retry_gspread_func
+        def _update_player_guesses_spreadsheet(self):
+            calls.append('push')
+            if calls.count('push') == 1:
+                raise gspread.exceptions.GSpreadException('Backend error')
+
+    guessing = Guessing.__new__(Guessing)
+    guessing.spreadsheet_locks = {}
+    guessing.sheets = None
+    guessing._initialize_player_guesses_spreadsheet('channel-bot-player_guesses')
+    assert calls == ['prepare', 'push', 'push']
@@ -0,0 +1,88 @@
+from inspect import getsourcefile
+import os
+import sys
+
+current_path = os.path.abspath(getsourcefile(lambda: 0))
+current_dir = os.path.dirname(current_path)
+root_dir = os.path.join(current_dir, os.pardir, os.pardir)
+sys.path.append(root_dir)
+
+import src.google_auth as google_auth
+
+
+class Credentials:
+    def authorize(self, http):
+        return http
+
+
+class Request:
+    def __init__(self, result, log):
+        self.result = result
+        self.log = log
+
+    def execute(self, http=None):
+        self.log.append(http)
+        return self.result
+
+
+class Files:
+    def __init__(self, drive):
+        self.drive = drive
+
+    def list(self, q, pageToken=None, **kwargs):
+        self.drive.calls.append(('list', pageToken))
+        return Request(self.drive.pages[pageToken], self.drive.https)
+
+    def get(self, fileId, **kwargs):
+        self.drive.calls.append(('get', fileId))
+        return Request(self.drive.files_by_id[fileId], self.drive.https)
+
+    def create(self, body, **kwargs):
+        self.drive.calls.append(('create', body['name']))
+        return Request({'id': 'new-id'}, self.drive.https)
+
+
+class Permissions:
+    def __init__(self, drive):
+        self.drive = drive
+
+    def create(self, fileId, body):
+        self.drive.calls.append(('share', fileId))
+        return Request({}, self.drive.https)
+
+
+class Drive:
+    def __init__(self, pages=None, files_by_id=None):
+        self.pages = pages or {None: {'files': []}}
+        self.files_by_id = files_by_id or {}
+        self.calls = []
+        self.https = []
+
+    def files(self):
+        return Files(self)
+
+    def permissions(self):
+        return Permissions(self)
+
+
+def test_find_file_follows_pages():
+    drive = Drive(pages={None: {'files': [{'id': '1', 'name': 'other'}], 'nextPageToken': 'page-2'},
+                         'page-2': {'files': [{'id': '2', 'name': 'chan-bot-quotes'}]}})
+    assert google_auth.ensure_file_exists(Credentials(), 'chan-bot-quotes', service=drive) == (True, '2')
+    assert drive.calls == [('list', None), ('list', 'page-2')]
+    # Every request gets its own http, so lookups can run in parallel
+    assert drive.https[0] is not drive.https[1]
+
+
+def test_known_id_is_only_checked():
+    drive = Drive(files_by_id={'abc': {'id': 'abc', 'name': 'chan-bot-quotes', 'trashed': False}})
+    assert google_auth.ensure_file_exists(Credentials(), 'chan-bot-quotes', service=drive,
+                                          known_file_id='abc') == (True, 'abc')
+    assert drive.calls == [('get', 'abc')]
+
+
+def test_trashed_known_id_is_replaced():
+    drive = Drive(files_by_id={'abc': {'id': 'abc', 'name': 'chan-bot-quotes', 'trashed': True}})
+    assert google_auth.ensure_file_exists(Credentials(), 'chan-bot-quotes', service=drive,
+                                          known_file_id='abc') == (False, 'new-id')
+    assert drive.calls == [('get', 'abc'), ('list', None), ('create', 'chan-bot-quotes'), ('share', 'new-id')]
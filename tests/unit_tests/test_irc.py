@@ -0,0 +1,94 @@
+from inspect import getsourcefile
+import os
+import sys
+
+current_path = os.path.abspath(getsourcefile(lambda: 0))
+current_dir = os.path.dirname(current_path)
+root_dir = os.path.join(current_dir, os.pardir, os.pardir)
+sys.path.append(root_dir)
+
+from src.irc import LineFramer, parse_line, unescape_tag_value
+
+
+def test_framer_returns_every_line():
+    framer = LineFramer()
+    lines = framer.feed(b'PING :tmi.twitch.tv\r\n:a!a@a PRIVMSG #c :!guess 5\r\n:b!b@b PRIVMSG #c :!giveaway\r\n')
+    assert lines == ['PING :tmi.twitch.tv', ':a!a@a PRIVMSG #c :!guess 5', ':b!b@b PRIVMSG #c :!giveaway']
+    assert framer.pending == ''
+
+
+def test_framer_keeps_partial_line():
+    framer = LineFramer()
+    assert framer.feed(b':a!a@a PRIVMSG #c :!gue') == []
+    assert framer.pending == ':a!a@a PRIVMSG #c :!gue'
+    assert framer.feed(b'ss 5\r\n:b!b@b PRI') == [':a!a@a PRIVMSG #c :!guess 5']
+    assert framer.feed(b'VMSG #c :hi\r\n') == [':b!b@b PRIVMSG #c :hi']
+
+
+def test_framer_line_ending_split_across_reads():
+    framer = LineFramer()
+    assert framer.feed(b'PING :tmi.twitch.tv\r') == []
+    assert framer.feed(b'\n') == ['PING :tmi.twitch.tv']
+
+
+def test_framer_multibyte_character_split_across_reads():
+    framer = LineFramer()
+    encoded = 'PRIVMSG #c :café\r\n'.encode('utf-8')
+    split_point = encoded.index(b'\xc3') + 1
+    assert framer.feed(encoded[:split_point]) == []
+    assert framer.feed(encoded[split_point:]) == ['PRIVMSG #c :café']
+
+
+def test_framer_bad_byte_only_costs_one_character():
+    framer = LineFramer()
+    lines = framer.feed(b'PRIVMSG #c :bad \xff byte\r\nPRIVMSG #c :fine\r\n')
+    assert lines == ['PRIVMSG #c :bad � byte', 'PRIVMSG #c :fine']
+
+
+def test_framer_reset_drops_partial_line():
+    framer = LineFramer()
+    framer.feed(b'PRIVMSG #c :half')
+    framer.reset()
+    assert framer.feed(b'PING :tmi.twitch.tv\r\n') == ['PING :tmi.twitch.tv']
+
+
+def test_parse_privmsg():
+    parsed = parse_line('@display-name=Al;user-id=5;user-type=mod :al!al@al.tmi.twitch.tv PRIVMSG #chan :!quote add a: b')
+    assert parsed.command == 'PRIVMSG'
+    assert parsed.params == ['#chan']
+    assert parsed.channel == 'chan'
+    assert parsed.nick == 'al'
+    assert parsed.trailing == '!quote add a: b'
+    assert parsed.get_tag('display-name') == 'Al'
+    assert parsed.get_tag('user-id') == '5'
+    assert parsed.get_tag('user-type') == 'mod'
+
+
+def test_parse_ignores_tags_in_message_text():
+    parsed = parse_line('@display-name=Al;user-type= :al!al@al.tmi.twitch.tv PRIVMSG #chan :user-type=mod display-name=Bob')
+    assert parsed.get_tag('user-type') == ''
+    assert parsed.get_tag('display-name') == 'Al'
+
+
+def test_parse_untagged_lines():
+    ping = parse_line('PING :tmi.twitch.tv')
+    assert ping.command == 'PING'
+    assert ping.trailing == 'tmi.twitch.tv'
+    assert ping.tags == {}
+    names = parse_line(':bot.tmi.twitch.tv 366 bot #chan :End of /NAMES list')
+    assert names.command == '366'
+    assert names.params == ['bot', '#chan']
+    assert names.get_tag('user-id') is None
+
+
+def test_parse_whisper():
+    parsed = parse_line('@display-name=Al;user-id=5 :al!al@al.tmi.twitch.tv WHISPER bot :hello there')
+    assert parsed.command == 'WHISPER'
+    assert parsed.channel is None
+    assert parsed.trailing == 'hello there'
+
+
+def test_unescape_tag_value():
+    assert unescape_tag_value('plain') == 'plain'
+    assert unescape_tag_value(r'a\sb\:c\\d') == 'a b;c\\d'
+    assert unescape_tag_value('trailing\\') == 'trailing'
@@ -0,0 +1,87 @@
+from inspect import getsourcefile
+import os
+import sys
+import time
+
+current_path = os.path.abspath(getsourcefile(lambda: 0))
+current_dir = os.path.dirname(current_path)
+root_dir = os.path.join(current_dir, os.pardir, os.pardir)
+sys.path.append(root_dir)
+
+from src.outbound import DuplicateFilter, DuplicatePolicy, byte_length, next_chat_messages, split_message
+from src.queues import OutboundMessage, Priority, PriorityMessageQueue
+
+
+def test_short_message_is_not_split():
+    assert split_message('hello there') == ['hello there']
+
+
+def test_split_on_word_boundaries_by_bytes():
+    content = ' '.join(['café'] * 200)
+    parts = split_message(content, max_bytes=100)
+    assert all(byte_length(part) <= 100 for part in parts)
+    assert ' '.join(parts) == content
+    assert all(part.split(' ') == ['café'] * len(part.split(' ')) for part in parts)
+
+
+def test_split_a_word_longer_than_a_message():
+    parts = split_message('é' * 60, max_bytes=25)
+    assert parts == ['é' * 12, 'é' * 12, 'é' * 12, 'é' * 12, 'é' * 12]
+
+
+def test_queued_short_messages_go_out_together():
+    queue = PriorityMessageQueue()
+    for content in ['Deaths: 5', 'Uptime: 1 hour', '!ban_roulette someone', 'Winner: Al']:
+        queue.appendleft(OutboundMessage(content, Priority.REPLY))
+    assert next_chat_messages(queue) == ['Deaths: 5 | Uptime: 1 hour']
+    assert next_chat_messages(queue) == ['!ban_roulette someone']
+    assert next_chat_messages(queue) == ['Winner: Al']
+    assert len(queue) == 0
+
+
+def test_coalescing_stops_at_the_limit():
+    queue = PriorityMessageQueue()
+    queue.appendleft('a' * 60)
+    queue.appendleft('b' * 30)
+    queue.appendleft('c' * 10)
+    assert next_chat_messages(queue, max_bytes=100) == ['a' * 60 + ' | ' + 'b' * 30]
+    assert next_chat_messages(queue, max_bytes=100) == ['c' * 10]
+
+
+def test_long_queued_message_is_split():
+    queue = PriorityMessageQueue()
+    queue.appendleft(' '.join(['word'] * 200))
+    parts = next_chat_messages(queue)
+    assert len(parts) == 2
+    assert all(byte_length(part) <= 500 for part in parts)
+
+
+def test_duplicate_filter_drop():
+    duplicate_filter = DuplicateFilter(policy=DuplicatePolicy.DROP)
+    assert duplicate_filter.check('chan', 'hello') == ('hello', 0)
+    assert duplicate_filter.check('chan', 'hello') == (None, 0)
+    assert duplicate_filter.check('other', 'hello') == ('hello', 0)
+    assert duplicate_filter.stats()['dropped'] == 1
+    assert duplicate_filter.stats()['wasted_sends_avoided'] == 1
+
+
+def test_duplicate_filter_vary():
+    duplicate_filter = DuplicateFilter(policy=DuplicatePolicy.VARY)
+    first, _ = duplicate_filter.check('chan', 'hello')
+    second, _ = duplicate_filter.check('chan', 'hello')
+    third, _ = duplicate_filter.check('chan', 'hello')
+    assert len({first, second, third}) == 3
+    assert second.startswith('hello ') and third.startswith('hello ')
+    # Both were still sent
+    assert duplicate_filter.stats()['varied'] == 2
+    assert duplicate_filter.stats()['wasted_sends_avoided'] == 0
+
+
+def test_duplicate_filter_delay_and_window():
+    duplicate_filter = DuplicateFilter(window=0.05, policy=DuplicatePolicy.DELAY)
+    duplicate_filter.check('chan', 'hello')
+    content, delay = duplicate_filter.check('chan', 'hello')
+    assert content == 'hello'
+    assert 0 < delay <= 0.05
+    time.sleep(0.06)
+    assert duplicate_filter.check('chan', 'hello') == ('hello', 0)
@@ -0,0 +1,50 @@
+from inspect import getsourcefile
+import os
+import subprocess
+import sys
+
+import pytest
+
+current_path = os.path.abspath(getsourcefile(lambda: 0))
+current_dir = os.path.dirname(current_path)
+root_dir = os.path.join(current_dir, os.pardir, os.pardir)
+sys.path.append(root_dir)
+
+import src.plugins as plugins
+from src.bot import Bot, bot_class
+from src.core_modules.commands import CommandsMixin
+from src.core_modules.quotes import QuotesMixin
+
+
+def test_channels_can_have_their_own_plugins():
+    channel_plugins = {'quotechannel': ['quotes', 'commands', 'quotes']}
+    assert plugins.enabled_plugins('QuoteChannel', ['uptime'], channel_plugins) == ['quotes', 'commands']
+    assert plugins.enabled_plugins('other', ['uptime'], channel_plugins) == ['uptime']
+
+
+def test_unknown_plugins_are_refused():
+    with pytest.raises(ValueError):
+        plugins.enabled_plugins('channel', ['quotes', 'qoutes'], {})
+
+
+def test_bot_class_only_has_the_enabled_mixins():
+    quotes_bot = bot_class(['quotes'])
+    assert issubclass(quotes_bot, Bot) and issubclass(quotes_bot, QuotesMixin)
+    assert not issubclass(quotes_bot, CommandsMixin)
+    assert quotes_bot.plugins == ('quotes',)
+    assert hasattr(quotes_bot, 'show_quotes') and not hasattr(quotes_bot, 'show_commands')
+    assert bot_class(['quotes']) is quotes_bot
+    assert 'quotes' in plugins.load_timings
+
+
+def test_disabled_plugins_are_never_imported():
+    code = ('import sys; from src.bot import bot_class; bot_class(["uptime"]); '
+            'print(",".join(sorted(name for name in sys.modules if name.startswith("src.core_modules."))))')
+    result = subprocess.run([sys.executable, '-c', code], cwd=root_dir, stdout=subprocess.PIPE,
+                            universal_newlines=True, check=True)
+    assert result.stdout.strip() == 'src.core_modules.uptime'
+
+
+def test_only_plugins_with_a_sheet_need_google():
+    assert plugins.uses_sheets(['uptime', 'quotes'])
+    assert not plugins.uses_sheets(['uptime', 'shout_out'])
@@ -0,0 +1,100 @@
+from inspect import getsourcefile
+import os
+import sys
+import threading
+import time
+
+current_path = os.path.abspath(getsourcefile(lambda: 0))
+current_dir = os.path.dirname(current_path)
+root_dir = os.path.join(current_dir, os.pardir, os.pardir)
+sys.path.append(root_dir)
+
+from src.queues import OutboundMessage, Priority, PriorityMessageQueue, WaitableDeque
+
+
+def test_behaves_like_the_old_deque():
+    queue = WaitableDeque()
+    queue.appendleft('first')
+    queue.appendleft('second')
+    assert queue[0] == 'second'
+    assert len(queue) == 2
+    assert queue.pop() == 'first'
+
+
+def test_wait_times_out_when_empty():
+    queue = WaitableDeque()
+    start = time.monotonic()
+    assert queue.wait(timeout=0.05) is False
+    assert time.monotonic() - start >= 0.05
+
+
+def test_wait_wakes_up_when_something_arrives():
+    queue = WaitableDeque()
+    popped = []
+
+    def consume():
+        queue.wait()
+        popped.append((queue.pop(), time.monotonic()))
+
+    consumer = threading.Thread(target=consume)
+    consumer.start()
+    time.sleep(0.05)
+    added = time.monotonic()
+    queue.appendleft('hello')
+    consumer.join(1)
+    assert popped[0][0] == 'hello'
+    assert popped[0][1] - added < 0.05
+
+
+def test_stats():
+    queue = WaitableDeque()
+    queue.appendleft('a')
+    queue.appendleft('b')
+    time.sleep(0.01)
+    queue.pop()
+    stats = queue.stats()
+    assert stats['depth'] == 1
+    assert stats['max_depth'] == 2
+    assert stats['added'] == 2
+    assert stats['removed'] == 1
+    assert stats['max_wait_ms'] >= 10
+
+
+def test_priority_queue_sends_moderation_then_replies_then_announcements():
+    queue = PriorityMessageQueue()
+    queue.appendleft(OutboundMessage('auto quote', Priority.ANNOUNCEMENT))
+    queue.appendleft(OutboundMessage('the winner is', Priority.REPLY, user='mod'))
+    queue.appendleft(OutboundMessage('/timeout spammer 60', Priority.REPLY))
+    assert queue[0] == '/timeout spammer 60'
+    assert [queue.pop() for _ in range(3)] == ['/timeout spammer 60', 'the winner is', 'auto quote']
+
+
+def test_priority_queue_takes_turns_between_users():
+    queue = PriorityMessageQueue()
+    for index in range(3):
+        queue.appendleft(OutboundMessage(f'spam {index}', user='spammer'))
+    queue.appendleft(OutboundMessage('hello', user='someone'))
+    assert [queue.pop() for _ in range(4)] == ['spam 0', 'hello', 'spam 1', 'spam 2']
+
+
+def test_priority_queue_drops_stale_messages():
+    queue = PriorityMessageQueue(expiry={Priority.ANNOUNCEMENT: 0.01})
+    queue.appendleft(OutboundMessage('old news', Priority.ANNOUNCEMENT))
+    queue.appendleft('a plain reply')
+    time.sleep(0.02)
+    assert queue.wait(timeout=0)
+    assert queue.pop() == 'a plain reply'
+    assert queue.wait(timeout=0) is False
+    assert queue.stats()['expired'] == {'ANNOUNCEMENT': 1}
+
+
+def test_priority_queue_forgets_users_it_served_long_ago():
+    queue = PriorityMessageQueue(expiry={Priority.REPLY: 0.01, Priority.ANNOUNCEMENT: 0.01})
+    for index in range(50):
+        queue.appendleft(OutboundMessage('hi', user=f'viewer{index}'))
+        queue.pop()
+    assert len(queue.last_served) == 50
+    time.sleep(0.02)
+    queue.appendleft(OutboundMessage('hello', user='latecomer'))
+    queue.pop()
+    assert list(queue.last_served) == ['latecomer']
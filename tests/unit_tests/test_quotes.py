@@ -2,10 +2,13 @@ from enum import Enum, auto
 from inspect import getsourcefile
 import os
 import sys
+import threading
 from unittest.mock import Mock
 
 import pytest
+import sqlalchemy
 from collections import deque
+from sqlalchemy.orm import sessionmaker
 
 current_path = os.path.abspath(getsourcefile(lambda: 0))
 current_dir = os.path.dirname(current_path)
@@ -13,6 +16,8 @@ root_dir = os.path.join(current_dir, os.pardir, os.pardir)
 sys.path.append(root_dir)
 
 import src.core_modules.quotes as quotes
+import src.models as models
+import src.utils as utils
 from src.message import Message
 from src.models import Quote
 
@@ -129,3 +134,83 @@ def test_quote_delete_success(quote_mixin_obj, mock_db_session):
     mock_db_session.delete.assert_called()
     assert quote_mixin_obj.public_message_queue[0].startswith('Quote deleted')
     assert len(quote_mixin_obj.command_queue) == 1
+
+
+class QuoteWorksheet:
+    def __init__(self, column):
+        self.column = column
+        self.requests = 0
+
+    def col_values(self, col):
+        self.requests += 1
+        return self.column
+
+
+class Sheets:
+    def __init__(self, worksheet):
+        self.worksheet_obj = worksheet
+
+    def worksheet(self, spreadsheet_name, title):
+        return self.worksheet_obj
+
+    def invalidate(self, spreadsheet_name=None):
+        pass
+
+
+def test_import_quotes_from_spreadsheet(monkeypatch):
+    monkeypatch.setattr(quotes, 'QUOTE_IMPORT_BATCH_SIZE', 2)
+    engine = sqlalchemy.create_engine('sqlite://')
+    models.Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    db_session = Session()
+    db_session.add(Quote(quote='an old quote'))
+    db_session.commit()
+
+    worksheet = QuoteWorksheet(['Quote', 'one', 'two', 'three', '', 'after the gap'])
+    quote_mixin_obj = quotes.QuotesMixin.__new__(quotes.QuotesMixin)
+    quote_mixin_obj.public_message_queue = deque()
+    quote_mixin_obj.command_queue = deque()
+    quote_mixin_obj.spreadsheets = {'quotes': ('channel-bot-quotes', 'link')}
+    quote_mixin_obj.sheets = Sheets(worksheet)
+    quote_mixin_obj.Session = Session
+    quote_mixin_obj.spreadsheet_locks = {}
+    quote_mixin_obj.sheets_ready = threading.Event()
+    quote_mixin_obj.sheets_ready.set()
+
+    quote_mixin_obj._import_quotes_from_spreadsheet()
+    assert worksheet.requests == 1
+    assert [quote.quote for quote in db_session.query(Quote).all()] == ['one', 'two', 'three']
+    assert quote_mixin_obj.public_message_queue[0] == 'Imported 3 quotes from the spreadsheet.'
+    assert quote_mixin_obj.command_queue[0] == ('update_quote_spreadsheet', {})
+
+
+def test_sheet_commands_wait_for_startup():
+    quote_mixin_obj = quotes.QuotesMixin.__new__(quotes.QuotesMixin)
+    quote_mixin_obj.public_message_queue = deque()
+    quote_mixin_obj.command_queue = deque()
+    quote_mixin_obj.sheets_ready = threading.Event()
+    quote_mixin_obj.startup_thread = None
+
+    quote_mixin_obj.show_quotes(message=Message(content="!show_quotes", message_type=MessageTypes.PUBLIC))
+    assert quote_mixin_obj.public_message_queue[0].startswith('Still warming up')
+
+    # Passed by position it's still a message from chat
+    quote_mixin_obj.show_quotes(Message(content="!show_quotes", message_type=MessageTypes.PUBLIC))
+    assert len(quote_mixin_obj.public_message_queue) == 2
+
+    # Not from chat, so it runs once the sheets are ready
+    quote_mixin_obj.update_quote_spreadsheet()
+    assert quote_mixin_obj.command_queue[0] == ('update_quote_spreadsheet', {})
+
+    # Queued with every argument, even ones passed by position
+    @utils.requires_sheets
+    def update_quote_cells(self, first_row, last_row=None):
+        pass
+
+    update_quote_cells(quote_mixin_obj, 2, last_row=5)
+    assert quote_mixin_obj.command_queue[0] == ('update_quote_cells', {'first_row': 2, 'last_row': 5})
+
+
+def test_quote_sheet_jobs_share_a_spreadsheet():
+    for func in ['_initialize_quotes_spreadsheet', 'update_quote_spreadsheet', '_import_quotes_from_spreadsheet']:
+        assert getattr(quotes.QuotesMixin, func)._spreadsheet == 'quotes'
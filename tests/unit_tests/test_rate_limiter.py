@@ -0,0 +1,96 @@
+from inspect import getsourcefile
+import os
+import sys
+import time
+
+current_path = os.path.abspath(getsourcefile(lambda: 0))
+current_dir = os.path.dirname(current_path)
+root_dir = os.path.join(current_dir, os.pardir, os.pardir)
+sys.path.append(root_dir)
+
+from src.rate_limiter import RateLimiter, TokenBucket
+
+
+def sends_in_window(limit, period, burst, seconds, share=1):
+    """
+    Sends as fast as the bucket allows for the given number of seconds
+    and returns the most sends that landed in any one period.
+    """
+    bucket = TokenBucket.for_window(limit, period, burst, share=share)
+    bucket.updated = 0
+    now = 0.0
+    sent = []
+    while now < seconds:
+        now += bucket.wait_time(now)
+        bucket.spend(now)
+        sent.append(now)
+    return max(len([t for t in sent if start <= t < start + period]) for start in sent)
+
+
+def test_bucket_never_breaks_the_window_limit():
+    assert sends_in_window(20, 30, 10, 300) <= 20
+    assert sends_in_window(100, 30, 50, 300) <= 100
+    assert sends_in_window(3, 1, 1, 10) <= 3
+
+
+def test_workers_split_the_account_limits():
+    for share in [2, 3, 4]:
+        assert sends_in_window(20, 30, 10, 300, share=share) * share <= 20
+        assert sends_in_window(100, 30, 50, 300, share=share) * share <= 100
+    assert RateLimiter(share=4).buckets['user'].capacity == 2.5
+
+
+def test_bucket_allows_a_burst_after_a_quiet_spell():
+    bucket = TokenBucket.for_window(20, 30, 10)
+    now = bucket.updated
+    for _ in range(10):
+        assert bucket.wait_time(now) == 0
+        bucket.spend(now)
+    assert bucket.wait_time(now) > 0
+
+
+def test_moderator_channels_skip_the_user_limit_and_interval():
+    limiter = RateLimiter()
+    limiter.set_moderator('modded', True)
+    now = limiter.buckets['user'].updated
+    for _ in range(10):
+        limiter.buckets['user'].spend(now)
+    assert limiter._chat_wait_time('modded', now) == 0
+    assert limiter._chat_wait_time('other', now) > 0
+
+
+def test_slow_mode_spaces_out_messages():
+    limiter = RateLimiter()
+    limiter.set_slow_mode('chan', 30)
+    limiter.acquire_chat('chan')
+    now = limiter.last_sent['chan']
+    assert 29 < limiter._chat_wait_time('chan', now) <= 30
+    limiter.set_slow_mode('chan', 0)
+    assert 0 < limiter._chat_wait_time('chan', now) <= 1
+
+
+def test_ratelimit_notice_pauses_the_channel_longer_each_time():
+    limiter = RateLimiter(min_ratelimit_pause=5)
+    assert limiter.handle_notice('chan', 'msg_ratelimit', 'too quickly') == 5
+    assert limiter.handle_notice('chan', 'msg_ratelimit', 'too quickly') == 10
+    assert limiter.handle_notice('other', 'msg_ratelimit', 'too quickly') == 5
+    assert limiter.ratelimit_notices == 3
+
+
+def test_slowmode_notice_pauses_for_the_time_given():
+    limiter = RateLimiter()
+    text = 'This room is in slow mode and you may send again in 12 seconds.'
+    assert limiter.handle_notice('chan', 'msg_slowmode', text) == 12
+    assert limiter.handle_notice('chan', 'msg_banned', 'You are banned') is None
+
+
+def test_next_chat_time_schedules_without_waiting():
+    limiter = RateLimiter()
+    started = time.monotonic()
+    send_times = []
+    now = started
+    for _ in range(3):
+        now = limiter.next_chat_time('channel', now)
+        send_times.append(now - started)
+    assert time.monotonic() - started < 0.5
+    assert [round(send_time, 3) for send_time in send_times] == [0.0, 1.0, 2.0]
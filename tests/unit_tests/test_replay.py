@@ -0,0 +1,115 @@
+from inspect import getsourcefile
+import logging
+import os
+import sys
+import time
+
+import pytest
+
+current_path = os.path.abspath(getsourcefile(lambda: 0))
+current_dir = os.path.dirname(current_path)
+root_dir = os.path.join(current_dir, os.pardir, os.pardir)
+sys.path.append(root_dir)
+
+from src.replay import RecordingService, percentile, read_capture, replay
+
+
+class EchoBot:
+    def __init__(self, service):
+        self.service = service
+        self.public_message_queue = []
+        self.private_message_queue = []
+
+    def _act_on(self, message):
+        self.service.send_public_message(message.content)
+
+
+@pytest.fixture
+def capture_path(tmpdir):
+    path = tmpdir.join('capture.txt')
+    path.write('1000 PING :tmi.twitch.tv\n'
+               '1100 @display-name=Al;user-id=5 :al!al@al.tmi.twitch.tv PRIVMSG #first :!hi\n'
+               '1200 @display-name=Bo;user-id=6 :bo!bo@bo.tmi.twitch.tv PRIVMSG #second :!quote\n')
+    return str(path)
+
+
+def test_read_capture(capture_path):
+    rows = list(read_capture(capture_path))
+    assert rows[0] == (1.0, 'PING :tmi.twitch.tv')
+    assert len(rows) == 3
+
+
+def test_percentile():
+    assert percentile([], 0.5) == 0.0
+    assert percentile([3, 1, 2], 0.5) == 2
+    assert percentile(list(range(101)), 0.99) == 99
+
+
+def test_replay_routes_to_channel_bots(capture_path):
+    logger = logging.getLogger('replay_test')
+    service = RecordingService(user='bot', channel='first', error_logger=logger, event_logger=logger,
+                               extra_channels=['second'])
+    bots = {channel: EchoBot(service.get_channel(channel)) for channel in ['first', 'second']}
+    report = replay(capture_path, service, bots)
+    assert report['lines'] == 3
+    assert report['chat_messages'] == 2
+    assert [(channel, content) for _, channel, _, content in service.sent] == [('first', '!hi'), ('second', '!quote')]
+
+
+def test_backlog_counts_what_the_rate_limits_hold_back(tmpdir):
+    path = tmpdir.join('busy.txt')
+    path.write(''.join(f'{1000 + index} @display-name=Al;user-id=5 :al!al@al.tmi.twitch.tv PRIVMSG #first :hi {index}\n'
+                       for index in range(15)))
+    logger = logging.getLogger('replay_test')
+    service = RecordingService(user='bot', channel='first', error_logger=logger, event_logger=logger)
+    report = replay(str(path), service, {'first': EchoBot(service.get_channel('first'))})
+    # The bot isn't a moderator in #first, so only one message a second goes out
+    assert report['sent'] == 15
+    assert report['final_backlog'] >= 13
+    assert report['catch_up_seconds'] > 10
+
+
+def test_replayed_bots_never_touch_google(tmpdir, monkeypatch):
+    import src.google_auth as google_auth
+    from src.bot import bot_class
+    from src.message import Message
+    from src.replay import OfflineCredentials, OfflineSheetsClient, OfflineShortener
+    from src.twitch_service import MessageTypes
+
+    def no_google(*args, **kwargs):
+        raise AssertionError('a replay tried to reach google')
+
+    monkeypatch.setattr(google_auth, 'get_credentials', no_google)
+    monkeypatch.setattr(google_auth, 'build_drive_service', no_google)
+    logger = logging.getLogger('replay_test')
+    service = RecordingService(user='bot', channel='first', error_logger=logger, event_logger=logger)
+    bot = bot_class(['quotes'])(service=service.get_channel('first'), bot_info={'channel': 'first', 'user': 'bot'},
+                                bitly_access_token='', current_dir=str(tmpdir), data_dir=str(tmpdir),
+                                credentials=OfflineCredentials(), sheets_client=OfflineSheetsClient(),
+                                shortener=OfflineShortener(), sheets_enabled=False, command_debounce=0)
+    bot.startup_thread.join(5)
+    assert not bot.startup_thread.is_alive() and not bot.sheets_ready.is_set()
+    bot._act_on(Message(message_type=MessageTypes.PUBLIC, display_name='Al', content='!show_quotes', is_mod=True))
+    deadline = time.time() + 5
+    while time.time() < deadline and not any('turned off' in content for _, _, _, content in service.sent):
+        time.sleep(0.01)
+    assert any('turned off' in content for _, _, _, content in service.sent)
+
+
+def test_missing_google_libraries_turn_the_sheets_off(tmpdir, monkeypatch):
+    import src.google_auth as google_auth
+    from src.bot import bot_class
+    from src.replay import OfflineShortener
+
+    def no_library(*args, **kwargs):
+        raise ImportError("No module named 'apiclient'")
+
+    monkeypatch.setattr(google_auth, 'get_credentials', no_library)
+    logger = logging.getLogger('replay_test')
+    service = RecordingService(user='bot', channel='first', error_logger=logger, event_logger=logger)
+    bot = bot_class(['quotes'])(service=service.get_channel('first'), bot_info={'channel': 'first', 'user': 'bot'},
+                                bitly_access_token='', current_dir=str(tmpdir), data_dir=str(tmpdir),
+                                shortener=OfflineShortener(), command_debounce=0)
+    bot.startup_thread.join(5)
+    assert not bot.startup_thread.is_alive()
+    assert not bot.sheets_enabled and not bot.sheets_ready.is_set()
@@ -0,0 +1,52 @@
+from inspect import getsourcefile
+import os
+import sys
+
+current_path = os.path.abspath(getsourcefile(lambda: 0))
+current_dir = os.path.dirname(current_path)
+root_dir = os.path.join(current_dir, os.pardir, os.pardir)
+sys.path.append(root_dir)
+
+from src.sharding import plan_shards, shard_load, Supervisor, Worker
+
+
+def test_plan_shards_spreads_load():
+    rates = {'big': 10.0, 'medium': 6.0, 'small1': 2.0, 'small2': 2.0, 'quiet': 0.0}
+    shards = plan_shards(rates, 2)
+    assert sorted(channel for shard in shards for channel in shard) == sorted(rates)
+    assert sorted(shard_load(shard, rates) for shard in shards) == [10.0, 10.0]
+
+
+def test_plan_shards_spreads_idle_channels_by_count():
+    shards = plan_shards({'a': 0.0, 'b': 0.0, 'c': 0.0, 'd': 0.0}, 2)
+    assert [len(shard) for shard in shards] == [2, 2]
+
+
+def test_rebalance_moves_channels_when_worth_it():
+    supervisor = Supervisor(['a', 'b', 'c', 'd'], worker_count=2)
+    supervisor._start_worker = lambda worker: None
+    supervisor._stop_worker = lambda worker: None
+    supervisor.workers = [Worker(0, ['a', 'b']), Worker(1, ['c', 'd'])]
+    supervisor.channel_rates = {'a': 10.0, 'b': 9.0, 'c': 1.0, 'd': 0.0}
+    supervisor.rebalance()
+    loads = sorted(shard_load(worker.channels, supervisor.channel_rates) for worker in supervisor.workers)
+    assert loads == [10.0, 10.0]
+
+
+def test_rebalance_leaves_even_workers_alone():
+    supervisor = Supervisor(['a', 'b', 'c', 'd'], worker_count=2)
+    restarted = []
+    supervisor._start_worker = lambda worker: restarted.append(worker.index)
+    supervisor._stop_worker = lambda worker: None
+    supervisor.workers = [Worker(0, ['a', 'd']), Worker(1, ['b', 'c'])]
+    supervisor.channel_rates = {'a': 5.0, 'b': 4.0, 'c': 1.0, 'd': 0.5}
+    supervisor.rebalance()
+    assert restarted == []
+
+
+def test_workers_split_the_rate_limits():
+    supervisor = Supervisor(['a', 'b', 'c'], worker_count=3)
+    started = []
+    supervisor._start_worker = lambda worker: started.append(supervisor.rate_limit_share)
+    supervisor.start()
+    assert started == [3, 3, 3]
@@ -0,0 +1,189 @@
+from inspect import getsourcefile
+import os
+import sys
+
+import pytest
+import sqlalchemy
+from sqlalchemy.orm import sessionmaker
+
+current_path = os.path.abspath(getsourcefile(lambda: 0))
+current_dir = os.path.dirname(current_path)
+root_dir = os.path.join(current_dir, os.pardir, os.pardir)
+sys.path.append(root_dir)
+
+import src.models as models
+import src.sheet_sync as sheet_sync
+from src.sheet_sync import SheetSync, cell_label, column_number, diff_rows, forget_sheet, row_hash, row_runs
+
+
+def a1_to_rowcol(label):
+    letters = label.rstrip('0123456789')
+    return int(label[len(letters):]), column_number(letters)
+
+
+class FakeCell(object):
+    def __init__(self, row, col, value):
+        self.row = row
+        self.col = col
+        self.value = value
+
+
+class FakeWorksheet(object):
+    """
+    Keeps cells in a dict and counts the requests gspread would make.
+    """
+    def __init__(self):
+        self.values = {}
+        self.range_requests = []
+        self.updates = []
+
+    def range(self, name):
+        self.range_requests.append(name)
+        first, last = name.split(':')
+        first_row, first_col = a1_to_rowcol(first)
+        last_row, last_col = a1_to_rowcol(last)
+        return [FakeCell(row, col, self.values.get((row, col), ''))
+                for row in range(first_row, last_row + 1) for col in range(first_col, last_col + 1)]
+
+    def update_cells(self, cells):
+        self.updates.append(len(cells))
+        for cell in cells:
+            self.values[(cell.row, cell.col)] = str(cell.value)
+
+
+@pytest.fixture
+def db_session():
+    engine = sqlalchemy.create_engine('sqlite://')
+    models.Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+
+def push(worksheet, db_session, rows, first_col='A'):
+    sync = SheetSync(worksheet, db_session, 'sheet/Quotes')
+    sync.add_table(first_col, 2, rows)
+    return sync.push()
+
+
+def test_diff_rows_only_reports_changes():
+    rows = [[1, 'a'], [2, 'b'], [3, 'c']]
+    old_hashes = {2: row_hash([1, 'a']), 3: row_hash([2, 'x']), 4: row_hash([3, 'c']), 5: row_hash([4, 'd'])}
+    changes, new_hashes = diff_rows(old_hashes, rows, 2)
+    assert changes == {3: [2, 'b'], 5: ['', '']}
+    assert sorted(new_hashes) == [2, 3, 4]
+
+
+def test_cell_labels():
+    assert [column_number(letters) for letters in ('A', 'L', 'Z', 'AA', 'AZ')] == [1, 12, 26, 27, 52]
+    assert cell_label(2, 28) == 'AB2'
+    assert cell_label(13, 2) == 'B13'
+
+
+def test_row_runs_merge_small_gaps():
+    assert row_runs([]) == []
+    assert row_runs([9, 2, 3, 5], max_gap=1) == [(2, 5), (9, 9)]
+    assert row_runs([2, 20], max_gap=5) == [(2, 2), (20, 20)]
+
+
+def test_first_push_writes_everything_and_blanks_leftovers(db_session):
+    worksheet = FakeWorksheet()
+    worksheet.values[(5, 2)] = 'old quote'
+    stats = push(worksheet, db_session, [[1, 'a'], [2, 'b']])
+    assert worksheet.range_requests == ['A2:B13']
+    assert worksheet.updates == [24]
+    assert worksheet.values[(2, 2)] == 'a'
+    assert worksheet.values[(5, 2)] == ''
+    assert stats['changed_rows'] == 12
+
+
+def test_second_push_sends_only_changed_rows(db_session):
+    worksheet = FakeWorksheet()
+    rows = [[index + 1, f'quote {index}'] for index in range(50)]
+    push(worksheet, db_session, rows)
+
+    worksheet.range_requests, worksheet.updates = [], []
+    assert push(worksheet, db_session, rows)['cells'] == 0
+    assert worksheet.range_requests == [] and worksheet.updates == []
+
+    rows[10][1] = 'edited'
+    rows[40][1] = 'also edited'
+    stats = push(worksheet, db_session, rows)
+    assert worksheet.range_requests == ['A12:B42']
+    assert worksheet.updates == [4]
+    assert stats == {'changed_rows': 2, 'cells': 4, 'ranges': 1}
+    assert worksheet.values[(12, 2)] == 'edited'
+
+
+def test_far_apart_changes_are_fetched_separately(db_session, monkeypatch):
+    monkeypatch.setattr(sheet_sync, 'SPANNING_RANGE_CELLS', 10)
+    worksheet = FakeWorksheet()
+    rows = [[index + 1, f'quote {index}'] for index in range(50)]
+    push(worksheet, db_session, rows)
+    worksheet.range_requests = []
+    rows[10][1] = 'edited'
+    rows[40][1] = 'also edited'
+    push(worksheet, db_session, rows)
+    assert worksheet.range_requests == ['A12:B12', 'A42:B42']
+
+
+def test_layout_goes_out_in_one_update(db_session):
+    worksheet = FakeWorksheet()
+    sync = SheetSync(worksheet, db_session, 'sheet/Commands')
+    sync.add_row('A', ['Commands', 'Description'])
+    sync.add_row('D', ['Mod Commands', 'Description'])
+    sync.add_table('A', 2, [['!quote', 'Says a quote']])
+    sync.add_table('D', 2, [['!add_quote', 'Adds a quote']])
+    sync.push()
+    assert worksheet.range_requests == ['A1:E12']
+    assert len(worksheet.updates) == 1
+    assert worksheet.values[(1, 4)] == 'Mod Commands' and worksheet.values[(2, 5)] == 'Adds a quote'
+    assert (1, 3) not in worksheet.values
+
+    worksheet.range_requests = []
+    sync.push()
+    assert worksheet.range_requests == []
+
+
+def test_shrinking_table_blanks_removed_rows(db_session):
+    worksheet = FakeWorksheet()
+    push(worksheet, db_session, [[1, 'a'], [2, 'b'], [3, 'c']])
+    push(worksheet, db_session, [[1, 'a']])
+    assert worksheet.values[(3, 1)] == '' and worksheet.values[(4, 2)] == ''
+    assert db_session.query(models.SheetRow).count() == 1
+
+
+def test_forget_sheet_makes_the_next_push_write_everything(db_session):
+    worksheet = FakeWorksheet()
+    push(worksheet, db_session, [[1, 'a']])
+    forget_sheet(db_session, 'sheet/Quotes')
+    db_session.commit()
+    worksheet.updates = []
+    push(worksheet, db_session, [[1, 'a']])
+    assert worksheet.updates == [22]
+
+
+def test_forget_sheet_leaves_similarly_named_sheets_alone(db_session):
+    worksheet = FakeWorksheet()
+    for sheet_key in ['chan_quotes/Quotes', 'chanXquotes/Quotes', 'chan%quotes/Quotes']:
+        sync = SheetSync(worksheet, db_session, sheet_key)
+        sync.add_table('A', 2, [[1, 'a']])
+        sync.push()
+    forget_sheet(db_session, 'chan_quotes/Quotes')
+    db_session.commit()
+    assert sorted(row.table_key for row in db_session.query(models.SheetRow).all()) == ['chan%quotes/Quotes!A2',
+                                                                                      'chanXquotes/Quotes!A2']
+
+
+def test_an_emptied_table_is_only_blanked_once(db_session):
+    worksheet = FakeWorksheet()
+    push(worksheet, db_session, [[1, 'a'], [2, 'b']])
+    push(worksheet, db_session, [])
+    assert worksheet.values[(2, 1)] == '' and worksheet.values[(3, 2)] == ''
+    worksheet.updates = []
+    worksheet.range_requests = []
+    assert push(worksheet, db_session, [])['changed_rows'] == 0
+    assert worksheet.updates == [] and worksheet.range_requests == []
+    push(worksheet, db_session, [[3, 'c']])
+    assert worksheet.values[(2, 1)] == '3'
+    assert [row.row for row in db_session.query(models.SheetRow).all()] == [2]
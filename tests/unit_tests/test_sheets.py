@@ -0,0 +1,153 @@
+from inspect import getsourcefile
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+current_path = os.path.abspath(getsourcefile(lambda: 0))
+current_dir = os.path.dirname(current_path)
+root_dir = os.path.join(current_dir, os.pardir, os.pardir)
+sys.path.append(root_dir)
+
+from src.sheets import SheetsClient
+
+
+class FakeCredentials(object):
+    def __init__(self):
+        self.access_token = 'token'
+        self.access_token_expired = False
+
+
+class FakeSession(object):
+    """
+    Remembers the most requests that were ever being sent at once, on it and on overall if it's given one.
+    """
+    def __init__(self, overall=None):
+        self.overall = overall
+        self.sending = 0
+        self.most_sending = 0
+        self.lock = threading.Lock()
+
+    def _change(self, by):
+        with self.lock:
+            self.sending += by
+            self.most_sending = max(self.most_sending, self.sending)
+
+    def request(self, method, url):
+        for session in [self, self.overall]:
+            if session is not None:
+                session._change(1)
+        time.sleep(0.001)
+        for session in [self, self.overall]:
+            if session is not None:
+                session._change(-1)
+
+
+class FakeWorksheet(object):
+    def __init__(self, session):
+        self.session = session
+
+    def update_cells(self, cells):
+        for cell in cells:
+            self.session.request('PUT', cell)
+
+
+class FakeSpreadsheet(object):
+    def __init__(self, name, session):
+        self.name = name
+        self.session = session
+
+    def worksheet(self, title):
+        if title == 'Cells':
+            return FakeWorksheet(self.session)
+        return (self.name, title)
+
+
+class FakeClient(object):
+    def __init__(self, opened, overall):
+        self.logins = 0
+        self.opened = opened
+        self.session = FakeSession(overall)
+
+    def login(self):
+        self.logins += 1
+
+    def open(self, name):
+        self.opened.append(name)
+        return FakeSpreadsheet(name, self.session)
+
+
+class FakeClients(object):
+    """
+    Makes a FakeClient for each spreadsheet, they all note what they open in one list.
+    """
+    def __init__(self):
+        self.opened = []
+        self.overall = FakeSession()
+        self.clients = []
+
+    def new_client(self):
+        self.clients.append(FakeClient(self.opened, self.overall))
+        return self.clients[-1]
+
+
+@pytest.fixture
+def client(monkeypatch):
+    fake_clients = FakeClients()
+    monkeypatch.setattr(SheetsClient, '_new_client', lambda self: fake_clients.new_client())
+    return SheetsClient(FakeCredentials()), fake_clients
+
+
+def test_handles_are_cached(client):
+    sheets_client, fake_clients = client
+    assert sheets_client.worksheet('quotes', 'Quotes') == ('quotes', 'Quotes')
+    assert sheets_client.worksheet('quotes', 'Quotes') == ('quotes', 'Quotes')
+    sheets_client.worksheet('commands', 'Commands')
+    assert fake_clients.opened == ['quotes', 'commands']
+    assert [fake_client.logins for fake_client in fake_clients.clients] == [1, 1]
+    assert sheets_client.stats()['worksheets'] == 2
+
+
+def test_logs_in_again_only_when_token_changes(client):
+    sheets_client, fake_clients = client
+    sheets_client.worksheet('quotes', 'Quotes')
+    sheets_client.worksheet('commands', 'Commands')
+    sheets_client.credentials.access_token_expired = True
+    sheets_client.worksheet('quotes', 'Quotes')
+    sheets_client.credentials.access_token_expired = False
+    # Logging in for quotes got a new token, so commands' session needs it too
+    sheets_client.credentials.access_token = 'new token'
+    sheets_client.worksheet('commands', 'Commands')
+    sheets_client.worksheet('commands', 'Commands')
+    assert [fake_client.logins for fake_client in fake_clients.clients] == [2, 2]
+    assert fake_clients.opened == ['quotes', 'commands']
+
+
+def test_invalidate_forgets_one_spreadsheet(client):
+    sheets_client, fake_clients = client
+    sheets_client.worksheet('quotes', 'Quotes')
+    sheets_client.worksheet('commands', 'Commands')
+    sheets_client.invalidate('quotes')
+    sheets_client.worksheet('quotes', 'Quotes')
+    sheets_client.worksheet('commands', 'Commands')
+    assert fake_clients.opened == ['quotes', 'commands', 'quotes']
+
+
+def test_requests_take_turns_for_each_spreadsheet(client):
+    sheets_client, fake_clients = client
+
+    def update(name):
+        sheets_client.worksheet(name, 'Cells').update_cells(range(20))
+
+    workers = [threading.Thread(target=update, args=(name,)) for name in ['quotes', 'commands', 'auto_quotes', 'quotes']]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert len(fake_clients.clients) == 3
+    assert all(fake_client.session.most_sending == 1 for fake_client in fake_clients.clients)
+    # Different spreadsheets don't wait for each other
+    assert fake_clients.overall.most_sending > 1
+    assert sheets_client.stats()['requests'] == 80
@@ -0,0 +1,144 @@
+from inspect import getsourcefile
+import os
+import sys
+import threading
+import time
+
+current_path = os.path.abspath(getsourcefile(lambda: 0))
+current_dir = os.path.dirname(current_path)
+root_dir = os.path.join(current_dir, os.pardir, os.pardir)
+sys.path.append(root_dir)
+
+from src.worker_pool import KeyedWorkerPool, command_key
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_a_burst_of_the_same_job_runs_once_more():
+    runs = []
+    pool = KeyedWorkerPool(lambda item: runs.append(time.monotonic()), max_workers=2, debounce=0.05)
+    pool.appendleft(('update_quote_spreadsheet', {}))
+    assert wait_for(lambda: pool.stats()['completed'] == 1)
+    burst_started = time.monotonic()
+    for index in range(9):
+        pool.appendleft(('update_quote_spreadsheet', {}))
+    assert wait_for(lambda: pool.stats()['completed'] == 2)
+    time.sleep(0.1)
+    assert len(runs) == 2 and runs[1] - burst_started >= 0.05
+    assert pool.stats()['collapsed'] == 8
+
+
+def test_a_one_off_job_starts_straight_away():
+    pool = KeyedWorkerPool(lambda item: None, max_workers=1, debounce=5)
+    pool.appendleft(('update_quote_db_from_spreadsheet', {}))
+    assert wait_for(lambda: pool.stats()['completed'] == 1, timeout=1)
+
+
+def test_a_stuck_job_does_not_hold_up_other_keys():
+    release = threading.Event()
+    runs = []
+
+    def handler(item):
+        if item == 'stuck':
+            release.wait(5)
+        runs.append(item)
+
+    pool = KeyedWorkerPool(handler, max_workers=2)
+    pool.submit('sheet a', 'stuck')
+    pool.submit('sheet b', 'quick')
+    assert wait_for(lambda: runs == ['quick'])
+    release.set()
+    assert wait_for(lambda: runs == ['quick', 'stuck'])
+
+
+def test_jobs_with_the_same_key_never_overlap():
+    active = []
+    overlapped = []
+
+    def handler(item):
+        active.append(item)
+        if len(active) > 1:
+            overlapped.append(item)
+        time.sleep(0.05)
+        active.remove(item)
+
+    pool = KeyedWorkerPool(handler, max_workers=4)
+    pool.submit('sheet', 1)
+    time.sleep(0.01)
+    pool.submit('sheet', 2)
+    pool.submit('sheet', 3)
+    assert wait_for(lambda: pool.stats()['completed'] == 2)
+    assert overlapped == []
+
+
+def test_failures_are_counted_and_the_pool_keeps_going():
+    def handler(item):
+        if item == 'bad':
+            raise ValueError('bad job')
+
+    pool = KeyedWorkerPool(handler, max_workers=1)
+    pool.submit('a', 'bad')
+    pool.submit('b', 'good')
+    assert wait_for(lambda: pool.stats()['completed'] == 1 and pool.stats()['failed'] == 1)
+
+
+def test_command_key_includes_arguments():
+    assert command_key(('update', {})) == command_key(('update', {}))
+    assert command_key(('update', {'sheet': 'a'})) != command_key(('update', {'sheet': 'b'}))
+
+
+def test_jobs_for_the_same_spreadsheet_run_one_after_another():
+    quote_jobs_running = []
+    overlapped = []
+    runs = []
+    sheets = {'_import_quotes_from_spreadsheet': 'quotes', 'update_quote_spreadsheet': 'quotes'}
+
+    def handler(command_tuple):
+        func = command_tuple[0]
+        if func in sheets:
+            quote_jobs_running.append(func)
+            if len(quote_jobs_running) > 1:
+                overlapped.append(func)
+        time.sleep(0.05)
+        if func in sheets:
+            quote_jobs_running.remove(func)
+        runs.append(func)
+
+    pool = KeyedWorkerPool(handler, max_workers=4, group=lambda command_tuple: sheets.get(command_tuple[0]))
+    pool.appendleft(('_import_quotes_from_spreadsheet', {}))
+    pool.appendleft(('update_quote_spreadsheet', {}))
+    pool.appendleft(('update_command_spreadsheet', {}))
+    assert wait_for(lambda: pool.stats()['completed'] == 3)
+    assert overlapped == []
+    assert runs.index('_import_quotes_from_spreadsheet') < runs.index('update_quote_spreadsheet')
+    assert pool.stats()['collapsed'] == 0
+
+
+def test_a_resubmitted_job_keeps_its_place_in_its_group():
+    release = threading.Event()
+    runs = []
+
+    def handler(command_tuple):
+        if command_tuple[0] == 'blocker':
+            release.wait(5)
+        runs.append(command_tuple[0])
+
+    sheets = {'_initialize_commands_spreadsheet': 'commands', 'update_command_spreadsheet': 'commands'}
+    pool = KeyedWorkerPool(handler, max_workers=1, debounce=0.05, group=lambda command_tuple: sheets.get(command_tuple[0]))
+    pool.appendleft(('blocker', {}))
+    assert wait_for(lambda: pool.stats()['running'] == 1)
+    pool.appendleft(('_initialize_commands_spreadsheet', {}))
+    pool.appendleft(('update_command_spreadsheet', {}))
+    time.sleep(0.03)
+    # Now due after update_command_spreadsheet, but it was asked for first
+    pool.appendleft(('_initialize_commands_spreadsheet', {}))
+    release.set()
+    assert wait_for(lambda: pool.stats()['completed'] == 3)
+    assert runs == ['blocker', '_initialize_commands_spreadsheet', 'update_command_spreadsheet']